@@ -0,0 +1,286 @@
+# a2s_transport.py
+# Shared UDP transport for A2S queries (instead of one socket per a2s.info call):
+# - a small fixed set of non-blocking UDP sockets serves every request of a scan
+# - replies are demultiplexed by source address + response type (the A2S "tag" byte);
+#   several requests of the same type to one address complete in FIFO order
+# - S2C_CHALLENGE replies are answered internally by re-sending with the challenge; the number
+#   is remembered per server, so later A2S_PLAYER / A2S_RULES requests start with it
+# - payloads are built/parsed by python-a2s, so callers get the usual SourceInfo objects
+# - optional send_pacer.TokenBucket: sends wait for a token on the loop (call_later), and the
+#   time a request spent waiting is reported by request_timed()
+import io
+import socket
+import asyncio
+import ipaddress
+import concurrent.futures
+import threading
+import time
+from collections import deque
+
+from a2s.byteio import ByteReader
+from a2s.a2s_fragment import decode_fragment
+from a2s.defaults import DEFAULT_ENCODING, DEFAULT_RETRIES
+from a2s.exceptions import BrokenMessageError
+from a2s.info import InfoProtocol
+from a2s.players import PlayersProtocol
+from a2s.rules import RulesProtocol
+
+HEADER_SIMPLE = b"\xFF\xFF\xFF\xFF"
+HEADER_MULTI = b"\xFE\xFF\xFF\xFF"
+A2S_CHALLENGE_RESPONSE = 0x41
+FRAGMENT_TTL = 5.0       # seconds an incomplete multi-packet reply is kept (lost fragments never arrive)
+RCVBUF_BYTES = 4 << 20   # replies of a whole scan converge on few sockets; the kernel caps this (rmem_max)
+
+# response type byte -> request kind
+RESPONSE_KIND = {0x49: "info", 0x6D: "info", 0x44: "players", 0x45: "rules"}
+PROTOCOLS = {"info": InfoProtocol, "players": PlayersProtocol, "rules": RulesProtocol}
+# kinds that start with the server's last challenge (INFO keeps its plain first packet, so its
+# round-trip stays comparable between scans)
+REUSE_CHALLENGE = ("players", "rules")
+
+
+class _Request:
+    __slots__ = ("kind", "proto", "future", "challenge", "retries", "sent_at", "queued")
+
+    def __init__(self, kind, proto, future):
+        self.kind = kind
+        self.proto = proto
+        self.future = future
+        self.challenge = 0
+        self.retries = 0
+        self.sent_at = 0.0
+        self.queued = 0.0     # seconds spent waiting for the pacer, over all sends
+
+
+class _Endpoint(asyncio.DatagramProtocol):
+    def __init__(self, owner: "A2STransport"):
+        self.owner = owner
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, packet, addr):
+        self.owner._on_packet(self, packet, addr)
+
+    def error_received(self, exc):
+        # ICMP errors on an unconnected socket are not tied to one request; timeouts handle them
+        pass
+
+
+def _udp_socket() -> socket.socket:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setblocking(False)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_BYTES)
+    except OSError:
+        pass
+    s.bind(("0.0.0.0", 0))
+    if hasattr(socket, "SIO_UDP_CONNRESET"):
+        # Windows: otherwise one port-unreachable reply makes the next recv on the shared socket fail
+        s.ioctl(socket.SIO_UDP_CONNRESET, False)
+    return s
+
+
+class A2STransport:
+    """Multiplexed A2S client bound to the running event loop (call open() from inside it)."""
+
+    def __init__(self, sockets: int = 1, encoding: str = DEFAULT_ENCODING, pacer=None):
+        self.n_sockets = max(1, sockets)
+        self.encoding = encoding
+        self.pacer = pacer
+        self._loop = None
+        self._endpoints: list[_Endpoint] = []
+        self._pending: dict[tuple[str, int], deque[_Request]] = {}
+        # addr -> message id -> (first seen, fragment count, {fragment id: payload})
+        self._fragments: dict[tuple[str, int], dict[int, tuple[float, int, dict[int, bytes]]]] = {}
+        self._challenges: dict[tuple[str, int], int] = {}
+        self.sent = 0
+        self.received = 0
+
+    async def open(self):
+        loop = self._loop = asyncio.get_running_loop()
+        for _ in range(self.n_sockets):
+            _t, ep = await loop.create_datagram_endpoint(lambda: _Endpoint(self), sock=_udp_socket())
+            self._endpoints.append(ep)
+        return self
+
+    def close(self):
+        for ep in self._endpoints:
+            if ep.transport is not None:
+                ep.transport.close()
+        self._endpoints = []
+        for q in self._pending.values():
+            for req in q:
+                if not req.future.done():
+                    req.future.cancel()
+        self._pending.clear()
+        self._fragments.clear()
+
+    # ---- requests ----
+    async def info(self, address: tuple[str, int], timeout: float):
+        return await self.request(address, "info", timeout)
+
+    async def request(self, address: tuple[str, int], kind: str, timeout: float):
+        return (await self.request_timed(address, kind, timeout))[0]
+
+    async def request_timed(self, address: tuple[str, int], kind: str, timeout: float):
+        """Like request(), but returns (response, seconds the sends waited for the pacer)."""
+        addr = await self._numeric(address)
+        loop = asyncio.get_running_loop()
+        req = _Request(kind, PROTOCOLS[kind], loop.create_future())
+        if kind in REUSE_CHALLENGE:
+            req.challenge = self._challenges.get(addr, 0)
+        q = self._pending.setdefault(addr, deque())
+        q.append(req)
+        try:
+            self._send(addr, req)
+            # the timeout covers the network, not the wait for a pacer slot; a challenge
+            # re-send may queue again later, so the deadline moves with req.queued
+            start = loop.time()
+            while True:
+                remaining = start + timeout + req.queued - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError("timed out")
+                try:
+                    return await asyncio.wait_for(asyncio.shield(req.future), remaining), req.queued
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            if not req.future.done():
+                req.future.cancel()
+            try:
+                q.remove(req)
+            except ValueError:
+                pass
+            if not q and self._pending.get(addr) is q:
+                del self._pending[addr]
+                self._fragments.pop(addr, None)   # nobody is left to complete them
+
+    def knows_challenge(self, address: tuple[str, int]) -> bool:
+        """True when a challenge from this (numeric) address is remembered."""
+        return (address[0], int(address[1])) in self._challenges
+
+    async def _numeric(self, address: tuple[str, int]) -> tuple[str, int]:
+        host, port = address
+        try:
+            ipaddress.IPv4Address(host)
+            return host, int(port)
+        except ValueError:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET,
+                                                                  type=socket.SOCK_DGRAM)
+            return infos[0][4][0], int(port)
+
+    def _endpoint_for(self, addr) -> _Endpoint:
+        if not self._endpoints:
+            raise RuntimeError("A2STransport is not open")
+        # one address always uses the same socket so challenges stay with their source port
+        return self._endpoints[hash(addr) % len(self._endpoints)]
+
+    def _send(self, addr, req: _Request):
+        delay = self.pacer.reserve("a2s") if self.pacer is not None else 0.0
+        if delay > 0:
+            req.queued += delay
+            self._loop.call_later(delay, self._send_now, addr, req)
+        else:
+            self._send_now(addr, req)
+
+    def _send_now(self, addr, req: _Request):
+        if req.future.done() or not self._endpoints:
+            return
+        req.sent_at = time.perf_counter()
+        self._endpoint_for(addr).transport.sendto(HEADER_SIMPLE + req.proto.serialize_request(req.challenge), addr)
+        self.sent += 1
+
+    # ---- replies ----
+    def _on_packet(self, ep: _Endpoint, packet: bytes, addr):
+        recv_at = time.perf_counter()
+        addr = (addr[0], addr[1])
+        header, payload = packet[:4], packet[4:]
+        if header == HEADER_MULTI:
+            if addr not in self._pending:
+                return   # late fragment of a request that already ended
+            payload = self._reassemble(addr, payload, recv_at)
+            if payload is None:
+                return
+        elif header != HEADER_SIMPLE:
+            return
+        if not payload:
+            return
+        self.received += 1
+        q = self._pending.get(addr)
+        if not q:
+            return
+
+        rtype = payload[0]
+        if rtype == A2S_CHALLENGE_RESPONSE:
+            req = next((r for r in q if not r.future.done() and r.retries == 0), None) \
+                or next((r for r in q if not r.future.done()), None)
+            if req is None:
+                return
+            if req.retries >= DEFAULT_RETRIES:
+                req.future.set_exception(BrokenMessageError("Server keeps sending challenge responses"))
+                return
+            req.retries += 1
+            req.challenge = self._challenges[addr] = int.from_bytes(payload[1:5], "little")
+            self._send(addr, req)
+            return
+
+        kind = RESPONSE_KIND.get(rtype)
+        req = next((r for r in q if r.kind == kind and not r.future.done()), None)
+        if req is None:
+            return
+        try:
+            reader = ByteReader(io.BytesIO(payload), endian="<", encoding=self.encoding)
+            reader.read_uint8()
+            req.future.set_result(req.proto.deserialize_response(reader, rtype, recv_at - req.sent_at))
+        except Exception as e:
+            req.future.set_exception(e)
+
+    def _reassemble(self, addr, data: bytes, now: float) -> bytes | None:
+        """Store one fragment; returns the joined message once every fragment id is in."""
+        try:
+            frag = decode_fragment(data)
+        except Exception:
+            return None
+        msgs = self._fragments.setdefault(addr, {})
+        for mid in [mid for mid, (seen, _n, _p) in msgs.items() if now - seen > FRAGMENT_TTL]:
+            del msgs[mid]
+        _seen, count, parts = msgs.setdefault(frag.message_id, (now, frag.fragment_count, {}))
+        if not 0 <= frag.fragment_id < count:
+            return None
+        parts[frag.fragment_id] = frag.payload   # a retransmitted fragment replaces its copy
+        if len(parts) < count:
+            return None
+        del msgs[frag.message_id]
+        if not msgs:
+            del self._fragments[addr]
+        payload = b"".join(parts[i] for i in range(count))
+        return payload[4:] if payload.startswith(HEADER_SIMPLE) else payload
+
+
+class SyncA2SClient:
+    """Blocking façade for thread-pool callers: one A2STransport on a private loop thread."""
+
+    def __init__(self, sockets: int = 1, pacer=None):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="a2s-transport", daemon=True)
+        self._thread.start()
+        self.transport = A2STransport(sockets, pacer=pacer)
+        asyncio.run_coroutine_threadsafe(self.transport.open(), self.loop).result()
+
+    def info_timed(self, address: tuple[str, int], timeout: float, limit: float | None = None):
+        """request_timed() for INFO; `limit` caps the whole call (pacer wait included) in seconds."""
+        fut = asyncio.run_coroutine_threadsafe(self.transport.request_timed(address, "info", timeout), self.loop)
+        try:
+            return fut.result(limit)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            raise TimeoutError("timed out") from None
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.transport.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+        if not self._thread.is_alive():
+            self.loop.close()
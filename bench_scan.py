@@ -0,0 +1,444 @@
+# bench_scan.py
+# Offline benchmark for query_servers.py against a local fake A2S server farm (Linux: uses 127.x.y.z).
+# - farm: one UDP responder per fake server in a child process, with injected latency,
+#   jitter, loss and S2C_CHALLENGE handshakes; it also answers A2S_PLAYER / A2S_RULES
+#   (every 5th server ignores A2S_RULES) for the server_details tests
+# - scanner: runs in this process (threads / async / resident engine) with ICMP off, so the
+#   reported ping/jitter are A2S round-trips that can be checked against the injected values
+# - report: wall time, p50/p99 per-server completion, peak threads/FDs, CPU time, packets
+# - --discover: the farm also runs a stand-in master server listing every fake server plus some
+#   dead addresses; half the farm is in the list, every 4th server runs a non-ze map, and the
+#   resident scanner's discover_async() must find exactly the unlisted ze_ servers
+#
+# Examples:
+#   python bench_scan.py                                # 28 servers, async engine
+#   python bench_scan.py --servers 28,1000,10000 --engine resident --loss 0.02
+#   python bench_scan.py --servers 500 --engine threads --json
+#   python bench_scan.py --servers 2000 --discover
+import os
+import sys
+import json
+import time
+import random
+import struct
+import asyncio
+import argparse
+import tempfile
+import threading
+import multiprocessing as mp
+
+import master_query
+import query_servers
+
+BASE_PORT = 30000
+MASTER_ADDR = ("127.0.0.1", BASE_PORT - 1)
+MASTER_PAGE_SIZE = 231   # addresses per reply page, like the real master
+
+
+# -------------------- fake farm --------------------
+def farm_address(i: int, hosts: int) -> tuple[str, int]:
+    """Server i lives on host i % hosts; several servers share a host like the EXG machines."""
+    h = i % hosts
+    return f"127.1.{h // 250}.{h % 250 + 1}", BASE_PORT + i // hosts
+
+
+def _info_packet(i: int, players: int, map_name: str = "ze_fake_map") -> bytes:
+    return (b"\xFF\xFF\xFF\xFFI\x11"
+            + f"Fake ZE #{i}".encode() + b"\0"
+            + map_name.encode() + b"\0csgo\0Counter-Strike 2\0"
+            + struct.pack("<H", 730)
+            + bytes([players, 64, 0]) + b"dl\x00\x01" + b"1.0.0\0" + b"\x00")
+
+
+def _players_packet(i: int) -> bytes:
+    players = [(f"player{k}", 10 * k, 60.0 * (k + 1)) for k in range(i % 5 + 1)]
+    return (b"\xFF\xFF\xFF\xFFD" + bytes([len(players)])
+            + b"".join(bytes([k]) + name.encode() + b"\0" + struct.pack("<if", score, dur)
+                       for k, (name, score, dur) in enumerate(players)))
+
+
+def _rules_packet(map_name: str) -> bytes:
+    rules = {"mp_timelimit": "30", "sv_tags": "ze", "mapname": map_name}
+    return (b"\xFF\xFF\xFF\xFFE" + struct.pack("<H", len(rules))
+            + b"".join(k.encode() + b"\0" + v.encode() + b"\0" for k, v in rules.items()))
+
+
+class FakeA2SServer(asyncio.DatagramProtocol):
+    """A2S_INFO (challenge optional), A2S_PLAYER and A2S_RULES (always challenged); servers
+    without `rules` ignore A2S_RULES, like servers that turn rules queries off."""
+
+    def __init__(self, farm: "Farm", i: int, latency_ms: float, challenge: bool, map_name: str = "ze_fake_map",
+                 rules: bool = True):
+        self.farm = farm
+        self.i = i
+        self.latency_ms = latency_ms
+        self.challenge = challenge
+        self.map_name = map_name
+        self.rules = rules
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        farm = self.farm
+        farm.requests += 1
+        if farm.rng.random() < farm.loss:
+            farm.dropped += 1
+            return
+        kind, challenge = data[4:5], struct.pack("<I", 0x5EED0000 + self.i)
+        if kind == b"T":
+            if self.challenge and len(data) < 29:   # no challenge appended yet
+                reply = b"\xFF\xFF\xFF\xFFA" + challenge
+            else:
+                reply = _info_packet(self.i, self.i % 65, self.map_name)
+        elif kind == b"U" or (kind == b"V" and self.rules):
+            if data[5:9] != challenge:
+                reply = b"\xFF\xFF\xFF\xFFA" + challenge
+            else:
+                reply = _players_packet(self.i) if kind == b"U" else _rules_packet(self.map_name)
+        else:
+            return
+        delay = self.latency_ms + farm.rng.uniform(0, farm.jitter_ms)
+        farm.loop.call_later(delay / 1000.0, self._send, reply, addr)
+
+    def _send(self, reply, addr):
+        self.farm.replies += 1
+        self.transport.sendto(reply, addr)
+
+
+class FakeMaster(asyncio.DatagramProtocol):
+    """Stand-in master server: pages through `addrs` from the seed on, 0.0.0.0:0 after the last one."""
+
+    def __init__(self, farm: "Farm", addrs, delay_ms: float = 20.0):
+        self.farm = farm
+        self.addrs = list(addrs)
+        self.pos = {a: i for i, a in enumerate(self.addrs)}
+        self.delay_ms = delay_ms
+        self.transport = None
+        self.pages = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            _region, seed, _filter = master_query.decode_query(data)
+        except ValueError:
+            return
+        start = 0 if seed == master_query.FIRST_SEED else self.pos.get(seed, -1) + 1
+        page = self.addrs[start:start + MASTER_PAGE_SIZE]
+        if start + MASTER_PAGE_SIZE >= len(self.addrs):
+            page.append(master_query.FIRST_SEED)
+        self.pages += 1
+        self.farm.loop.call_later(self.delay_ms / 1000.0, self.transport.sendto, master_query.encode_reply(page), addr)
+
+
+class Farm:
+    def __init__(self, loop, loss, jitter_ms, seed):
+        self.loop = loop
+        self.loss = loss
+        self.jitter_ms = jitter_ms
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.replies = 0
+        self.dropped = 0
+
+
+def _raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _farm_main(conn, servers, hosts, latency_ms, spread_ms, jitter_ms, loss, challenge_ratio, seed,
+               discover=False):
+    _raise_fd_limit()
+    loop = asyncio.new_event_loop()
+    farm = Farm(loop, loss, jitter_ms, seed)
+    rng = random.Random(seed + 1)
+    profiles = []
+
+    async def start():
+        for i in range(servers):
+            addr = farm_address(i, hosts)
+            lat = latency_ms + rng.uniform(0, spread_ms)
+            chal = rng.random() < challenge_ratio
+            map_name = "de_fake_map" if discover and i % 4 == 3 else "ze_fake_map"
+            rules = i % 5 != 4
+            await loop.create_datagram_endpoint(
+                lambda i=i, lat=lat, chal=chal, m=map_name, r=rules: FakeA2SServer(farm, i, lat, chal, m, r),
+                local_addr=addr)
+            profiles.append({"ip": f"{addr[0]}:{addr[1]}", "latency_ms": lat, "challenge": chal, "map": map_name,
+                             "players": i % 5 + 1, "rules": rules})
+        if discover:
+            # the master also lists addresses nobody answers on (crashed / firewalled servers)
+            dead = [(f"127.2.{k // 250}.{k % 250 + 1}", BASE_PORT) for k in range(max(1, servers // 10))]
+            listed = [farm_address(i, hosts) for i in range(servers)] + dead
+            rng.shuffle(listed)
+            await loop.create_datagram_endpoint(lambda: FakeMaster(farm, listed), local_addr=MASTER_ADDR)
+
+    try:
+        loop.run_until_complete(start())
+    except OSError as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", profiles))
+    loop.add_reader(conn.fileno(), loop.stop)   # any message from the parent = stop
+    loop.run_forever()
+    conn.recv()
+    conn.send(("stats", {"requests": farm.requests, "replies": farm.replies, "dropped": farm.dropped}))
+
+
+class FarmProcess:
+    """The fake farm (with `discover`, plus its master) in a child process; tests use it too.
+
+    start() returns the per-server profiles, stop() the farm's packet counters;
+    `with FarmProcess(...) as farm:` does both (farm.profiles / farm.stats).
+    """
+
+    def __init__(self, servers, hosts=None, latency_ms=20.0, spread_ms=0.0, jitter_ms=0.0, loss=0.0,
+                 challenge=0.0, seed=1, discover=False):
+        self.args = (servers, hosts or servers, latency_ms, spread_ms, jitter_ms, loss, challenge, seed, discover)
+        self.profiles = []
+        self.stats = None
+        self._proc = self._conn = None
+
+    def start(self) -> list[dict]:
+        parent, child = mp.Pipe()
+        self._proc = mp.Process(target=_farm_main, args=(child,) + self.args, daemon=True)
+        self._proc.start()
+        kind, payload = parent.recv()
+        if kind != "ready":
+            self._proc.join()
+            raise RuntimeError(f"fake farm failed to start: {payload}")
+        self._conn, self.profiles = parent, payload
+        return self.profiles
+
+    def stop(self) -> dict:
+        self._conn.send("stop")
+        _kind, self.stats = self._conn.recv()
+        self._proc.join(timeout=5)
+        return self.stats
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# -------------------- resource monitor --------------------
+class Monitor:
+    """Samples thread and FD counts of this process until stopped."""
+
+    def __init__(self, period=0.01):
+        self.period = period
+        self.peak_threads = threading.active_count()
+        self.peak_fds = self._fds()
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _fds():
+        try:
+            return len(os.listdir("/proc/self/fd"))
+        except OSError:
+            return -1
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_fds = max(self.peak_fds, self._fds())
+
+    def __enter__(self):
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._t.join()
+
+
+# -------------------- one run --------------------
+def _pct(vals, p):
+    return query_servers._percentile(sorted(vals), p) if vals else None
+
+
+def run_once(args, servers: int) -> dict:
+    hosts = args.hosts or max(1, (servers + args.ports_per_host - 1) // args.ports_per_host)
+    farm = FarmProcess(servers, hosts, args.latency, args.spread, args.jitter, args.loss, args.challenge,
+                       args.seed, args.discover)
+    try:
+        profiles = farm.start()
+    except RuntimeError as e:
+        raise SystemExit(f"[ERROR] {e}")
+
+    if args.discover:
+        return _run_discovery(args, servers, hosts, profiles, farm)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        list_path = os.path.join(tmp, "server_list.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for p in profiles:
+                f.write(f"{p['ip']} | bench\n")
+        entries = query_servers.read_server_list(list_path)
+
+        query_servers.ICMP_ENGINE = "off"
+        done_at = {}
+        t0 = time.perf_counter()
+
+        def on_result(d):
+            done_at[d["ip"]] = time.perf_counter() - t0
+
+        cpu0 = time.process_time()
+        with Monitor() as mon:
+            t0 = time.perf_counter()
+            if args.engine == "async":
+                results = asyncio.run(query_servers.scan_async(entries, on_result=on_result))
+            elif args.engine == "threads":
+                results = query_servers.scan_threads(entries, on_result=on_result)
+            else:
+                scanner = query_servers.Scanner(list_path, health_path="")
+                t0 = time.perf_counter()   # exclude one-off loop/socket start-up, like a warm web_view
+                results = scanner.scan(on_result=on_result).results
+                scanner.close()
+            wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+
+    farm_stats = farm.stop()
+
+    # accuracy: A2S ping = min round-trip, x2 when the server made us answer a challenge
+    by_ip = {p["ip"]: p for p in profiles}
+    ping_ok = jit_ok = measured = 0
+    abs_err = []
+    for d in results:
+        p = by_ip.get(d["ip"])
+        if not p or d["ping_ms"] is None:
+            continue
+        rounds = 2 if p["challenge"] else 1
+        expected = rounds * p["latency_ms"]
+        err = d["ping_ms"] - expected
+        abs_err.append(abs(err))
+        measured += 1
+        if -1.0 - args.tolerance_ms <= err <= args.tolerance_ms + 0.2 * expected:
+            ping_ok += 1
+        if d["jitter_ms"] is not None and d["jitter_ms"] <= rounds * args.jitter + args.tolerance_ms:
+            jit_ok += 1
+
+    times = list(done_at.values())
+    online = sum(1 for d in results if d["online"])
+    return {
+        "servers": servers,
+        "hosts": hosts,
+        "engine": args.engine,
+        "wall_sec": round(wall, 3),
+        "p50_done_ms": round(_pct(times, 50) * 1000, 1) if times else None,
+        "p99_done_ms": round(_pct(times, 99) * 1000, 1) if times else None,
+        "peak_threads": mon.peak_threads,
+        "peak_fds": mon.peak_fds,
+        "cpu_sec": round(cpu, 3),
+        "packets_sent": farm_stats["requests"],
+        "packets_dropped": farm_stats["dropped"],
+        "online": online,
+        "ping_within_tol": round(ping_ok / measured, 3) if measured else None,
+        "jitter_within_tol": round(jit_ok / measured, 3) if measured else None,
+        "ping_mean_abs_err_ms": round(sum(abs_err) / len(abs_err), 2) if abs_err else None,
+    }
+
+
+def _run_discovery(args, servers, hosts, profiles, farm) -> dict:
+    """Half the farm is listed; discovery must return exactly the other half's ze_ servers."""
+    listed = profiles[::2]
+    expected = {p["ip"] for p in profiles[1::2] if p["map"].startswith(master_query.DISCOVERY_MAP_PREFIX)}
+    with tempfile.TemporaryDirectory() as tmp:
+        list_path = os.path.join(tmp, "server_list.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for p in listed:
+                f.write(f"{p['ip']} | bench\n")
+        query_servers.ICMP_ENGINE = "off"
+        scanner = query_servers.Scanner(list_path, health_path="")
+        cpu0 = time.process_time()
+        with Monitor() as mon:
+            t0 = time.perf_counter()
+            stats, results = scanner.discover_async(master=MASTER_ADDR).result()
+            wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+        scanner.close()
+
+    farm_stats = farm.stop()
+    found = {d["ip"] for d in results if d["online"]}
+    return {
+        "servers": servers,
+        "hosts": hosts,
+        "engine": "discover",
+        "wall_sec": round(wall, 3),
+        "first_candidate_sec": stats["first_candidate_sec"],
+        "pages": stats["pages"],
+        "addresses": stats["addresses"],
+        "already_listed": stats["duplicates"],
+        "probed": stats["probed"],
+        "matched": stats["matched"],
+        "found_online": len(found),
+        "expected": len(expected),
+        "exact": found == expected,
+        "peak_threads": mon.peak_threads,
+        "peak_fds": mon.peak_fds,
+        "cpu_sec": round(cpu, 3),
+        "packets_sent": farm_stats["requests"],
+        "error": stats["error"],
+    }
+
+
+def format_report(r: dict) -> str:
+    if r["engine"] == "discover":
+        return (f"servers={r['servers']} engine=discover  wall={r['wall_sec']}s  "
+                f"first_candidate={r['first_candidate_sec']}s  pages={r['pages']} addresses={r['addresses']} "
+                f"(listed {r['already_listed']})  probed={r['probed']} matched={r['matched']}  "
+                f"found={r['found_online']}/{r['expected']} exact={r['exact']}  "
+                f"peak_threads={r['peak_threads']} peak_fds={r['peak_fds']}  cpu={r['cpu_sec']}s  "
+                f"packets={r['packets_sent']}" + (f"  error={r['error']}" if r["error"] else ""))
+    return (f"servers={r['servers']} hosts={r['hosts']} engine={r['engine']}  wall={r['wall_sec']}s  "
+            f"p50={r['p50_done_ms']}ms p99={r['p99_done_ms']}ms  "
+            f"peak_threads={r['peak_threads']} peak_fds={r['peak_fds']}  cpu={r['cpu_sec']}s  "
+            f"packets={r['packets_sent']} (dropped {r['packets_dropped']})  online={r['online']}/{r['servers']}  "
+            f"ping_ok={r['ping_within_tol']} jitter_ok={r['jitter_within_tol']} "
+            f"ping_err={r['ping_mean_abs_err_ms']}ms")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark query_servers.py against a local fake A2S farm.")
+    ap.add_argument("--servers", default="28", help="comma-separated farm sizes, e.g. 28,1000,10000")
+    ap.add_argument("--engine", choices=("async", "threads", "resident"), default="async")
+    ap.add_argument("--ports-per-host", type=int, default=4, help="fake servers per loopback address")
+    ap.add_argument("--hosts", type=int, default=0, help="override the number of loopback addresses")
+    ap.add_argument("--latency", type=float, default=20.0, help="base one-way reply delay (ms)")
+    ap.add_argument("--spread", type=float, default=30.0, help="per-server extra latency, uniform 0..spread (ms)")
+    ap.add_argument("--jitter", type=float, default=2.0, help="per-packet extra delay, uniform 0..jitter (ms)")
+    ap.add_argument("--loss", type=float, default=0.0, help="request drop probability")
+    ap.add_argument("--challenge", type=float, default=1.0, help="share of servers that demand a challenge")
+    ap.add_argument("--tolerance-ms", type=float, default=3.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--discover", action="store_true",
+                    help="benchmark master-server discovery against a stand-in master instead of a scan")
+    ap.add_argument("--json", action="store_true", help="print one JSON object per run")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not sys.platform.startswith("linux"):
+        print("[WARN] The fake farm binds 127.1.x.y addresses, which only Linux routes by default.", flush=True)
+    _raise_fd_limit()
+    for n in (int(x) for x in args.servers.split(",") if x.strip()):
+        r = run_once(args, n)
+        print(json.dumps(r) if args.json else format_report(r), flush=True)
+
+
+if __name__ == "__main__":
+    main()
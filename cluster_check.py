@@ -0,0 +1,175 @@
+# cluster_check.py
+# Multi-process check of the distributed scan (scan_cluster.py) against the bench_scan.py fake farm:
+# - coordinator: web_view's Flask app (the real /worker/poll and /worker/results) on a free port
+#   in this process, with a temporary server list holding every fake server
+# - workers: K processes running `query_servers.py --worker` (worker_main), ICMP off
+# - round 1: every server must be reported exactly once, and each worker's shard must be non-empty
+# - round 2: one worker is killed as soon as it has been handed its todo; the round must still
+#   report every server exactly once, the dead worker's whole shard from other workers, and the
+#   ring must end up with K-1 workers covering the list
+# Exit status 1 when any check fails.
+#
+# Examples:
+#   python cluster_check.py                       # 400 servers, 3 workers
+#   python cluster_check.py --servers 2000 --workers 5
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import collections
+import multiprocessing as mp
+
+import bench_scan
+import query_servers
+
+
+def _worker_proc(url: str, vantage: str):
+    sys.stdout = open(os.devnull, "w")
+    query_servers.main(["--worker", url, "--vantage", vantage, "--icmp", "off", "--health-file", "",
+                        "--engine", "async"])
+
+
+class _Recorder:
+    """Wraps the coordinator's on_result and counts results per server for the current round."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.lock = threading.Lock()
+        self.by_key = collections.defaultdict(list)   # server key -> workers that reported it
+
+    def reset(self):
+        with self.lock:
+            self.by_key.clear()
+
+    def __call__(self, d, primary):
+        with self.lock:
+            self.by_key[d["ip"]].append(d["worker"])
+        self.inner(d, primary)
+
+
+def _check(failures: list, ok: bool, what: str):
+    print(f"[{'OK' if ok else 'FAIL'}] {what}", flush=True)
+    if not ok:
+        failures.append(what)
+
+
+def _exactly_once(failures, rec: _Recorder, keys: set, label: str) -> dict:
+    with rec.lock:
+        counts = {k: len(v) for k, v in rec.by_key.items()}
+        owner = {k: v[0] for k, v in rec.by_key.items()}
+    missing = keys - counts.keys()
+    extra = counts.keys() - keys
+    twice = [k for k, n in counts.items() if n != 1]
+    _check(failures, not missing and not extra and not twice,
+           f"{label}: {len(counts)}/{len(keys)} servers reported, {len(missing)} missing, "
+           f"{len(extra)} unknown, {len(twice)} reported more than once")
+    return owner
+
+
+def run(args) -> list[str]:
+    import web_view
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # no per-request access log
+    failures = []
+    hosts = max(1, args.servers // 4)
+    parent, child = mp.Pipe()
+    farm = mp.Process(target=bench_scan._farm_main, daemon=True,
+                      args=(child, args.servers, hosts, 20.0, 30.0, 2.0, 0.0, 1.0, 1))
+    farm.start()
+    kind, profiles = parent.recv()
+    if kind != "ready":
+        raise SystemExit(f"[ERROR] Farm failed to start: {profiles}")
+    keys = {p["ip"] for p in profiles}
+
+    tmp = tempfile.mkdtemp(prefix="cluster_check_")
+    list_path = os.path.join(tmp, "server_list.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{k} | bench\n" for k in sorted(keys))
+    query_servers.HEALTH_FILE = ""
+    query_servers.ICMP_ENGINE = "off"
+    web_view.LIST_FILE = list_path
+    web_view.HISTORY_DB = ""
+    web_view.EXPORT_CSV = False
+    rec = web_view.CLUSTER.on_result = _Recorder(web_view.CLUSTER.on_result)
+
+    server = make_server("127.0.0.1", 0, web_view.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    workers = [mp.Process(target=_worker_proc, args=(url, f"v{i}"), daemon=True) for i in range(args.workers)]
+    try:
+        for p in workers:
+            p.start()
+        deadline = time.monotonic() + 15
+        while len(web_view.CLUSTER.stats()["workers"]) < args.workers and time.monotonic() < deadline:
+            time.sleep(0.2)
+        stats = web_view.CLUSTER.stats()["workers"]
+        _check(failures, len(stats) == args.workers, f"{len(stats)}/{args.workers} workers joined")
+
+        # ---- round 1: full list, nobody dies ----
+        rec.reset()
+        web_view._run_scan_in_thread()
+        owner1 = _exactly_once(failures, rec, keys, "round 1")
+        shards = collections.Counter(owner1.values())
+        _check(failures, len(shards) == args.workers and min(shards.values()) > 0,
+               f"round 1 shards: {dict(sorted(shards.items()))}")
+
+        # ---- round 2: kill one worker as soon as it holds its todo ----
+        victim_wid = sorted(shards)[0]
+        victim = next(p for p in workers if victim_wid.endswith(f"-{p.pid}"))
+        rec.reset()
+        scan = threading.Thread(target=web_view._run_scan_in_thread, daemon=True)
+        scan.start()
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            r = web_view.CLUSTER.round
+            if r is not None and victim_wid in r.handed:
+                break
+            time.sleep(0.01)
+        victim.kill()
+        print(f"[INFO] Killed {victim_wid}", flush=True)
+        scan.join()
+        owner2 = _exactly_once(failures, rec, keys, "round 2")
+        moved = [k for k, w in owner1.items() if w == victim_wid]
+        by_victim = sum(1 for k in moved if owner2.get(k) == victim_wid)
+        taken = collections.Counter(owner2[k] for k in moved if k in owner2 and owner2[k] != victim_wid)
+        _check(failures, by_victim == 0 and sum(taken.values()) == len(moved),
+               f"killed worker's shard of {len(moved)} servers rescanned by {dict(sorted(taken.items()))}")
+        stats = web_view.CLUSTER.stats()["workers"]
+        _check(failures, len(stats) == args.workers - 1 and victim_wid not in {w["worker"] for w in stats}
+               and sum(w["shard"] for w in stats) == len(keys),
+               f"ring after the kill: {[(w['worker'], w['shard']) for w in stats]}")
+    finally:
+        for p in workers:
+            if p.is_alive():
+                p.kill()
+        server.shutdown()
+        parent.send("stop")
+        farm.join(timeout=5)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return failures
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Check sharding and failover of the distributed scan with local processes.")
+    ap.add_argument("--servers", type=int, default=400, help="fake servers in the farm")
+    ap.add_argument("--workers", type=int, default=3, help="worker processes (at least 2)")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers < 2:
+        raise SystemExit("[ERROR] --workers must be at least 2 (one of them is killed).")
+    bench_scan._raise_fd_limit()
+    failures = run(args)
+    print(f"[DONE] {'all checks passed' if not failures else f'{len(failures)} checks failed'}", flush=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# columnar.py
+# Column-oriented /data body (web_view serves it for ?format=columns):
+# - one array per column instead of one dict per row, so the keys are not repeated per server
+# - name / map / ping_method / error are dictionary-encoded: the column holds indexes into a
+#   per-column string table (a few hundred maps and a handful of error texts for thousands of rows)
+# - "cur/max" player strings become integer player_count / max_players columns; ping and jitter
+#   are plain integers, online / stale 0/1
+# - compress() produces one body per content coding: gzip from the stdlib, zstd only when the
+#   optional zstandard package is installed; web_view encodes once per snapshot and keeps them
+# - decode_rows() turns a body back into the usual row dicts; it is the reference for the page's
+#   JS decoder (decodeColumns in web_view.INDEX_HTML) and what the tests round-trip through
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:   # optional; gzip alone is still a large win
+    zstandard = None
+
+FORMAT = "columns"
+DICT_COLUMNS = ("name", "map", "ping_method", "error")
+BOOL_COLUMNS = ("online", "stale")
+INT_COLUMNS = ("player_count", "max_players", "ping_ms", "jitter_ms")
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+# content codings by preference; the first one the client accepts wins
+CODINGS = (("zstd",) if zstandard is not None else ()) + ("gzip",)
+
+
+def _int(v):
+    if v is None or v == "" or isinstance(v, bool):
+        return None
+    if isinstance(v, int):
+        return v
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return int(f) if f.is_integer() else f
+
+
+def _truthy(v) -> int:
+    if isinstance(v, bool):
+        return int(v)
+    return int(str(v or "").strip().lower() in ("true", "1", "yes"))
+
+
+def encode_rows(rows: list[dict], header: dict | None = None) -> bytes:
+    """Rows as built by web_view._make_row -> columnar JSON (utf-8)."""
+    tables = {c: {} for c in DICT_COLUMNS}
+    cols = {c: [] for c in ("ip",) + DICT_COLUMNS + BOOL_COLUMNS + INT_COLUMNS + ("ping_window", "vantage_ping")}
+    for r in rows:
+        cols["ip"].append(r.get("ip") or "")
+        for c in DICT_COLUMNS:
+            cols[c].append(tables[c].setdefault(r.get(c) or "", len(tables[c])))
+        for c in BOOL_COLUMNS:
+            cols[c].append(_truthy(r.get(c)))
+        cur, sep, mx = str(r.get("player") or "").partition("/")
+        cols["player_count"].append(_int(cur) if sep else None)
+        cols["max_players"].append(_int(mx) if sep else None)
+        cols["ping_ms"].append(_int(r.get("ping_ms")))
+        cols["jitter_ms"].append(_int(r.get("jitter_ms")))
+        cols["ping_window"].append(r.get("ping_window"))
+        cols["vantage_ping"].append(r.get("vantage_ping"))
+    body = {**(header or {}), "format": FORMAT, "n": len(rows),
+            "dicts": {c: list(t) for c, t in tables.items()}, "bools": list(BOOL_COLUMNS), "columns": cols}
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_rows(body: dict) -> list[dict]:
+    """Columnar body (parsed JSON) -> row dicts with the usual keys."""
+    cols, dicts, bools = body["columns"], body.get("dicts", {}), set(body.get("bools", ()))
+    rows = []
+    for i in range(body["n"]):
+        r = {}
+        for c, values in cols.items():
+            v = values[i]
+            if c in dicts:
+                v = dicts[c][v]
+            elif c in bools:
+                v = bool(v)
+            r[c] = v
+        cur, mx = r.pop("player_count", None), r.pop("max_players", None)
+        r["player"] = "" if cur is None and mx is None else f"{'' if cur is None else cur}/{'' if mx is None else mx}"
+        rows.append(r)
+    return rows
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "gzip":
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+    if coding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if coding == "identity":
+        return body
+    raise ValueError(f"unsupported content coding: {coding}")
+
+
+def pick_coding(accept) -> str:
+    """Best of CODINGS the client accepts (werkzeug Accept-Encoding header object), else identity."""
+    for coding in CODINGS:
+        if accept.quality(coding) > 0:
+            return coding
+    return "identity"
@@ -0,0 +1,221 @@
+# icmp_native.py
+# In-process ICMP echo for query_servers.py (no `ping` subprocesses):
+# - one ICMP socket for every echo of every host; replies matched by (source ip, sequence)
+# - Linux unprivileged datagram socket (net.ipv4.ping_group_range), raw socket as fallback
+# - RTT timed with perf_counter around sendto/recvfrom -> sub-millisecond resolution
+# - optional send_pacer.TokenBucket: echoes that must wait for a token are sent later by the
+#   reader thread, and their RTT clock starts at the actual send
+import heapq
+import os
+import sys
+import time
+import socket
+import select
+import struct
+import threading
+import concurrent.futures
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+PAYLOAD = b"cs2-ze-server-finder"
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _resolve(fut: concurrent.futures.Future, value):
+    # a waiter may have cancelled its future (scan deadline) while the echo was in flight
+    try:
+        fut.set_result(value)
+    except concurrent.futures.InvalidStateError:
+        pass
+
+
+def _echo_packet(ident: int, seq: int) -> bytes:
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = _checksum(header + PAYLOAD)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, csum, ident, seq) + PAYLOAD
+
+
+def open_icmp_socket() -> tuple[socket.socket, str]:
+    """Return (socket, kind) where kind is "dgram" or "raw"; raises OSError if neither is allowed."""
+    errors = []
+    for kind, stype in (("dgram", socket.SOCK_DGRAM), ("raw", socket.SOCK_RAW)):
+        if kind == "dgram" and not sys.platform.startswith("linux") and sys.platform != "darwin":
+            continue
+        try:
+            s = socket.socket(socket.AF_INET, stype, socket.IPPROTO_ICMP)
+            s.setblocking(False)
+            return s, kind
+        except OSError as e:
+            errors.append(f"{kind}: {e}")
+    raise OSError("no ICMP socket available (" + "; ".join(errors) + ")")
+
+
+class IcmpProber:
+    """Shared echo engine: submit() from any thread, a single reader thread resolves the futures.
+
+    Each future resolves to the RTT in milliseconds (float) or None on timeout.
+    """
+
+    def __init__(self, pacer=None):
+        self.sock, self.kind = open_icmp_socket()
+        self.pacer = pacer
+        # datagram sockets get their identifier rewritten by the kernel, so only raw checks it
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = 0
+        self._lock = threading.Lock()
+        # (ip, seq) -> [future, sent_at, deadline]; sent_at is None while the echo waits in _outbox
+        self._pending: dict[tuple[str, int], list] = {}
+        self._outbox: list[tuple[float, str, int, float]] = []   # heap of (send_at, ip, seq, timeout_s)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._closed = False
+        self.sent = 0
+        self.received = 0
+        self._reader = threading.Thread(target=self._run, name="icmp-reader", daemon=True)
+        self._reader.start()
+
+    # ---- public ----
+    def submit(self, ip: str, timeout_ms: int) -> concurrent.futures.Future:
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                fut.set_result(None)
+                return fut
+            for _ in range(0x10000):
+                self._seq = (self._seq + 1) & 0xFFFF
+                if (ip, self._seq) not in self._pending:
+                    break
+            seq = self._seq
+            delay = self.pacer.reserve("icmp") if self.pacer is not None else 0.0
+            self._pending[(ip, seq)] = [fut, None, float("inf")]
+            if delay > 0:
+                heapq.heappush(self._outbox, (time.perf_counter() + delay, ip, seq, timeout_ms / 1000.0))
+            else:
+                self._send_locked(ip, seq, timeout_ms / 1000.0)
+        self._wake()
+        return fut
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._wake()
+        self._reader.join(timeout=2)
+        for s in (self.sock, self._wake_r, self._wake_w):
+            try:
+                s.close()
+            except OSError:
+                pass
+
+    # ---- sending (caller holds self._lock) ----
+    def _send_locked(self, ip: str, seq: int, timeout_s: float):
+        entry = self._pending.get((ip, seq))
+        if entry is None:
+            return
+        if entry[0].done():       # waiter gave up (scan deadline) while the echo was queued
+            del self._pending[(ip, seq)]
+            return
+        t0 = time.perf_counter()
+        try:
+            self.sock.sendto(_echo_packet(self._ident, seq), (ip, 0))
+        except OSError:
+            del self._pending[(ip, seq)]
+            _resolve(entry[0], None)
+            return
+        self.sent += 1
+        entry[1], entry[2] = t0, t0 + timeout_s
+
+    def _flush_outbox(self, now: float) -> float | None:
+        """Send queued echoes whose slot has come; return seconds until the next one."""
+        with self._lock:
+            while self._outbox and self._outbox[0][0] <= now:
+                _at, ip, seq, timeout_s = heapq.heappop(self._outbox)
+                self._send_locked(ip, seq, timeout_s)
+            return max(0.0, self._outbox[0][0] - now) if self._outbox else None
+
+    # ---- reader thread ----
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _expire(self, now: float) -> float | None:
+        """Time out overdue echoes; return seconds until the next deadline (None = nothing pending)."""
+        nxt, expired = None, []
+        with self._lock:
+            for key, (fut, t0, deadline) in list(self._pending.items()):
+                if t0 is None:
+                    continue          # still in the outbox; its clock starts when it is sent
+                if deadline <= now:
+                    del self._pending[key]
+                    expired.append(fut)
+                elif nxt is None or deadline < nxt:
+                    nxt = deadline
+        for fut in expired:
+            _resolve(fut, None)
+        return None if nxt is None else max(0.0, nxt - now)
+
+    def _parse(self, data: bytes) -> tuple[int, int] | None:
+        if self.kind == "raw":
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < 8:
+            return None
+        icmp_type, _code, _csum, ident, seq = struct.unpack("!BBHHH", data[:8])
+        if icmp_type != ICMP_ECHO_REPLY:
+            return None
+        if self.kind == "raw" and ident != self._ident:
+            return None
+        return ident, seq
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    break
+            now = time.perf_counter()
+            waits = [w for w in (self._flush_outbox(now), self._expire(now)) if w is not None]
+            wait = min(waits) if waits else None
+            try:
+                readable, _, _ = select.select([self.sock, self._wake_r], [], [], wait)
+            except (OSError, ValueError):
+                break
+            if self._wake_r in readable:
+                try:
+                    while self._wake_r.recv(4096):
+                        pass
+                except (BlockingIOError, OSError):
+                    pass
+            if self.sock not in readable:
+                continue
+            while True:
+                try:
+                    data, addr = self.sock.recvfrom(2048)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    break
+                t1 = time.perf_counter()
+                parsed = self._parse(data)
+                if parsed is None:
+                    continue
+                with self._lock:
+                    entry = self._pending.get((addr[0], parsed[1]))
+                    if entry is None or entry[1] is None:
+                        continue
+                    del self._pending[(addr[0], parsed[1])]
+                fut, t0, _deadline = entry
+                self.received += 1
+                _resolve(fut, (t1 - t0) * 1000.0)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._outbox = []
+        for fut, _t0, _deadline in pending.values():
+            _resolve(fut, None)
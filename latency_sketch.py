@@ -0,0 +1,146 @@
+# latency_sketch.py
+# Long-run latency statistics per server with fixed memory:
+# - LogSketch: log-bucketed quantile sketch (DDSketch-style), relative error `alpha`,
+#   at most `max_bins` buckets, mergeable
+# - RollingSketch: a ring of LogSketches, one per time slot; whole slots expire, so quantiles
+#   cover the last `window` seconds without storing samples
+# - LatencyBook: one RollingSketch per server and ping method, fed with every RTT sample
+import math
+import threading
+import time
+
+SKETCH_ALPHA = 0.01          # 1% relative error on reported quantiles
+SKETCH_MAX_BINS = 128        # per slot; lowest buckets are merged beyond this
+SKETCH_WINDOW_SEC = 3600.0
+SKETCH_SLOTS = 12
+SKETCH_MIN_VALUE = 0.05      # ms; smaller RTTs (loopback/LAN) share one zero bucket
+
+
+class LogSketch:
+    def __init__(self, alpha: float = SKETCH_ALPHA, max_bins: int = SKETCH_MAX_BINS):
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, v: float):
+        self.count += 1
+        self.min = min(self.min, v)
+        self.max = max(self.max, v)
+        if v < SKETCH_MIN_VALUE:
+            self.zero += 1
+            return
+        i = math.ceil(math.log(v) / self._log_gamma)
+        self.bins[i] = self.bins.get(i, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        # keep the upper tail exact: fold the lowest bucket into its neighbour
+        lo, nxt = sorted(self.bins)[:2]
+        self.bins[nxt] += self.bins.pop(lo)
+
+    def merge(self, other: "LogSketch"):
+        for i, c in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return self.min
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if rank < seen:
+                v = 2 * self.gamma ** i / (self.gamma + 1)
+                return min(max(v, self.min), self.max)
+        return self.max
+
+
+class RollingSketch:
+    """Quantiles over the last `window` seconds, in `slots` slices that expire whole."""
+
+    def __init__(self, window: float = SKETCH_WINDOW_SEC, slots: int = SKETCH_SLOTS):
+        self.slot_sec = window / slots
+        self.slots = slots
+        self._ring: list[tuple[int, LogSketch] | None] = [None] * slots
+        self._merged = None    # cached (slot index, LogSketch) of the whole window
+
+    def _slot(self, now: float) -> int:
+        return int(now // self.slot_sec)
+
+    def add(self, v: float, now: float | None = None):
+        n = self._slot(time.time() if now is None else now)
+        pos = n % self.slots
+        entry = self._ring[pos]
+        if entry is None or entry[0] != n:
+            entry = self._ring[pos] = (n, LogSketch())
+        entry[1].add(v)
+        self._merged = None
+
+    def window(self, now: float | None = None) -> LogSketch:
+        n = self._slot(time.time() if now is None else now)
+        if self._merged is not None and self._merged[0] == n:
+            return self._merged[1]
+        merged = LogSketch()
+        for entry in self._ring:
+            if entry is not None and n - self.slots < entry[0] <= n:
+                merged.merge(entry[1])
+        self._merged = (n, merged)
+        return merged
+
+    def summary(self, now: float | None = None) -> dict | None:
+        s = self.window(now)
+        if not s.count:
+            return None
+        r = lambda v: None if v is None else round(v, 1)
+        return {"n": s.count, "min": r(s.min), "p50": r(s.quantile(0.50)),
+                "p95": r(s.quantile(0.95)), "p99": r(s.quantile(0.99))}
+
+
+class LatencyBook:
+    """RollingSketch per (server, ping method); thread-safe."""
+
+    def __init__(self, window: float = SKETCH_WINDOW_SEC, slots: int = SKETCH_SLOTS):
+        self.window_sec = window
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._sketches: dict[tuple[str, str], RollingSketch] = {}
+
+    def add(self, key: str, method: str, samples, now: float | None = None):
+        if not samples:
+            return
+        with self._lock:
+            sk = self._sketches.get((key, method))
+            if sk is None:
+                sk = self._sketches[(key, method)] = RollingSketch(self.window_sec, self.slots)
+            for v in samples:
+                sk.add(float(v), now)
+
+    def summary(self, key: str, method: str, now: float | None = None) -> dict | None:
+        with self._lock:
+            sk = self._sketches.get((key, method))
+            return sk.summary(now) if sk is not None else None
+
+    def count(self, key: str, method: str, now: float | None = None) -> int:
+        with self._lock:
+            sk = self._sketches.get((key, method))
+            return sk.window(now).count if sk is not None else 0
+
+    def forget(self, keys):
+        keys = set(keys)
+        with self._lock:
+            for k in [k for k in self._sketches if k[0] in keys]:
+                del self._sketches[k]
@@ -0,0 +1,248 @@
+# master_query.py
+# Server discovery through the Valve master server query protocol (UDP):
+# - MasterClient.pages(): async generator of address pages; each request is seeded with the last
+#   address of the previous page, so addresses stream in while later pages are still on the way
+# - discover(): addresses are deduplicated against the known list (and each other), then get one
+#   A2S_INFO over the shared A2STransport (no sampling); only servers whose map starts with the
+#   prefix are handed to on_candidate() for the full query_servers treatment
+# - the master is tiny on the wire (one request per ~230 addresses), the INFO pre-probes are
+#   bounded by `concurrency` and go through the global send pacer like any other A2S packet
+#
+# Examples:
+#   python master_query.py                           # list unlisted ze_ servers, full query each
+#   python master_query.py --append                  # ... and add them to server_list.txt
+#   python master_query.py --master 127.0.0.1:27010  # stand-in master (see bench_scan.py --discover)
+import time
+import socket
+import asyncio
+import argparse
+import ipaddress
+
+import scan_metrics
+
+MASTER_SERVER = ("hl2master.steampowered.com", 27011)
+MASTER_FILTER = r"\appid\730\dedicated\1"   # CS2; the map prefix is checked on the INFO reply
+REGION_ALL = 0xFF
+MASTER_TIMEOUT = 3.0         # per page request
+MASTER_RETRIES = 2           # resends of one page before giving up
+MASTER_PAGE_GAP = 0.1        # seconds between page requests (the public master throttles bursts)
+MASTER_MAX_PAGES = 500
+DISCOVERY_MAP_PREFIX = "ze_"
+DISCOVERY_PROBE_TIMEOUT = 1.5
+DISCOVERY_CONCURRENCY = 256  # INFO pre-probes in flight
+
+QUERY_HEADER = b"\x31"
+REPLY_HEADER = b"\xFF\xFF\xFF\xFF\x66\x0A"
+FIRST_SEED = ("0.0.0.0", 0)
+
+
+def encode_query(seed: tuple[str, int], filter: str = MASTER_FILTER, region: int = REGION_ALL) -> bytes:
+    return (QUERY_HEADER + bytes([region & 0xFF]) + f"{seed[0]}:{seed[1]}".encode() + b"\0"
+            + filter.encode() + b"\0")
+
+
+def decode_query(data: bytes) -> tuple[int, tuple[str, int], str]:
+    """(region, seed, filter) of a query packet (used by the stand-in master in bench_scan.py)."""
+    if not data.startswith(QUERY_HEADER) or len(data) < 3:
+        raise ValueError("not a master server query")
+    seed, _, rest = data[2:].partition(b"\0")
+    host, _, port = seed.decode("ascii", "replace").rpartition(":")
+    return data[1], (host, int(port or 0)), rest.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+def encode_reply(addrs) -> bytes:
+    return REPLY_HEADER + b"".join(socket.inet_aton(ip) + port.to_bytes(2, "big") for ip, port in addrs)
+
+
+def parse_reply(data: bytes) -> list[tuple[str, int]]:
+    """Addresses of one reply page; the last page ends with 0.0.0.0:0."""
+    if not data.startswith(REPLY_HEADER):
+        raise ValueError("not a master server reply")
+    body = data[len(REPLY_HEADER):]
+    return [(socket.inet_ntoa(body[i:i + 4]), int.from_bytes(body[i + 4:i + 6], "big"))
+            for i in range(0, len(body) - 5, 6)]
+
+
+class _MasterEndpoint(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(data)
+
+    def error_received(self, exc):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(exc)
+
+
+class MasterClient:
+    """One UDP socket connected to a master server; call open() from inside the running loop."""
+
+    def __init__(self, address: tuple[str, int] = MASTER_SERVER, timeout: float = MASTER_TIMEOUT,
+                 retries: int = MASTER_RETRIES):
+        self.address = address
+        self.timeout = timeout
+        self.retries = retries
+        self._ep = None
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        host, port = self.address
+        try:
+            ipaddress.IPv4Address(host)
+        except ValueError:
+            infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            host = infos[0][4][0]
+        _t, self._ep = await loop.create_datagram_endpoint(_MasterEndpoint, remote_addr=(host, port))
+        return self
+
+    def close(self):
+        if self._ep is not None and self._ep.transport is not None:
+            self._ep.transport.close()
+        self._ep = None
+
+    async def page(self, seed, filter: str = MASTER_FILTER, region: int = REGION_ALL) -> list[tuple[str, int]]:
+        packet = encode_query(seed, filter, region)
+        loop = asyncio.get_running_loop()
+        for _attempt in range(self.retries + 1):
+            self._ep.waiter = loop.create_future()
+            self._ep.transport.sendto(packet)
+            try:
+                data = await asyncio.wait_for(self._ep.waiter, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self._ep.waiter = None
+            scan_metrics.inc("master_pages_total")
+            return parse_reply(data)
+        raise TimeoutError(f"master server {self.address[0]}:{self.address[1]} did not answer")
+
+    async def pages(self, filter: str = MASTER_FILTER, region: int = REGION_ALL,
+                    max_pages: int = MASTER_MAX_PAGES, gap: float = MASTER_PAGE_GAP):
+        """Yield address pages until the 0.0.0.0:0 terminator (or a page that does not advance)."""
+        seed = FIRST_SEED
+        for n in range(max_pages):
+            if n and gap > 0:
+                await asyncio.sleep(gap)
+            addrs = await self.page(seed, filter, region)
+            done = not addrs or addrs[-1] == FIRST_SEED
+            addrs = [a for a in addrs if a != FIRST_SEED]
+            if addrs:
+                yield addrs
+            if done or not addrs or addrs[-1] == seed:
+                return
+            seed = addrs[-1]
+
+
+async def discover(transport, known, on_candidate, master: tuple[str, int] = MASTER_SERVER,
+                   filter: str = MASTER_FILTER, region: int = REGION_ALL, prefix: str = DISCOVERY_MAP_PREFIX,
+                   concurrency: int = DISCOVERY_CONCURRENCY, timeout: float = DISCOVERY_PROBE_TIMEOUT,
+                   max_pages: int = MASTER_MAX_PAGES) -> dict:
+    """Stream the master's list into INFO pre-probes; `on_candidate(ip, port, server_name)` per match.
+
+    `known` holds "ip:port" keys to skip (the current server list). Returns counters for the run.
+    """
+    stats = {"pages": 0, "addresses": 0, "duplicates": 0, "probed": 0, "answered": 0, "matched": 0,
+             "first_candidate_sec": None, "duration_sec": None, "error": None}
+    seen = set(known)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)   # back-pressure on the pager
+    t0 = time.perf_counter()
+    client = await MasterClient(master).open()
+
+    async def produce():
+        try:
+            async for addrs in client.pages(filter, region, max_pages):
+                stats["pages"] += 1
+                for ip, port in addrs:
+                    stats["addresses"] += 1
+                    key = f"{ip}:{port}"
+                    if key in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    seen.add(key)
+                    await queue.put((ip, port))
+        except (OSError, ValueError) as e:
+            stats["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def probe():
+        while (addr := await queue.get()) is not None:
+            stats["probed"] += 1
+            try:
+                info = await transport.info(addr, timeout)
+            except Exception:
+                scan_metrics.inc("discovery_probes_total", result="no_reply")
+                continue
+            stats["answered"] += 1
+            if not (getattr(info, "map_name", "") or "").lower().startswith(prefix):
+                scan_metrics.inc("discovery_probes_total", result="other_map")
+                continue
+            scan_metrics.inc("discovery_probes_total", result="matched")
+            stats["matched"] += 1
+            if stats["first_candidate_sec"] is None:
+                stats["first_candidate_sec"] = round(time.perf_counter() - t0, 3)
+            on_candidate(addr[0], addr[1], getattr(info, "server_name", "") or "")
+
+    try:
+        await asyncio.gather(produce(), *(probe() for _ in range(concurrency)))
+    finally:
+        client.close()
+    stats["duration_sec"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+
+# -------------------- CLI --------------------
+def _address(s: str) -> tuple[str, int]:
+    host, _, port = s.rpartition(":")
+    return (host, int(port)) if host else (s, MASTER_SERVER[1])
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Find ZE servers missing from server_list.txt via the master server.")
+    ap.add_argument("--list", default="server_list.txt", help="server list path (known servers are skipped)")
+    ap.add_argument("--master", type=_address, default=MASTER_SERVER, help="master server host:port")
+    ap.add_argument("--filter", default=MASTER_FILTER, help="master server filter string")
+    ap.add_argument("--prefix", default=DISCOVERY_MAP_PREFIX, help="map name prefix a candidate must show")
+    ap.add_argument("--append", action="store_true", help="append online candidates to the server list")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    import query_servers
+
+    args = parse_args(argv)
+    scanner = query_servers.Scanner(args.list)
+    try:
+        stats, results = scanner.discover_async(query_servers.print_result, master=args.master,
+                                                filter=args.filter, prefix=args.prefix).result()
+    finally:
+        scanner.close()
+    if stats["error"]:
+        print(f"[WARN] Discovery stopped early: {stats['error']}", flush=True)
+    print(f"[INFO] {stats['addresses']} addresses in {stats['pages']} pages, {stats['duplicates']} already known; "
+          f"{stats['answered']}/{stats['probed']} answered INFO, {stats['matched']} matched '{args.prefix}' "
+          f"({stats['duration_sec']}s).", flush=True)
+    found = [d for d in results if d["online"]]
+    if args.append and found:
+        with open(args.list, "a+", encoding="utf-8") as f:
+            if f.tell():
+                f.seek(f.tell() - 1)
+                if f.read(1) != "\n":
+                    f.write("\n")
+            for d in found:
+                name = " ".join((d.get("name") or "").split()).replace("|", "/")
+                f.write(f"{d['ip']} | {name}\n" if name else f"{d['ip']}\n")
+        print(f"[DONE] Added {len(found)} servers to {args.list}", flush=True)
+    else:
+        print(f"[DONE] {len(found)} new servers online", flush=True)
+
+
+if __name__ == "__main__":
+    main()
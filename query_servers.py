@@ -1,17 +1,39 @@
 # query_servers.py
 # Accurate-only ping measurement (fast UI):
-# - ICMP: run SAMPLE_COUNT single-packet pings concurrently -> ping = min, jitter = P95 - P50
-# - Fallback A2S: run SAMPLE_COUNT concurrent A2S_INFO probes with same aggregation
+# - ICMP: single-packet pings paced SAMPLE_GAP_MS apart -> ping = min, jitter = P95 - P50
+#   (in-process echo socket from icmp_native.py when allowed, system `ping` otherwise)
+# - Fallback A2S: the INFO query's round-trip plus further paced A2S_INFO probes,
+#   same aggregation; the freshest INFO reply supplies players/map
+# - Adaptive sampling: SAMPLE_MIN probes first, more (up to SAMPLE_MAX) only while min/P50 still move
+# All A2S traffic goes through a2s_transport.py: a fixed set of shared UDP sockets per scan.
+# ICMP measures the host, not the port: entries sharing an IP are pinged once and share the result.
+# Engines: "threads" (thread pool, blocking sockets) or "async" (one asyncio event loop)
+# Per-phase timings and probe outcomes go to scan_metrics.REGISTRY (web_view serves /metrics).
+import os
 import time
 import csv
 import sys
 import re
+import argparse
+import asyncio
+import socket
 import subprocess
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import concurrent.futures
+import threading
+import heapq
+import json
+from dataclasses import dataclass
+
+import icmp_native
+import latency_sketch
+import master_query
+import scan_metrics
+import send_pacer
+import server_details
 
 try:
-    import a2s  # python-a2s==1.4.0
+    import a2s_transport  # builds on python-a2s==1.4.0 (a2s.byteio / a2s.info internals)
 except Exception:
     print("[ERROR] python-a2s not installed. Run the setup first.", flush=True)
     sys.exit(2)
@@ -19,8 +41,53 @@ except Exception:
 # ---- tunables ----
 A2S_TIMEOUT = 1.0       # was 1.5; tighten a bit since we do concurrent probes
 MAX_WORKERS = 100
-SAMPLE_COUNT = 5
+SAMPLE_COUNT = 5        # probes per server when ADAPTIVE_SAMPLING is off
+ADAPTIVE_SAMPLING = True
+SAMPLE_MIN = 3          # adaptive: first round; enough when min/P50 already agree
+SAMPLE_MAX = 9          # adaptive: cap for noisy servers
+SAMPLE_GAP_MS = 5       # spacing between one server's probes (a burst queues behind itself)
+SAMPLE_TOLERANCE_MS = 2.0   # estimate counts as stable when min and P50 move less than this ...
+SAMPLE_TOLERANCE_PCT = 0.05  # ... or this share of P50, whichever is larger
+# resident scanner: servers with this many RTT samples in their rolling sketch (latency_sketch.py)
+# already have stable long-run figures and get a smaller per-scan budget
+SKETCH_WARM_SAMPLES = 30
+WARM_SAMPLE_MIN = 2
+WARM_SAMPLE_MAX = 4
 ICMP_TIMEOUT_MS = 800   # you can lower to 600 if you want even snappier failures
+SCAN_ENGINE = "threads" # "threads" or "async" (override with --engine)
+ICMP_ENGINE = "auto"    # "native" (one in-process ICMP socket), "subprocess" (system ping), "auto",
+                        # "off" (A2S round-trips only)
+ASYNC_MAX_INFLIGHT = 512  # async engine: cap on outstanding probes (A2S requests / ping processes)
+A2S_SOCKETS = 1         # UDP sockets shared by all A2S requests of a scan
+SCAN_DEADLINE = None    # seconds; unfinished servers are written as stale (override with --deadline)
+PACE_PPS = 2000         # global send budget for all A2S + ICMP packets (0 = unpaced; override with --pps)
+PACE_BURST = 200        # packets that may leave at once after idle time
+RESOLVE_TTL = 300.0     # seconds a hostname's address is reused (getaddrinfo exposes no DNS TTL)
+RESOLVE_NEG_TTL = 30.0  # seconds a failed lookup is remembered
+RESOLVE_TIMEOUT = 3.0   # per lookup; a slow resolver fails that host instead of stalling the scan
+
+# continuous scheduler (ScanScheduler): per-server refresh interval between these bounds
+SCHED_MIN_INTERVAL = 5.0     # seconds; busy / near-full servers
+SCHED_MAX_INTERVAL = 120.0   # seconds; quiet or offline servers
+SCHED_PROBES_PER_SEC = 4.0   # global budget of server probes started per second
+SCHED_BURST = 20             # probes that may start at once after idle time
+SCHED_TICK_SEC = 0.25
+SCHED_VOL_DECAY = 0.7        # EWMA weight of the old volatility score
+SCHED_MAP_CHANGE_WEIGHT = 8.0  # a map change counts like this many players joining/leaving
+SCHED_FULL_WEIGHT = 6.0      # extra urgency for servers within a few slots of full
+
+# negative cache (FailureCache): unreachable servers back off to a single cheap INFO probe
+HEALTH_FILE = "server_health.json"  # persistent failure record ("" disables)
+NEG_FAIL_THRESHOLD = 2       # consecutive failed scans before backing off
+NEG_BACKOFF_BASE = 30.0      # seconds until the first retry probe, doubled per further failure
+NEG_BACKOFF_MAX = 1800.0
+HEALTH_SAVE_INTERVAL = 10.0  # resident scanner: write the record at most this often
+
+# Server details (A2S_PLAYER / A2S_RULES, server_details.py); never part of a scan
+DETAILS_ON_MAP_CHANGE = True  # resident scanner: refresh a server's details when its map changes
+
+CSV_COLUMNS = ["ip", "name", "online", "player_count", "max_players", "map",
+               "ping_ms", "jitter_ms", "ping_method", "error", "stale"]
 
 
 # -------------------- parsing server_list --------------------
@@ -45,18 +112,206 @@ def parse_line(line: str):
     return host.strip(), port, name
 
 
+def read_server_list(path="server_list.txt"):
+    """Parsed entries of `path`, one per host:port (first line wins); raises FileNotFoundError."""
+    index: dict[str, tuple[str, int, str]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            p = parse_line(raw)
+            if not p:
+                continue
+            key = f"{p[0]}:{p[1]}"
+            first = index.get(key)
+            if first is None:
+                index[key] = p
+            elif not first[2] and p[2]:
+                index[key] = (first[0], first[1], p[2])   # a later line may name an unnamed server
+    return list(index.values())
+
+
 def load_server_list(path="server_list.txt"):
-    servers = []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            for raw in f:
-                p = parse_line(raw)
-                if p:
-                    servers.append(p)
+        return read_server_list(path)
     except FileNotFoundError:
         print(f"[ERROR] {path} not found.", flush=True)
         sys.exit(3)
-    return servers
+
+
+@dataclass
+class ListDiff:
+    added: list      # (host, port, name) entries new to the list
+    removed: list    # "host:port" keys no longer listed
+    renamed: list    # (host, port, name) entries whose label changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.renamed)
+
+
+class ServerList:
+    """server_list.txt as an index keyed by "host:port", re-parsed only when the file changes.
+
+    reload() compares (mtime, size) and returns the ListDiff against the previous parse.
+    A file that just changed is left for the next poll so half-written saves are not read.
+    """
+
+    SETTLE_SEC = 0.3
+
+    def __init__(self, path="server_list.txt"):
+        self.path = path
+        self.index: dict[str, tuple[str, int, str]] = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._stamp is not None
+
+    @property
+    def entries(self) -> list[tuple[str, int, str]]:
+        return list(self.index.values())
+
+    def reload(self) -> ListDiff | None:
+        """Re-read the file if it changed; None when nothing changed (or it is mid-write)."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                if not self.loaded:
+                    raise
+                return None          # editors may delete + recreate; keep the last good index
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp == self._stamp:
+                return None
+            if self.loaded and time.time() - st.st_mtime < self.SETTLE_SEC:
+                return None
+            new = {f"{h}:{p}": (h, p, nm) for (h, p, nm) in read_server_list(self.path)}
+            old = self.index
+            diff = ListDiff(
+                added=[e for k, e in new.items() if k not in old],
+                removed=[k for k in old if k not in new],
+                renamed=[e for k, e in new.items() if k in old and old[k][2] != e[2]],
+            )
+            self.index, self._stamp = new, stamp
+            return diff
+
+
+# -------------------- host resolution / grouping --------------------
+def _is_ipv4(host: str) -> bool:
+    try:
+        socket.inet_aton(host)
+        return host.count(".") == 3
+    except OSError:
+        return False
+
+
+class HostResolver:
+    """Hostname -> IPv4 cache: every name is looked up once per scan, in parallel, at scan start.
+
+    Probes then use the cached address, so DNS time never lands in an RTT. getaddrinfo()
+    exposes no DNS TTL, so answers are kept RESOLVE_TTL seconds and failures RESOLVE_NEG_TTL
+    seconds. IP literals never touch the resolver.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: dict[str, tuple[str | None, float, str | None]] = {}   # host -> (ip, expires, error)
+
+    def _fresh(self, host: str, now: float):
+        entry = self._cache.get(host)
+        return entry if entry is not None and entry[1] > now else None
+
+    def _todo(self, hosts) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            return sorted({h for h in hosts if not _is_ipv4(h) and self._fresh(h, now) is None})
+
+    def _store(self, host: str, ip: str | None, error: str | None, took: float):
+        ttl = RESOLVE_TTL if ip else RESOLVE_NEG_TTL
+        with self._lock:
+            self._cache[host] = (ip, time.monotonic() + ttl, error)
+        scan_metrics.inc("dns_lookups_total", result="ok" if ip else "fail")
+        scan_metrics.observe("dns_lookup_seconds", took)
+
+    def _answers(self, hosts) -> dict[str, str | None]:
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for h in hosts:
+                entry = None if _is_ipv4(h) else self._fresh(h, now) or self._cache.get(h)
+                out[h] = h if entry is None else entry[0]
+        return out
+
+    def error(self, host: str) -> str | None:
+        with self._lock:
+            entry = self._cache.get(host)
+        return entry[2] if entry else None
+
+    @staticmethod
+    def _lookup(host: str) -> str:
+        return socket.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)[0][4][0]
+
+    def resolve_many(self, hosts) -> dict[str, str | None]:
+        """{host: ipv4 or None}; lookups for uncached names run in parallel threads."""
+        hosts = set(hosts)
+        todo = self._todo(hosts)
+        if todo:
+            ex = ThreadPoolExecutor(max_workers=min(32, len(todo)))
+            t0 = time.perf_counter()
+            futs = {ex.submit(self._lookup, h): h for h in todo}
+            done, not_done = concurrent.futures.wait(futs, timeout=RESOLVE_TIMEOUT)
+            for fut in done:
+                try:
+                    self._store(futs[fut], fut.result(), None, time.perf_counter() - t0)
+                except OSError as e:
+                    self._store(futs[fut], None, str(e) or type(e).__name__, time.perf_counter() - t0)
+            for fut in not_done:
+                self._store(futs[fut], None, "lookup timed out", RESOLVE_TIMEOUT)
+            ex.shutdown(wait=False, cancel_futures=True)
+        return self._answers(hosts)
+
+    async def resolve_many_async(self, hosts) -> dict[str, str | None]:
+        """Coroutine twin of resolve_many() on the running loop's resolver threads."""
+        hosts = set(hosts)
+        loop = asyncio.get_running_loop()
+
+        async def one(h):
+            t0 = time.perf_counter()
+            try:
+                infos = await asyncio.wait_for(
+                    loop.getaddrinfo(h, None, family=socket.AF_INET, type=socket.SOCK_DGRAM), RESOLVE_TIMEOUT)
+                self._store(h, infos[0][4][0], None, time.perf_counter() - t0)
+            except asyncio.TimeoutError:
+                self._store(h, None, "lookup timed out", time.perf_counter() - t0)
+            except OSError as e:
+                self._store(h, None, str(e) or type(e).__name__, time.perf_counter() - t0)
+
+        await asyncio.gather(*(one(h) for h in self._todo(hosts)))
+        return self._answers(hosts)
+
+
+RESOLVER = HostResolver()
+
+
+def _group(entries, ips: dict[str, str | None]):
+    groups: dict[str, list[tuple[str, int, str]]] = {}
+    unresolved = []
+    for e in entries:
+        ip = ips.get(e[0])
+        if ip is None:
+            unresolved.append(e)
+        else:
+            groups.setdefault(ip, []).append(e)
+    return groups, unresolved
+
+
+def group_by_host(entries, resolver: HostResolver | None = None):
+    """({resolved ip: [(host, port, name), ...]} in list order, [entries whose host did not resolve])."""
+    return _group(entries, (resolver or RESOLVER).resolve_many(h for (h, _p, _nm) in entries))
+
+
+async def group_by_host_async(entries, resolver: HostResolver | None = None):
+    """group_by_host() with the lookups awaited on the running loop."""
+    return _group(entries, await (resolver or RESOLVER).resolve_many_async(h for (h, _p, _nm) in entries))
 
 
 # -------------------- small helpers --------------------
@@ -73,70 +328,251 @@ def _percentile(sorted_vals, p):
     return d0 + d1
 
 
+# -------------------- adaptive sampling --------------------
+def _sample_budget() -> tuple[int, int]:
+    """(first round, cap) of probes per server."""
+    if ADAPTIVE_SAMPLING:
+        return max(1, SAMPLE_MIN), max(SAMPLE_MIN, SAMPLE_MAX)
+    return SAMPLE_COUNT, SAMPLE_COUNT
+
+
+class AdaptiveSampler:
+    """Decides how many probes one server gets, round by round.
+
+    The first round tops up to `first` probes. After that one probe per round is added
+    while the (min, P50) estimate still moves by more than the tolerance, up to `cap`.
+    A first round that gets no reply at all ends sampling (timeouts would just repeat).
+    `key` maps a stored sample to its RTT in ms.
+    """
+
+    def __init__(self, first: int, cap: int, have=(), key=None):
+        self.first = first
+        self.cap = cap
+        self.key = key or (lambda v: v)
+        self.vals = list(have)
+        self.sent = len(self.vals)
+        self._prev = None
+
+    def _estimate(self):
+        s = sorted(self.key(v) for v in self.vals)
+        return (s[0], _percentile(s, 50)) if s else None
+
+    def next_round(self) -> int:
+        if self.sent >= self.cap:
+            return 0
+        if self.sent < self.first:
+            return self.first - self.sent
+        est = self._estimate()
+        if est is None:
+            return 0
+        tol = max(SAMPLE_TOLERANCE_MS, SAMPLE_TOLERANCE_PCT * est[1])
+        if self._prev is None:
+            stable = est[1] - est[0] <= tol      # first round: a tight cluster is already converged
+        else:
+            stable = abs(est[0] - self._prev[0]) <= tol and abs(est[1] - self._prev[1]) <= tol
+        return 0 if stable else 1
+
+    def add(self, results: list):
+        """Record one round; None entries are lost probes."""
+        self._prev = self._estimate()
+        self.sent += len(results)
+        self.vals += [v for v in results if v is not None]
+
+
+def _paced_round(submit, n: int) -> list:
+    """Start n probes SAMPLE_GAP_MS apart (submit() returns a Future) and wait for all of them."""
+    futs = []
+    for i in range(n):
+        if i:
+            time.sleep(SAMPLE_GAP_MS / 1000.0)
+        futs.append(submit())
+    return [f.result() for f in futs]
+
+
+def _time_left(deadline_at: float | None, timeout: float) -> float:
+    """`timeout` (s) clamped to what is left until `deadline_at` (perf_counter); <= 0 = out of time."""
+    if deadline_at is None:
+        return timeout
+    return min(timeout, deadline_at - time.perf_counter())
+
+
+def _run_sampler(sampler: AdaptiveSampler, submit, deadline_at: float | None = None) -> AdaptiveSampler:
+    while (n := sampler.next_round()) and _time_left(deadline_at, 1.0) > 0:
+        sampler.add(_paced_round(submit, n))
+    return sampler
+
+
+# -------------------- send pacing --------------------
+_PACER = None
+_PACER_LOCK = threading.Lock()
+
+
+def get_pacer() -> "send_pacer.TokenBucket | None":
+    """Process-wide token bucket shared by every A2S and ICMP sender (None when PACE_PPS <= 0)."""
+    global _PACER
+    if PACE_PPS <= 0:
+        return None
+    with _PACER_LOCK:
+        if _PACER is None:
+            _PACER = send_pacer.TokenBucket(
+                PACE_PPS, PACE_BURST,
+                observer=lambda kind, d: scan_metrics.observe("send_queue_delay_seconds", d, kind=kind))
+        return _PACER
+
+
+def _pace_delay(kind: str) -> float:
+    pacer = get_pacer()
+    return pacer.reserve(kind) if pacer is not None else 0.0
+
+
 # -------------------- concurrent ICMP (single-packet) --------------------
+def _ping_cmd(host: str, timeout_ms: int) -> list[str]:
+    if sys.platform.startswith("win"):
+        return ["ping", "-n", "1", "-w", str(timeout_ms), host]
+    tout_sec = max(1, int(round(timeout_ms / 1000)))
+    return ["ping", "-c", "1", "-W", str(tout_sec), host]
+
+
+def _parse_ping_output(out: str) -> int | None:
+    m = re.search(r"(time|时间)\s*[=<]\s*(\d+)\s*ms", out, flags=re.IGNORECASE)
+    if m:
+        return int(m.group(2))
+    for t in re.findall(r"(\d+)\s*ms", out):
+        try:
+            return int(t)
+        except:
+            pass
+    return None
+
+
 def _icmp_one(host: str, timeout_ms: int) -> int | None:
     """Send exactly one echo; return RTT(ms) or None."""
+    time.sleep(_pace_delay("icmp"))
     try:
-        if sys.platform.startswith("win"):
-            cmd = ["ping", "-n", "1", "-w", str(timeout_ms), host]
-        else:
-            tout_sec = max(1, int(round(timeout_ms / 1000)))
-            cmd = ["ping", "-c", "1", "-W", str(tout_sec), host]
-
         proc = subprocess.run(
-            cmd, capture_output=True, text=True,
+            _ping_cmd(host, timeout_ms), capture_output=True, text=True,
             timeout=max(2, timeout_ms / 1000 + 1.5),
         )
-        out = (proc.stdout or "") + "\n" + (proc.stderr or "")
-        m = re.search(r"(time|时间)\s*[=<]\s*(\d+)\s*ms", out, flags=re.IGNORECASE)
-        if m:
-            return int(m.group(2))
-        for t in re.findall(r"(\d+)\s*ms", out):
-            try:
-                return int(t)
-            except:
-                pass
-        return None
+        return _parse_ping_output((proc.stdout or "") + "\n" + (proc.stderr or ""))
     except Exception:
         return None
 
 
-def icmp_samples(host: str, count: int, timeout_ms: int) -> list[int]:
-    """Run `count` single-packet pings concurrently (no 1s gaps on Windows)."""
-    vals: list[int] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=count) as ex:
-        futs = [ex.submit(_icmp_one, host, timeout_ms) for _ in range(count)]
-        for fut in concurrent.futures.as_completed(futs):
-            v = fut.result()
-            if isinstance(v, int):
-                vals.append(v)
+_PROBER = None
+_PROBER_LOCK = threading.Lock()
+_PROBER_FAILED = False
+
+
+def get_icmp_prober():
+    """Shared icmp_native.IcmpProber, or None when ICMP_ENGINE/permissions rule it out."""
+    global _PROBER, _PROBER_FAILED
+    if ICMP_ENGINE in ("subprocess", "off"):
+        return None
+    with _PROBER_LOCK:
+        if _PROBER is None and not _PROBER_FAILED:
+            try:
+                _PROBER = icmp_native.IcmpProber(pacer=get_pacer())
+            except OSError as e:
+                _PROBER_FAILED = True
+                if ICMP_ENGINE == "native":
+                    print(f"[WARN] Native ICMP unavailable ({e}); using system ping.", flush=True)
+        return _PROBER
+
+
+def _record_icmp(count: int, vals: list[float]) -> list[float]:
+    scan_metrics.inc("icmp_probes_total", len(vals), result="ok")
+    scan_metrics.inc("icmp_probes_total", count - len(vals), result="fail")
+    for v in vals:
+        scan_metrics.observe("icmp_rtt_seconds", v / 1000.0)
     return vals
 
 
+def icmp_samples(host: str, timeout_ms: int, deadline_at: float | None = None) -> list[float]:
+    """Single-packet pings, paced and adaptively counted (no 1s gaps on Windows).
+
+    With `deadline_at` (perf_counter) no round starts after it and timeouts shrink to fit.
+    """
+    if ICMP_ENGINE == "off":
+        return []
+    first, cap = _sample_budget()
+    sampler = AdaptiveSampler(first, cap)
+    prober = get_icmp_prober()
+
+    def budget_ms():
+        return max(1, int(_time_left(deadline_at, timeout_ms / 1000.0) * 1000))
+    if prober is not None:
+        try:
+            ip = socket.gethostbyname(host)
+        except OSError:
+            return []
+        _run_sampler(sampler, lambda: prober.submit(ip, budget_ms()), deadline_at)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=cap) as ex:
+            _run_sampler(sampler, lambda: ex.submit(_icmp_one, host, budget_ms()), deadline_at)
+    return _record_icmp(sampler.sent, sampler.vals)
+
+
 # -------------------- concurrent A2S INFO --------------------
-def _a2s_one(host: str, port: int, timeout: float) -> int | None:
+_A2S_CLIENT = None
+_A2S_CLIENT_LOCK = threading.Lock()
+
+
+def get_a2s_client() -> "a2s_transport.SyncA2SClient":
+    """Shared blocking A2S client for the thread engine (one transport, A2S_SOCKETS sockets)."""
+    global _A2S_CLIENT
+    with _A2S_CLIENT_LOCK:
+        if _A2S_CLIENT is None:
+            _A2S_CLIENT = a2s_transport.SyncA2SClient(A2S_SOCKETS, pacer=get_pacer())
+        return _A2S_CLIENT
+
+
+def _record_a2s(t0: float, t1: float | None, exc: BaseException | None = None):
+    if exc is None:
+        scan_metrics.inc("a2s_requests_total", result="ok")
+        scan_metrics.observe("a2s_rtt_seconds", t1 - t0)
+    elif isinstance(exc, (TimeoutError, socket.timeout, asyncio.TimeoutError)):
+        scan_metrics.inc("a2s_requests_total", result="timeout")
+    else:
+        scan_metrics.inc("a2s_requests_total", result="error")
+
+
+def _a2s_probe(host: str, port: int, timeout: float, deadline_at: float | None = None) -> tuple[int, object, float]:
+    """One A2S_INFO round-trip -> (rtt_ms, info, received_at); raises on failure.
+
+    Time the request spent waiting for the send pacer is not part of the RTT, but with
+    `deadline_at` the whole call, pacer wait included, ends by then.
+    """
+    t0 = time.perf_counter()
     try:
-        t0 = time.perf_counter()
-        _ = a2s.info((host, port), timeout=timeout)
-        t1 = time.perf_counter()
-        return int((t1 - t0) * 1000)
+        limit = None if deadline_at is None else max(0.0, deadline_at - t0)
+        info, queued = get_a2s_client().info_timed((host, port), timeout=_time_left(deadline_at, timeout),
+                                                   limit=limit)
+    except Exception as e:
+        _record_a2s(t0, None, e)
+        raise
+    t1 = time.perf_counter()
+    _record_a2s(t0 + queued, t1)
+    return int((t1 - t0 - queued) * 1000), info, t1
+
+
+def _a2s_one(host: str, port: int, timeout: float, deadline_at: float | None = None) -> tuple[int, object, float] | None:
+    try:
+        return _a2s_probe(host, port, timeout, deadline_at)
     except Exception:
         return None
 
 
-def a2s_samples(host: str, port: int, count: int) -> list[int]:
-    vals: list[int] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=count) as ex:
-        futs = [ex.submit(_a2s_one, host, port, A2S_TIMEOUT) for _ in range(count)]
-        for fut in concurrent.futures.as_completed(futs):
-            v = fut.result()
-            if isinstance(v, int):
-                vals.append(v)
-    return vals
+def a2s_samples(host: str, port: int, have=(), deadline_at: float | None = None) -> list[tuple[int, object, float]]:
+    """Further A2S_INFO round-trips on top of the samples in `have`; returns only the new ones."""
+    first, cap = _sample_budget()
+    sampler = AdaptiveSampler(first, cap, have, key=lambda v: v[0])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=cap) as ex:
+        _run_sampler(sampler, lambda: ex.submit(_a2s_one, host, port, A2S_TIMEOUT, deadline_at), deadline_at)
+    return sampler.vals[len(have):]
 
 
 # -------------------- aggregation --------------------
-def aggregate_ping(samples: list[int]) -> tuple[int | None, int | None]:
+def aggregate_ping(samples: list[float]) -> tuple[int | None, int | None]:
     """Return (ping_ms, jitter_ms) where ping = min(samples), jitter = P95 - P50."""
     if not samples:
         return None, None
@@ -148,9 +584,95 @@ def aggregate_ping(samples: list[int]) -> tuple[int | None, int | None]:
     return int(best), jitter
 
 
+# -------------------- negative cache --------------------
+class FailureCache:
+    """Persistent per-server failure record with exponential backoff.
+
+    mode(key) is "full" (normal query), "retry" (one INFO probe; full path only if it
+    answers) or "skip" (still backing off; no packets at all). Stored as JSON so one-shot
+    CLI runs share it with the resident scanner.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path or None
+        self._lock = threading.Lock()
+        self._rec: dict[str, dict] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        if self.path:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._rec = {k: v for k, v in json.load(f).items() if isinstance(v, dict)}
+            except (OSError, ValueError, AttributeError):
+                self._rec = {}
+
+    def mode(self, key: str, now: float | None = None) -> str:
+        now = time.time() if now is None else now
+        with self._lock:
+            rec = self._rec.get(key)
+            if not rec or rec["fails"] < NEG_FAIL_THRESHOLD:
+                return "full"
+            return "retry" if now >= rec["next_retry"] else "skip"
+
+    def record(self, key: str, ok: bool, error: str | None = None, now: float | None = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if ok:
+                if self._rec.pop(key, None) is not None:
+                    self._dirty = True
+                return
+            rec = self._rec.setdefault(key, {"fails": 0, "next_retry": 0.0, "error": None})
+            rec["fails"] += 1
+            rec["error"] = error
+            rec["last_fail"] = now
+            if rec["fails"] >= NEG_FAIL_THRESHOLD:
+                backoff = NEG_BACKOFF_BASE * 2 ** (rec["fails"] - NEG_FAIL_THRESHOLD)
+                rec["next_retry"] = now + min(NEG_BACKOFF_MAX, backoff)
+            self._dirty = True
+
+    def describe(self, key: str, now: float | None = None) -> str | None:
+        now = time.time() if now is None else now
+        with self._lock:
+            rec = self._rec.get(key)
+            if not rec:
+                return None
+            wait = max(0, int(rec["next_retry"] - now))
+            return f"{rec['error'] or 'no response'} (failed {rec['fails']}x, next retry in {wait}s)"
+
+    def save(self, min_interval: float = 0.0):
+        """Write the record if it changed (and at most every `min_interval` seconds)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty or time.time() - self._saved_at < min_interval:
+                return
+            data = json.dumps(self._rec, indent=1)
+            self._dirty = False
+            self._saved_at = time.time()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[WARN] Could not save {self.path}: {e}", flush=True)
+
+
+def _mode_of(health, key: str) -> str:
+    return health.mode(key) if health is not None else "full"
+
+
+def unresolved_result(host: str, port: int, name: str) -> dict:
+    """Result for an entry whose host name did not resolve (no packets were sent)."""
+    r = _empty_result(host, port, name)
+    r["error"] = f"could not resolve {host}: {RESOLVER.error(host) or 'no address'}"
+    scan_metrics.inc("servers_total", outcome="unresolved")
+    return r
+
+
 # -------------------- per-server query --------------------
-def query_one(host: str, port: int, name: str) -> dict:
-    r = {
+def _empty_result(host: str, port: int, name: str) -> dict:
+    return {
         "ip": f"{host}:{port}",
         "name": name,
         "online": False,
@@ -161,73 +683,919 @@ def query_one(host: str, port: int, name: str) -> dict:
         "jitter_ms": None,
         "ping_method": None,
         "error": None,
+        "stale": False,     # True = not re-queried before the scan deadline; values are from the last scan
     }
 
-    # server info (does not block long; A2S_TIMEOUT used)
-    try:
-        info = a2s.info((host, port), timeout=A2S_TIMEOUT)
-        r["online"] = True
-        r["player_count"] = info.player_count
-        r["max_players"] = info.max_players
-        r["map"] = info.map_name
-    except Exception as e:
-        r["error"] = str(e)
 
-    # accurate-only path (fast via concurrency)
-    icmp = icmp_samples(host, SAMPLE_COUNT, ICMP_TIMEOUT_MS)
+def _apply_info(r: dict, info):
+    r["online"] = True
+    r["player_count"] = info.player_count
+    r["max_players"] = info.max_players
+    r["map"] = info.map_name
+
+
+def _apply_samples(r: dict, icmp: list[float], a2s_vals: list[tuple[int, object, float]]):
+    """Server state from the freshest A2S reply; ping from ICMP, else from the A2S round-trips."""
+    if a2s_vals:
+        _apply_info(r, max(a2s_vals, key=lambda v: v[2])[1])
+        r["error"] = None
     if icmp:
         ping, jitter = aggregate_ping(icmp)
         r["ping_ms"], r["jitter_ms"], r["ping_method"] = ping, jitter, "ICMP"
+        r["rtt_samples"] = list(icmp)
     else:
-        a2s_vals = a2s_samples(host, port, SAMPLE_COUNT)
-        ping, jitter = aggregate_ping(a2s_vals)
+        ping, jitter = aggregate_ping([v[0] for v in a2s_vals])
         r["ping_ms"], r["jitter_ms"], r["ping_method"] = ping, jitter, ("A2S" if a2s_vals else None)
+        r["rtt_samples"] = [v[0] for v in a2s_vals]
+
+
+def _phase_done(phase: str, since: float) -> float:
+    now = time.perf_counter()
+    scan_metrics.observe("query_phase_seconds", now - since, phase=phase)
+    return now
+
 
+def _queue_done(since: float) -> float:
+    now = time.perf_counter()
+    scan_metrics.observe("queue_wait_seconds", now - since)
+    return now
+
+
+def _queued_call(queued_at: float, fn, *args):
+    """Thread-pool job wrapper: records how long the job sat in the executor queue."""
+    _queue_done(queued_at)
+    return fn(*args)
+
+
+def _query_done(r: dict, started: float, outcome: str | None = None) -> dict:
+    scan_metrics.inc("servers_total", outcome=outcome or ("online" if r["online"] else "offline"))
+    scan_metrics.observe("server_query_seconds", time.perf_counter() - started)
     return r
 
 
-# -------------------- main --------------------
-def main():
-    entries = load_server_list("server_list.txt")
-    if not entries:
-        print("[INFO] No servers in server_list.txt.", flush=True)
-        print("[RECORDS] 0", flush=True)
-        sys.exit(0)
+def _cut_short(r: dict) -> dict:
+    """Result of a query the scan deadline interrupted: its probes say nothing about the server."""
+    r["stale"] = True
+    return r
 
-    print(f"[INFO] Accurate mode. Querying {len(entries)} servers...", flush=True)
 
+def query_one(host: str, port: int, name: str, icmp_future=None, health: FailureCache | None = None,
+              ip: str | None = None, deadline_at: float | None = None) -> dict:
+    """`icmp_future` carries the host's shared icmp_samples() result; sampled here if omitted.
+
+    With `health`, servers that keep failing are skipped or get a single INFO retry.
+    `ip` is the pre-resolved address to probe; the result stays labelled `host:port`.
+    `deadline_at` (perf_counter) bounds every probe; a query cut short by it comes back
+    marked "stale", without a health record, and the scans leave it to stale_results().
+    """
+    target = ip or host
+    started = time.perf_counter()
+    r = _empty_result(host, port, name)
+    mode = _mode_of(health, r["ip"])
+    if mode == "skip":
+        r["error"] = health.describe(r["ip"])
+        return _query_done(r, started, "skipped")
+
+    # server info (does not block long; A2S_TIMEOUT used); its round-trip is the first A2S sample
+    a2s_vals = []
+    try:
+        a2s_vals.append(_a2s_probe(target, port, A2S_TIMEOUT, deadline_at))
+    except Exception as e:
+        r["error"] = str(e)
+    t = _phase_done("info", started)
+    if _time_left(deadline_at, 1.0) <= 0:
+        return _cut_short(r)
+    if mode == "retry" and not a2s_vals:
+        health.record(r["ip"], False, r["error"])
+        r["error"] = health.describe(r["ip"])
+        return _query_done(r, started)
+
+    # accurate-only path (fast via concurrency)
+    if icmp_future is not None:
+        try:
+            icmp = icmp_future.result()
+        except concurrent.futures.CancelledError:   # the host ping never ran: deadline
+            return _cut_short(r)
+    else:
+        icmp = icmp_samples(target, ICMP_TIMEOUT_MS, deadline_at)
+    t = _phase_done("icmp_wait", t)
+    if not icmp:
+        # A2S fallback only needs the samples the INFO probe did not already provide
+        scan_metrics.inc("a2s_fallback_total")
+        a2s_vals += a2s_samples(target, port, a2s_vals, deadline_at)
+        _phase_done("fallback", t)
+    if _time_left(deadline_at, 1.0) <= 0:
+        return _cut_short(r)
+
+    _apply_samples(r, icmp, a2s_vals)
+    if health is not None:
+        health.record(r["ip"], r["online"], r["error"])
+    return _query_done(r, started)
+
+
+# -------------------- async engine --------------------
+# Same measurements as the thread engine, but every probe is a coroutine on one
+# event loop; ASYNC_MAX_INFLIGHT bounds outstanding probes instead of threads.
+async def _icmp_one_async(host: str, timeout_ms: int) -> int | None:
+    await asyncio.sleep(_pace_delay("icmp"))
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *_ping_cmd(host, timeout_ms),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout=max(2, timeout_ms / 1000 + 1.5))
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return None
+        text = out.decode(errors="replace") + "\n" + err.decode(errors="replace")
+        return _parse_ping_output(text)
+    except Exception:
+        return None
+
+
+def _error_text(e: BaseException) -> str:
+    # asyncio timeouts carry no message; match the sync engine's socket.timeout text
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return str(e) or "timed out"
+    return str(e) or type(e).__name__
+
+
+async def _paced_round_async(make, n: int) -> list:
+    """Start n probe coroutines SAMPLE_GAP_MS apart and wait for all of them."""
+    tasks = []
+    try:
+        for i in range(n):
+            if i:
+                await asyncio.sleep(SAMPLE_GAP_MS / 1000.0)
+            tasks.append(asyncio.ensure_future(make()))
+        return await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+
+async def _run_sampler_async(sampler: AdaptiveSampler, make) -> AdaptiveSampler:
+    while (n := sampler.next_round()):
+        sampler.add(await _paced_round_async(make, n))
+    return sampler
+
+
+async def icmp_samples_async(host: str, timeout_ms: int, limit: asyncio.Semaphore,
+                             budget: tuple[int, int] | None = None) -> list[float]:
+    """`budget` overrides the (first round, cap) of _sample_budget()."""
+    if ICMP_ENGINE == "off":
+        return []
+    sampler = AdaptiveSampler(*(budget or _sample_budget()))
+    prober = get_icmp_prober()
+    if prober is not None:
+        try:
+            ip = (await asyncio.get_running_loop().getaddrinfo(host, None, family=socket.AF_INET))[0][4][0]
+        except OSError:
+            return []
+        await _run_sampler_async(sampler, lambda: asyncio.wrap_future(prober.submit(ip, timeout_ms)))
+    else:
+        async def one():
+            async with limit:
+                return await _icmp_one_async(host, timeout_ms)
+        await _run_sampler_async(sampler, one)
+    return _record_icmp(sampler.sent, sampler.vals)
+
+
+async def _a2s_probe_async(transport, host: str, port: int, timeout: float) -> tuple[int, object, float]:
+    t0 = time.perf_counter()
+    try:
+        info, queued = await transport.request_timed((host, port), "info", timeout)
+    except Exception as e:
+        _record_a2s(t0, None, e)
+        raise
+    t1 = time.perf_counter()
+    _record_a2s(t0 + queued, t1)
+    return int((t1 - t0 - queued) * 1000), info, t1
+
+
+async def _a2s_one_async(transport, host: str, port: int, timeout: float) -> tuple[int, object, float] | None:
+    try:
+        return await _a2s_probe_async(transport, host, port, timeout)
+    except Exception:
+        return None
+
+
+async def a2s_samples_async(transport, host: str, port: int, limit: asyncio.Semaphore,
+                            have=(), budget: tuple[int, int] | None = None) -> list[tuple[int, object, float]]:
+    """Coroutine twin of a2s_samples(): only the samples beyond `have` are returned."""
+    async def one():
+        async with limit:
+            return await _a2s_one_async(transport, host, port, A2S_TIMEOUT)
+    sampler = AdaptiveSampler(*(budget or _sample_budget()), have, key=lambda v: v[0])
+    await _run_sampler_async(sampler, one)
+    return sampler.vals[len(have):]
+
+
+async def query_one_async(transport, host: str, port: int, name: str, limit: asyncio.Semaphore,
+                          icmp_task=None, health: FailureCache | None = None, ip: str | None = None,
+                          budget: tuple[int, int] | None = None) -> dict:
+    """Coroutine twin of query_one(); returns the same result dict."""
+    target = ip or host
+    started = time.perf_counter()
+    r = _empty_result(host, port, name)
+    mode = _mode_of(health, r["ip"])
+    if mode == "skip":
+        r["error"] = health.describe(r["ip"])
+        return _query_done(r, started, "skipped")
+
+    a2s_vals = []
+    t = started
+    try:
+        async with limit:
+            t = _queue_done(t)   # waiting for an inflight slot is this engine's queueing
+            a2s_vals.append(await _a2s_probe_async(transport, target, port, A2S_TIMEOUT))
+    except Exception as e:
+        r["error"] = _error_text(e)
+    t = _phase_done("info", t)
+    if mode == "retry" and not a2s_vals:
+        health.record(r["ip"], False, r["error"])
+        r["error"] = health.describe(r["ip"])
+        return _query_done(r, started)
+
+    if icmp_task is not None:
+        icmp = await icmp_task
+    else:
+        icmp = await icmp_samples_async(target, ICMP_TIMEOUT_MS, limit, budget)
+    t = _phase_done("icmp_wait", t)
+    if not icmp:
+        scan_metrics.inc("a2s_fallback_total")
+        a2s_vals += await a2s_samples_async(transport, target, port, limit, a2s_vals, budget)
+        _phase_done("fallback", t)
+
+    _apply_samples(r, icmp, a2s_vals)
+    if health is not None:
+        health.record(r["ip"], r["online"], r["error"])
+    return _query_done(r, started)
+
+
+def _needs_host_ping(members, health) -> bool:
+    # hosts whose every port is backing off get no shared ICMP job (a recovering port samples itself)
+    return any(_mode_of(health, f"{h}:{p}") == "full" for (h, p, _nm) in members)
+
+
+async def _scan_groups(transport, groups, on_result=None, health: FailureCache | None = None,
+                       deadline_at: float | None = None, unresolved=(), budget=None) -> list[dict]:
+    """Results in completion order; at loop time `deadline_at` outstanding probes are cancelled.
+
+    `unresolved` entries (host did not resolve) are reported first, without probing.
+    `budget(members, method)` may return a (first round, cap) sample budget: with method "ICMP"
+    for a host's shared ping, otherwise for a single server's A2S samples.
+    """
     results = []
-    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(entries))) as ex:
-        futs = {ex.submit(query_one, h, p, nm): (h, p, nm) for (h, p, nm) in entries}
-        for fut in as_completed(futs):
+    for (h, p, nm) in unresolved:
+        d = unresolved_result(h, p, nm)
+        results.append(d)
+        if on_result:
+            on_result(d)
+    limit = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+    helpers, tasks = [], []
+    for ip, members in groups.items():
+        pick = budget or (lambda _members, _method=None: None)
+        icmp_task = None
+        if _needs_host_ping(members, health):
+            icmp_task = asyncio.ensure_future(icmp_samples_async(ip, ICMP_TIMEOUT_MS, limit, pick(members, "ICMP")))
+            helpers.append(icmp_task)
+        tasks += [asyncio.ensure_future(query_one_async(transport, h, p, nm, limit, icmp_task, health, ip,
+                                                        pick([(h, p, nm)])))
+                  for (h, p, nm) in members]
+    timeout = None if deadline_at is None else max(0.0, deadline_at - asyncio.get_running_loop().time())
+    try:
+        for coro in asyncio.as_completed(tasks, timeout=timeout):
+            d = await coro
+            if d.get("stale"):
+                continue      # same contract as scan_threads(); cancelled tasks never get here
+            results.append(d)
+            if on_result:
+                on_result(d)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        pending = [t for t in tasks + helpers if not t.done()]
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+
+def stale_results(entries, results, previous: dict | None = None) -> list[dict]:
+    """Placeholders for entries missing from `results`, carrying `previous[ip]` values if known."""
+    done = {d["ip"] for d in results}
+    out = []
+    for (h, p, nm) in entries:
+        key = f"{h}:{p}"
+        if key in done:
+            continue
+        prev = (previous or {}).get(key)
+        r = dict(prev) if prev else _empty_result(h, p, nm)
+        r["name"] = nm
+        r["stale"] = True
+        r["error"] = "stale: not finished before scan deadline"
+        out.append(r)
+    return out
+
+
+def _scan_done(engine: str, started: float):
+    scan_metrics.inc("scans_total", engine=engine)
+    scan_metrics.observe("scan_duration_seconds", time.perf_counter() - started, engine=engine)
+
+
+async def scan_async(entries, on_result=None, health: FailureCache | None = None,
+                     deadline: float | None = None) -> list[dict]:
+    """Query every entry concurrently on the running loop; results in completion order.
+
+    With `deadline` (seconds) the scan stops there and returns what finished.
+    """
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    deadline_at = None if deadline is None else loop.time() + deadline
+    groups, unresolved = await group_by_host_async(entries)
+    transport = await a2s_transport.A2STransport(A2S_SOCKETS, pacer=get_pacer()).open()
+    try:
+        return await _scan_groups(transport, groups, on_result, health, deadline_at, unresolved)
+    finally:
+        transport.close()
+        _scan_done("async", started)
+
+
+def scan_threads(entries, on_result=None, health: FailureCache | None = None,
+                 deadline: float | None = None) -> list[dict]:
+    started = time.perf_counter()
+    deadline_at = None if deadline is None else started + deadline
+    results = []
+    groups, unresolved = group_by_host(entries)
+    for (h, p, nm) in unresolved:
+        d = unresolved_result(h, p, nm)
+        results.append(d)
+        if on_result:
+            on_result(d)
+    ex = ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(entries) + len(groups))))
+    try:
+        # host pings are queued first so no query_one can wait on a job that never gets a worker
+        pings = {ip: ex.submit(icmp_samples, ip, ICMP_TIMEOUT_MS, deadline_at)
+                 for ip, members in groups.items() if _needs_host_ping(members, health)}
+        futs = {ex.submit(_queued_call, time.perf_counter(), query_one, h, p, nm, pings.get(ip), health, ip,
+                          deadline_at): (h, p, nm)
+                for ip, members in groups.items() for (h, p, nm) in members}
+        for fut in as_completed(futs, timeout=None if deadline_at is None else max(0.0, deadline_at - time.perf_counter())):
             d = fut.result()
+            if d.get("stale"):
+                continue      # cut short by the deadline: the caller's stale_results() carries it over
             results.append(d)
-            label = f' "{d["name"]}"' if d["name"] else ""
+            if on_result:
+                on_result(d)
+    except concurrent.futures.TimeoutError:
+        pass
+    finally:
+        # past the deadline: drop queued probes; running ones stop at deadline_at on their own
+        ex.shutdown(wait=deadline is None, cancel_futures=True)
+        _scan_done("threads", started)
+    return results
+
+
+# -------------------- resident scanner (importable API) --------------------
+@dataclass
+class ScanReport:
+    results: list[dict]   # query_one()-shaped dicts, completion order
+    started_at: float     # time.time()
+    finished_at: float
+    ok: bool = True
+    error: str | None = None
+    stale: int = 0        # results carried over because the deadline hit first
+    metrics: dict | None = None  # scan_metrics summary of this scan (counters, phase timings)
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+
+class Scanner:
+    """Long-lived async-engine scanner for embedding (web_view.py).
+
+    Keeps its own event-loop thread with a warm A2STransport and the ServerList index
+    (re-read only when the file changes); host addresses come from the shared RESOLVER.
+    After the first load, every list change is passed to `on_list_change(diff)`.
+    Every RTT sample also goes into `latency` (rolling quantile sketches); results carry the
+    server's long-run figures as `ping_window`, and warm servers get a smaller sample budget.
+    One full scan runs at a time; scan() blocks the calling thread until it is done.
+    probe_async() queries a subset and may overlap with scans (used by ScanScheduler).
+    discover_async() finds unlisted servers through the master server (master_query.py).
+    details_async() fetches one server's players and rules (server_details.py, TTL-cached in
+    `details`); a map change seen by any scan drops them and, with DETAILS_ON_MAP_CHANGE, refetches.
+    """
+
+    def __init__(self, list_path="server_list.txt", health_path: str | None = None):
+        self.list_path = list_path
+        if health_path is None and HEALTH_FILE:
+            health_path = os.path.join(os.path.dirname(os.path.abspath(list_path)), HEALTH_FILE)
+        self.health = FailureCache(health_path)
+        self.servers = ServerList(list_path)
+        self.on_list_change = None
+        self.latency = latency_sketch.LatencyBook()
+        self.details = server_details.DetailCache()
+        self._maps: dict[str, str] = {}
+        self._background: set[asyncio.Task] = set()
+        self._scan_lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="scanner-loop", daemon=True)
+        self._thread.start()
+        self.transport = self._call(a2s_transport.A2STransport(A2S_SOCKETS, pacer=get_pacer()).open())
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def entries(self) -> list[tuple[str, int, str]]:
+        """Current list; picks up edits to the file (call it periodically to watch the file)."""
+        first = not self.servers.loaded
+        diff = self.servers.reload()
+        if diff:
+            for key in diff.removed:
+                self._maps.pop(key, None)
+        if diff and not first and self.on_list_change is not None:
+            self.on_list_change(diff)
+        return self.servers.entries
+
+    def probe_async(self, entries, on_result=None, deadline: float | None = None) -> concurrent.futures.Future:
+        """Query a subset of entries without blocking; the future resolves to the result list."""
+        return asyncio.run_coroutine_threadsafe(self._scan(entries, on_result, deadline), self.loop)
+
+    def discover_async(self, on_result=None, **kwargs) -> concurrent.futures.Future:
+        """Stream the master server's list; every candidate whose INFO pre-probe matches is fully
+        queried right away, while later pages are still arriving.
+
+        Servers already in the list are skipped (by name and by resolved address). `kwargs` go
+        to master_query.discover(); the future resolves to (discovery stats, candidate results).
+        """
+        return asyncio.run_coroutine_threadsafe(self._discover(self.entries(), on_result, kwargs), self.loop)
+
+    async def _discover(self, entries, on_result, kwargs):
+        groups, _unresolved = await group_by_host_async(entries)
+        known = {f"{h}:{p}" for (h, p, _nm) in entries}
+        known.update(f"{ip}:{p}" for ip, members in groups.items() for (_h, p, _nm) in members)
+        tasks = []
+
+        def candidate(ip, port, name):
+            tasks.append(asyncio.ensure_future(self._scan([(ip, port, name)], on_result)))
+        stats = await master_query.discover(self.transport, known, candidate, **kwargs)
+        results = [d for batch in await asyncio.gather(*tasks) for d in batch]
+        return stats, results
+
+    def details_async(self, key: str, force: bool = False) -> concurrent.futures.Future | None:
+        """Players and rules of one listed server ("host:port"); None when it is not in the list."""
+        entry = self.servers.index.get(key)
+        if entry is None:
+            return None
+        return asyncio.run_coroutine_threadsafe(self._details(entry, force), self.loop)
+
+    async def _details(self, entry, force=False) -> dict:
+        h, p, _nm = entry
+        ip = (await RESOLVER.resolve_many_async([h])).get(h)
+        if ip is None:
+            err = f"could not resolve: {RESOLVER.error(h) or h}"
+            return {kind: {"value": None, "age_sec": None, "error": err} for kind in server_details.KINDS}
+        return await server_details.fetch_details(self.transport, f"{h}:{p}", (ip, p), self.details, force=force)
+
+    def scan(self, on_result=None, deadline: float | None = None, previous: dict | None = None) -> ScanReport:
+        """Scan the whole list; `on_result(d)` runs on the scanner's loop thread per server.
+
+        Servers still outstanding after `deadline` seconds come back as stale entries
+        holding their `previous` (ip -> result) values.
+        """
+        with self._scan_lock:
+            started, t0 = time.time(), time.perf_counter()
+            before = scan_metrics.REGISTRY.snapshot()
+            try:
+                entries = self.entries()
+                results = self.probe_async(entries, on_result, deadline).result()
+            except Exception as e:
+                return ScanReport([], started, time.time(), ok=False, error=f"{type(e).__name__}: {e}")
+            summary = scan_metrics.REGISTRY.summarize(before)
+            _scan_done("resident", t0)
+            stale = stale_results(entries, results, previous)
+            return ScanReport(results + stale, started, time.time(), stale=len(stale), metrics=summary)
+
+    def _observe_latency(self, d: dict):
+        if d.get("stale") or not d.get("ping_method"):
+            return
+        self.latency.add(d["ip"], d["ping_method"], d.get("rtt_samples"))
+        d["ping_window"] = self.latency.summary(d["ip"], d["ping_method"])
+
+    def _observe_map(self, d: dict):
+        if d.get("stale") or not d.get("online") or not d.get("map"):
+            return
+        key = d["ip"]
+        entry = self.servers.index.get(key)
+        if entry is None:
+            return    # details are only served for listed servers (discovery candidates are not)
+        old, self._maps[key] = self._maps.get(key), d["map"]
+        if old is None or old == d["map"]:
+            return
+        self.details.invalidate(key)
+        if DETAILS_ON_MAP_CHANGE:
+            task = self.loop.create_task(self._details(entry))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def _budget(self, members, method=None):
+        """Smaller sample budget once the rolling sketch already holds enough samples.
+
+        A host's ICMP ping is shared, so one server with a warm ICMP sketch is enough there.
+        """
+        if method == "ICMP":
+            warm = any(self.latency.count(f"{h}:{p}", "ICMP") >= SKETCH_WARM_SAMPLES for (h, p, _nm) in members)
+        else:
+            warm = all(max(self.latency.count(f"{h}:{p}", "ICMP"), self.latency.count(f"{h}:{p}", "A2S"))
+                       >= SKETCH_WARM_SAMPLES for (h, p, _nm) in members)
+        return (WARM_SAMPLE_MIN, max(WARM_SAMPLE_MIN, WARM_SAMPLE_MAX)) if warm else None
+
+    async def _scan(self, entries, on_result, deadline=None):
+        deadline_at = None if deadline is None else self.loop.time() + deadline
+        groups, unresolved = await group_by_host_async(entries)
+
+        def observed(d):
+            self._observe_latency(d)
+            self._observe_map(d)
+            if on_result:
+                on_result(d)
+        budget = self._budget if ADAPTIVE_SAMPLING else None
+        results = await _scan_groups(self.transport, groups, observed, self.health, deadline_at, unresolved, budget)
+        await self.loop.run_in_executor(None, self.health.save, HEALTH_SAVE_INTERVAL)
+        return results
+
+    def close(self):
+        self.health.save()
+        self.loop.call_soon_threadsafe(self.transport.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+
+
+# -------------------- continuous scheduler --------------------
+class _SchedState:
+    __slots__ = ("entry", "players", "map", "vol", "interval", "due", "last_probe", "inflight")
+
+    def __init__(self, entry, due):
+        self.entry = entry
+        self.players = None
+        self.map = None
+        self.vol = 0.0
+        self.interval = SCHED_MAX_INTERVAL
+        self.due = due
+        self.last_probe = None
+        self.inflight = False
+
+
+class ScanScheduler:
+    """Re-probes servers continuously, each at its own pace, on top of a Scanner.
+
+    Servers sit in a heap ordered by next-probe time. After each result the interval is
+    SCHED_MAX_INTERVAL / (1 + score), where score is an EWMA of player-count deltas
+    (map changes count as SCHED_MAP_CHANGE_WEIGHT players) plus SCHED_FULL_WEIGHT for
+    servers within a few slots of full; offline servers wait SCHED_MAX_INTERVAL.
+    A token bucket (SCHED_PROBES_PER_SEC / SCHED_BURST) caps probe starts, so when the
+    budget is short the most overdue servers go first.
+    """
+
+    def __init__(self, scanner: Scanner, on_result=None, on_batch=None,
+                 rate: float = SCHED_PROBES_PER_SEC, burst: int = SCHED_BURST):
+        self.scanner = scanner
+        self.on_result = on_result      # called per result, on the scanner loop thread
+        self.on_batch = on_batch        # called with the result list when a batch finishes
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._state: dict[str, _SchedState] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = 0
+        self._tokens = float(burst)
+        self._stop = threading.Event()
+        self._thread = None
+        self.probes = 0
+
+    # ---- server set ----
+    def sync_entries(self, entries):
+        """Track exactly `entries`: new servers are due now, removed ones are forgotten."""
+        now = time.monotonic()
+        with self._lock:
+            wanted = {f"{h}:{p}": (h, p, nm) for (h, p, nm) in entries}
+            for key in list(self._state):
+                if key not in wanted:
+                    del self._state[key]
+            for key, entry in wanted.items():
+                st = self._state.get(key)
+                if st is None:
+                    self._state[key] = _SchedState(entry, now)
+                    self._push(key, now)
+                else:
+                    st.entry = entry
+
+    def _push(self, key, due):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, key))
+
+    # ---- adaptation ----
+    def observe(self, d: dict, now: float | None = None):
+        """Fold one result (from this scheduler or a full scan) into the server's next due time."""
+        if d.get("stale"):
+            return   # not actually re-queried; keep whatever due time it has
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            st = self._state.get(d["ip"])
+            if st is None:
+                return
+            st.inflight = False
+            st.last_probe = now
             if d["online"]:
-                ping_part = f"{d['ping_ms']}ms" if d["ping_ms"] is not None else "n/a"
-                jitter_part = f", jitter={d['jitter_ms']}ms" if d["jitter_ms"] is not None else ""
-                method = d["ping_method"] or "n/a"
-                print(
-                    f"{d['ip']}{label}  ONLINE  players={d['player_count']}/{d['max_players']}  "
-                    f"map={d['map']}  ping={ping_part}{jitter_part} ({method})",
-                    flush=True,
-                )
+                delta = 0.0
+                cur, mx = d["player_count"], d["max_players"]
+                if st.players is not None and cur is not None:
+                    delta += abs(cur - st.players)
+                if st.map is not None and d["map"] != st.map:
+                    delta += SCHED_MAP_CHANGE_WEIGHT
+                st.vol = SCHED_VOL_DECAY * st.vol + (1 - SCHED_VOL_DECAY) * delta
+                free = (mx - cur) if (cur is not None and mx) else None
+                near_full = 0.0 if free is None else (1.0 if free <= 2 else 0.5 if free <= 6 else 0.0)
+                score = st.vol + SCHED_FULL_WEIGHT * near_full
+                st.interval = min(SCHED_MAX_INTERVAL, max(SCHED_MIN_INTERVAL, SCHED_MAX_INTERVAL / (1 + score)))
+                st.players, st.map = cur, d["map"]
             else:
-                print(f"{d['ip']}{label}  OFFLINE/NO-RESPONSE  err={d['error']}", flush=True)
+                st.interval = SCHED_MAX_INTERVAL
+            st.due = now + st.interval
+            self._push(d["ip"], st.due)
+
+    # ---- loop ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scan-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _take_due(self, now: float) -> list[tuple[str, int, str]]:
+        batch = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and self._tokens >= 1:
+                due, _seq, key = heapq.heappop(self._heap)
+                st = self._state.get(key)
+                if st is None or st.inflight or st.due != due:
+                    continue   # stale heap entry
+                st.inflight = True
+                self._tokens -= 1
+                batch.append(st.entry)
+        return batch
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.wait(SCHED_TICK_SEC):
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - last) * self.rate)
+            last = now
+            batch = self._take_due(now)
+            if not batch:
+                continue
+            self.probes += len(batch)
+            fut = self.scanner.probe_async(batch, on_result=self._handle_result)
+            fut.add_done_callback(lambda f, b=batch: self._batch_done(f, b))
+
+    def _handle_result(self, d: dict):
+        self.observe(d)
+        if self.on_result:
+            self.on_result(d)
+
+    def _batch_done(self, fut, batch):
+        if fut.cancelled() or fut.exception() is not None:
+            now = time.monotonic()
+            with self._lock:
+                for (h, p, _nm) in batch:
+                    st = self._state.get(f"{h}:{p}")
+                    if st is not None and st.inflight:
+                        st.inflight = False
+                        st.due = now + SCHED_MIN_INTERVAL
+                        self._push(f"{h}:{p}", st.due)
+            return
+        if self.on_batch:
+            self.on_batch(fut.result())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            intervals = [st.interval for st in self._state.values()]
+            return {
+                "running": self.running,
+                "servers": len(self._state),
+                "overdue": sum(1 for st in self._state.values() if st.due <= now and not st.inflight),
+                "inflight": sum(1 for st in self._state.values() if st.inflight),
+                "mean_interval_sec": round(sum(intervals) / len(intervals), 1) if intervals else None,
+                "probes": self.probes,
+                "budget_per_sec": self.rate,
+            }
+
+
+# -------------------- output --------------------
+def format_result(d: dict) -> str:
+    label = f' "{d["name"]}"' if d["name"] else ""
+    if d.get("stale"):
+        return f"{d['ip']}{label}  STALE (deadline hit; previous values kept)"
+    if d["online"]:
+        ping_part = f"{d['ping_ms']}ms" if d["ping_ms"] is not None else "n/a"
+        jitter_part = f", jitter={d['jitter_ms']}ms" if d["jitter_ms"] is not None else ""
+        method = d["ping_method"] or "n/a"
+        return (f"{d['ip']}{label}  ONLINE  players={d['player_count']}/{d['max_players']}  "
+                f"map={d['map']}  ping={ping_part}{jitter_part} ({method})")
+    return f"{d['ip']}{label}  OFFLINE/NO-RESPONSE  err={d['error']}"
+
+
+def print_result(d: dict):
+    print(format_result(d), flush=True)
+
 
-    outcsv = "servers_output.csv"
-    with open(outcsv, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["ip", "name", "online", "player_count", "max_players", "map",
-                    "ping_ms", "jitter_ms", "ping_method", "error"])
+class IncrementalCsvWriter:
+    """Rows go to `<path>.tmp` as they complete; commit() renames it over `path` atomically,
+    so readers only ever see a complete previous or complete new file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = f"{path}.tmp"
+        self.rows = 0
+        self._f = open(self.tmp, "w", newline="", encoding="utf-8")
+        self._w = csv.writer(self._f)
+        self._w.writerow(CSV_COLUMNS)
+
+    def write(self, r: dict):
+        self._w.writerow([r.get(c) for c in CSV_COLUMNS])
+        self._f.flush()
+        self.rows += 1
+
+    def commit(self):
+        self._f.close()
+        for attempt in range(5):
+            try:
+                os.replace(self.tmp, self.path)
+                return
+            except PermissionError:
+                # Windows: a reader holding the old file open blocks the rename briefly
+                if attempt == 4:
+                    raise
+                time.sleep(0.1)
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(self.tmp)
+        except OSError:
+            pass
+
+
+def write_csv(results: list[dict], outcsv: str):
+    w = IncrementalCsvWriter(outcsv)
+    try:
         for r in results:
-            w.writerow([
-                r["ip"], r.get("name", ""), r["online"], r["player_count"], r["max_players"],
-                r["map"], r["ping_ms"], r["jitter_ms"], r["ping_method"], r["error"]
-            ])
+            w.write(r)
+    except BaseException:
+        w.abort()
+        raise
+    w.commit()
+
+
+def _int_or_none(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_previous_results(path: str) -> dict[str, dict]:
+    """ip -> result dict from an earlier servers_output.csv (empty if missing)."""
+    prev = {}
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                r = {c: (row.get(c) or None) for c in CSV_COLUMNS}
+                r["name"] = row.get("name") or ""
+                r["online"] = (row.get("online") or "").strip().lower() == "true"
+                for c in ("player_count", "max_players", "ping_ms", "jitter_ms"):
+                    r[c] = _int_or_none(r[c])
+                r["stale"] = (row.get("stale") or "").strip().lower() == "true"
+                prev[r["ip"]] = r
+    except OSError:
+        pass
+    return prev
+
+
+# -------------------- main --------------------
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Query the servers in server_list.txt and write servers_output.csv.")
+    ap.add_argument("--engine", choices=("threads", "async"), default=SCAN_ENGINE,
+                    help="threads: thread pool per probe (default); async: all probes on one event loop")
+    ap.add_argument("--icmp", choices=("auto", "native", "subprocess", "off"), default=ICMP_ENGINE,
+                    help="ICMP prober: in-process echo socket (native), the system ping command, or off (A2S only)")
+    ap.add_argument("--health-file", default=HEALTH_FILE,
+                    help='failure record for offline backoff ("" to always probe every server fully)')
+    ap.add_argument("--deadline", type=float, default=SCAN_DEADLINE,
+                    help="stop after this many seconds; unfinished servers keep their previous values (stale)")
+    ap.add_argument("--pps", type=float, default=PACE_PPS,
+                    help="global packets/second budget for A2S + ICMP sends (0 = no pacing)")
+    ap.add_argument("--history", default="",
+                    help="also append the results to this SQLite history file (see scan_history.py)")
+    ap.add_argument("--worker", metavar="URL", default="",
+                    help="worker mode: scan the shard handed out by the web_view at URL (see scan_cluster.py)")
+    ap.add_argument("--vantage", default=socket.gethostname(),
+                    help="worker mode: label of this measuring location (per-vantage ping columns)")
+    ap.add_argument("--token", default="", help="worker mode: shared secret if the coordinator sets CLUSTER_TOKEN")
+    ap.add_argument("--list", default="server_list.txt", help="server list path")
+    ap.add_argument("--out", default="servers_output.csv", help="CSV output path")
+    return ap.parse_args(argv)
+
+
+def worker_main(args):
+    """Scan shards for a coordinator until interrupted; nothing is written locally."""
+    import scan_cluster
+    health = FailureCache(args.health_file)
+
+    def scan(entries, on_result):
+        if args.engine == "async":
+            asyncio.run(scan_async(entries, on_result=on_result, health=health, deadline=args.deadline))
+        else:
+            scan_threads(entries, on_result=on_result, health=health, deadline=args.deadline)
+        health.save(HEALTH_SAVE_INTERVAL)
+
+    wid = f"{args.vantage}-{socket.gethostname()}-{os.getpid()}"
+    try:
+        scan_cluster.run_worker(args.worker, args.vantage, wid, scan, args.token)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        health.save()
+
+
+def main(argv=None):
+    global ICMP_ENGINE, PACE_PPS
+    args = parse_args(argv)
+    ICMP_ENGINE = args.icmp
+    PACE_PPS = args.pps
+    if args.worker:
+        worker_main(args)
+        return
+    entries = load_server_list(args.list)
+    if not entries:
+        print(f"[INFO] No servers in {args.list}.", flush=True)
+        print("[RECORDS] 0", flush=True)
+        sys.exit(0)
+
+    print(f"[INFO] Accurate mode ({args.engine} engine). Querying {len(entries)} servers...", flush=True)
+
+    outcsv = args.out
+    previous = load_previous_results(outcsv) if args.deadline is not None else {}
+    writer = IncrementalCsvWriter(outcsv)
+
+    def on_result(d):
+        print_result(d)
+        writer.write(d)
+
+    health = FailureCache(args.health_file)
+    try:
+        if args.engine == "async":
+            results = asyncio.run(scan_async(entries, on_result=on_result, health=health, deadline=args.deadline))
+        else:
+            results = scan_threads(entries, on_result=on_result, health=health, deadline=args.deadline)
+        stale = stale_results(entries, results, previous)
+        for d in stale:
+            on_result(d)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+    health.save()
+    if args.history:
+        import scan_history
+        store = scan_history.HistoryStore(args.history)
+        store.record(results)
+        store.close()
 
-    print(f"[DONE] Saved {len(results)} rows to {outcsv}", flush=True)
-    print(f"[RECORDS] {len(results)}", flush=True)
+    pacer = get_pacer()
+    if pacer is not None and pacer.delayed:
+        ps = pacer.stats()
+        print(f"[INFO] Pacing held {ps['delayed']}/{ps['reserved']} packets "
+              f"(mean {ps['mean_delay_ms']} ms, max {ps['max_delay_ms']} ms).", flush=True)
+    if stale:
+        print(f"[WARN] Deadline of {args.deadline}s hit; {len(stale)} servers kept previous values.", flush=True)
+    print(f"[DONE] Saved {writer.rows} rows to {outcsv}", flush=True)
+    print(f"[RECORDS] {writer.rows}", flush=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+# row_index.py
+# Read-side indexes over one /data snapshot, so narrow queries (dashboards, bots) don't walk and
+# re-sort every row on each request:
+# - numeric columns (players, max_players, free slots, ping, jitter) as value-sorted position
+#   arrays; a range filter is two bisects
+# - map names: a sorted array for prefix matches (two bisects) plus the distinct names for
+#   substring matches (a ZE list has far fewer maps than servers)
+# - sort orders are built on first use per key and kept; filters intersect position lists,
+#   smallest first, and the matches are ordered by their rank in the chosen order
+# An index belongs to one snapshot and is never updated: web_view builds it on the first
+# filtered request after a publish. Encoded pages are memoized per query (QUERY_CACHE_MAX).
+import json
+import bisect
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+NUMERIC = ("players", "max_players", "free", "ping", "jitter")
+SORT_KEYS = NUMERIC + ("name", "map", "ip")
+QUERY_CACHE_MAX = 128
+
+
+@dataclass(frozen=True)
+class Query:
+    """One filtered /data request; `sort` is a SORT_KEYS name, "-" prefix = descending."""
+    map_prefix: str = ""
+    map_contains: str = ""
+    players_min: float | None = None
+    players_max: float | None = None
+    free_min: float | None = None
+    ping_max: float | None = None
+    online: bool = False
+    sort: str = "-players"
+    offset: int = 0
+    limit: int | None = None
+
+
+def _num(v) -> float | None:
+    if v is None or isinstance(v, bool):
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _truthy(v) -> bool:
+    if isinstance(v, bool):
+        return v
+    return str(v or "").strip().lower() in ("true", "1", "yes")
+
+
+def _values(r: dict) -> dict:
+    cur, _, mx = str(r.get("player") or "").partition("/")
+    cur, mx = _num(cur), _num(mx)
+    return {"players": cur, "max_players": mx,
+            "free": None if cur is None or mx is None else mx - cur,
+            "ping": _num(r.get("ping_ms")), "jitter": _num(r.get("jitter_ms"))}
+
+
+class RowIndex:
+    """Indexes over `rows` (page rows as served by /data); `header` goes into every encoded page."""
+
+    def __init__(self, rows: list[dict], header: dict | None = None):
+        self.rows = rows
+        self.header = dict(header or {})
+        vals = [_values(r) for r in rows]
+        self._val = {c: [v[c] for v in vals] for c in NUMERIC}
+        self._cols = {}
+        for c in NUMERIC:
+            pairs = sorted((v, i) for i, v in enumerate(self._val[c]) if v is not None)
+            self._cols[c] = ([v for v, _i in pairs], [i for _v, i in pairs])
+        maps = sorted((str(r.get("map") or "").lower(), i) for i, r in enumerate(rows))
+        self._map_keys = [m for m, _i in maps]
+        self._map_pos = [i for _m, i in maps]
+        self._by_map: dict[str, list[int]] = {}
+        for m, i in maps:
+            self._by_map.setdefault(m, []).append(i)
+        self._online = [i for i, r in enumerate(rows) if _truthy(r.get("online"))]
+        self._lock = threading.Lock()
+        self._orders: dict[str, tuple[list[int], list[int]]] = {}
+        self._pages: OrderedDict = OrderedDict()
+
+    # ---- lookups (lists of row positions) ----
+    def _range(self, col: str, lo=None, hi=None) -> list[int]:
+        keys, pos = self._cols[col]
+        a = 0 if lo is None else bisect.bisect_left(keys, lo)
+        b = len(keys) if hi is None else bisect.bisect_right(keys, hi)
+        return pos[a:b]
+
+    def _prefix(self, prefix: str) -> list[int]:
+        a = bisect.bisect_left(self._map_keys, prefix)
+        b = bisect.bisect_left(self._map_keys, prefix + "\U0010FFFF")
+        return self._map_pos[a:b]
+
+    def _contains(self, text: str) -> list[int]:
+        return [i for m, pos in self._by_map.items() if text in m for i in pos]
+
+    def _order(self, sort: str) -> tuple[list[int], list[int]]:
+        """(positions in sort order, rank of each position); missing values sort last, ties by ip."""
+        with self._lock:
+            hit = self._orders.get(sort)
+        if hit is not None:
+            return hit
+        desc, col = sort.startswith("-"), sort.lstrip("-")
+        if col not in SORT_KEYS:
+            raise ValueError(f"unknown sort key: {col}")
+        n = len(self.rows)
+        ip = [str(r.get("ip") or "") for r in self.rows]
+        if col in NUMERIC:
+            v = self._val[col]
+            have = sorted((i for i in range(n) if v[i] is not None),
+                          key=lambda i: (-v[i] if desc else v[i], ip[i]))
+            order = have + sorted((i for i in range(n) if v[i] is None), key=ip.__getitem__)
+        else:
+            text = [str(r.get(col) or "").lower() for r in self.rows]
+            order = sorted(range(n), key=lambda i: (text[i], ip[i]), reverse=desc)
+        rank = [0] * n
+        for k, i in enumerate(order):
+            rank[i] = k
+        with self._lock:
+            self._orders[sort] = (order, rank)
+        return order, rank
+
+    # ---- queries ----
+    def query(self, q: Query) -> tuple[int, list[dict]]:
+        """(number of matching rows, the requested page of them)."""
+        sets = []
+        if q.online:
+            sets.append(self._online)
+        if q.map_prefix:
+            sets.append(self._prefix(q.map_prefix.lower()))
+        if q.map_contains:
+            sets.append(self._contains(q.map_contains.lower()))
+        if q.players_min is not None or q.players_max is not None:
+            sets.append(self._range("players", q.players_min, q.players_max))
+        if q.free_min is not None:
+            sets.append(self._range("free", q.free_min))
+        if q.ping_max is not None:
+            sets.append(self._range("ping", None, q.ping_max))
+        order, rank = self._order(q.sort)
+        end = None if q.limit is None else q.offset + q.limit
+        if not sets:
+            return len(order), [self.rows[i] for i in order[q.offset:end]]
+        sets.sort(key=len)
+        match = set(sets[0])
+        for s in sets[1:]:
+            if not match:
+                break
+            match.intersection_update(s)
+        page = sorted(match, key=rank.__getitem__)[q.offset:end]
+        return len(match), [self.rows[i] for i in page]
+
+    def page_json(self, q: Query) -> bytes:
+        """Encoded /data body for `q`, memoized for the life of this index."""
+        with self._lock:
+            body = self._pages.get(q)
+            if body is not None:
+                self._pages.move_to_end(q)
+                return body
+        total, rows = self.query(q)
+        body = json.dumps({**self.header, "total": total, "offset": q.offset, "limit": q.limit, "rows": rows},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._pages[q] = body
+            while len(self._pages) > QUERY_CACHE_MAX:
+                self._pages.popitem(last=False)
+        return body
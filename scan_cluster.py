@@ -0,0 +1,321 @@
+# scan_cluster.py
+# Distributed scanning: web_view.py coordinates, `query_servers.py --worker URL` processes probe.
+# - HashRing: consistent hashing with virtual nodes; a server's owners are the first workers
+#   clockwise from its hash on distinct vantages (CLUSTER_REPLICAS > 1 = the same server measured
+#   from several vantages), so a worker joining or leaving only moves the keys next to its points
+# - Coordinator: membership by heartbeat, shard assignment, scan rounds and result routing;
+#   no HTTP in here (web_view.py serves it at /worker/poll and /worker/results)
+# - run_worker(): the worker loop (stdlib urllib): poll for the shard and the open round, scan the
+#   round's todo with the normal engine, stream results back in small batches (they double as
+#   heartbeats, so a long scan never looks like a dead worker)
+import bisect
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+
+import scan_metrics
+
+CLUSTER_VNODES = 64          # ring points per worker; more = more even shards
+CLUSTER_REPLICAS = 1         # vantages that measure each server
+WORKER_TIMEOUT_SEC = 5.0     # no poll/results for this long = worker gone, its keys move
+WORKER_POLL_SEC = 1.0
+WORKER_RETRY_SEC = 3.0       # coordinator unreachable
+RESULT_FLUSH_SEC = 0.5
+ROUND_TIMEOUT_SEC = 120.0    # a round without its own deadline gives up after this long
+
+
+def _hash(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+
+
+def _key(e) -> str:
+    return f"{e[0]}:{e[1]}"
+
+
+class HashRing:
+    """Consistent-hash ring over workers ({worker id: vantage})."""
+
+    def __init__(self, members: dict[str, str], vnodes: int = CLUSTER_VNODES):
+        self.members = dict(members)
+        points = sorted((_hash(f"{w}#{i}"), w) for w in self.members for i in range(vnodes))
+        self._points = [p for p, _w in points]
+        self._workers = [w for _p, w in points]
+
+    def owners(self, key: str, n: int = 1) -> list[str]:
+        """Up to n workers for `key`, primary first, each on a different vantage."""
+        out, vantages = [], set()
+        if not self._points:
+            return out
+        i = bisect.bisect(self._points, _hash(key))
+        for j in range(len(self._points)):
+            w = self._workers[(i + j) % len(self._points)]
+            v = self.members[w]
+            if w in out or v in vantages:
+                continue
+            out.append(w)
+            vantages.add(v)
+            if len(out) >= n:
+                break
+        return out
+
+
+class _Worker:
+    __slots__ = ("id", "vantage", "last_seen", "entries", "version")
+
+    def __init__(self, wid, vantage, now):
+        self.id = wid
+        self.vantage = vantage
+        self.last_seen = now
+        self.entries = []
+        self.version = 0
+
+
+class _Round:
+    def __init__(self, rid: int):
+        self.id = rid
+        self.handed: dict[str, int] = {}     # worker -> shard version its todo was built from
+        self.shards: dict[str, set] = {}     # worker -> server keys it was handed in this round
+        self.done: dict[str, int] = {}       # worker -> shard version it finished
+        self.reported: dict[str, set] = {}   # server key -> workers that sent a result
+        self.finished = False
+
+
+class Coordinator:
+    """Shards the server list over live workers and collects their results.
+
+    `on_result(d, primary)` runs for every incoming result (on the HTTP thread); `primary`
+    is True when the sender is the server's first owner, i.e. its result feeds the table,
+    the others only add per-vantage figures. Results carry "vantage" and "worker".
+    Only results for the open round, for servers handed to that worker in it and still in
+    the list are accepted; the rest are dropped and counted (cluster_results_dropped_total).
+    """
+
+    def __init__(self, on_result=None, replicas: int = CLUSTER_REPLICAS, vnodes: int = CLUSTER_VNODES,
+                 timeout: float = WORKER_TIMEOUT_SEC):
+        self.on_result = on_result
+        self.replicas = max(1, replicas)
+        self.vnodes = vnodes
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self.workers: dict[str, _Worker] = {}
+        self.entries: list[tuple[str, int, str]] = []
+        self._listed: set[str] = set()
+        self.ring = HashRing({}, vnodes)
+        self.round: _Round | None = None
+        self._round_seq = 0
+        self.rebalances = 0
+
+    # ---- membership / sharding (call with the lock held) ----
+    def _expire(self, now: float):
+        gone = [wid for wid, w in self.workers.items() if now - w.last_seen > self.timeout]
+        for wid in gone:
+            del self.workers[wid]
+            print(f"[WARN] Worker {wid} timed out; rebalancing.", flush=True)
+        if gone:
+            self._rebuild()
+
+    def _rebuild(self):
+        self.ring = HashRing({wid: w.vantage for wid, w in self.workers.items()}, self.vnodes)
+        self.rebalances += 1
+        self._assign()
+
+    def _assign(self):
+        shards = {wid: [] for wid in self.workers}
+        for e in self.entries:
+            for wid in self.ring.owners(_key(e), self.replicas):
+                shards[wid].append(e)
+        for wid, entries in shards.items():
+            w = self.workers[wid]
+            if entries != w.entries:
+                w.entries = entries
+                w.version += 1
+        self._cond.notify_all()
+
+    def _set_entries(self, entries):
+        self.entries = [tuple(e) for e in entries]
+        self._listed = {_key(e) for e in self.entries}
+        self._assign()
+
+    def set_entries(self, entries):
+        with self._cond:
+            self._set_entries(entries)
+
+    def live(self) -> bool:
+        with self._cond:
+            self._expire(time.monotonic())
+            return bool(self.workers)
+
+    # ---- worker endpoints ----
+    def poll(self, wid: str, vantage: str, have: int | None = None) -> dict:
+        """Heartbeat: returns the worker's shard (when `have` is stale) and its todo of an open round."""
+        now = time.monotonic()
+        with self._cond:
+            self._expire(now)
+            w = self.workers.get(wid)
+            if w is None:
+                w = self.workers[wid] = _Worker(wid, vantage or wid, now)
+                print(f"[INFO] Worker {wid} ({w.vantage}) joined; rebalancing.", flush=True)
+                self._rebuild()
+            w.last_seen = now
+            resp = {"shard_version": w.version, "entries": None if have == w.version else w.entries,
+                    "round": None, "todo": None, "poll_sec": WORKER_POLL_SEC}
+            r = self.round
+            if r is not None and not r.finished and r.handed.get(wid) != w.version:
+                # after a rebalance only what is still missing is handed out again
+                r.handed[wid] = w.version
+                r.shards.setdefault(wid, set()).update(_key(e) for e in w.entries)
+                resp["round"] = r.id
+                resp["todo"] = [e for e in w.entries
+                                if wid not in r.reported.get(_key(e), ())
+                                and len(r.reported.get(_key(e), ())) < self.replicas]
+            return resp
+
+    def results(self, wid: str, vantage: str, round_id: int | None, results: list, done: bool = False) -> dict:
+        now = time.monotonic()
+        routed, dropped = [], {}
+        with self._cond:
+            w = self.workers.get(wid)
+            if w is not None:
+                w.last_seen = now
+                vantage = w.vantage
+            r = self.round
+            current = r is not None and round_id == r.id
+            shard = r.shards.get(wid, ()) if current else ()
+            for d in results:
+                reason = ("stale_round" if not current else "not_in_shard" if d["ip"] not in shard
+                          else "not_listed" if d["ip"] not in self._listed else None)
+                if reason is not None:
+                    dropped[reason] = dropped.get(reason, 0) + 1
+                    continue
+                d["vantage"] = vantage or wid
+                d["worker"] = wid
+                owners = self.ring.owners(d["ip"], self.replicas)
+                routed.append((d, bool(owners) and owners[0] == wid))
+                if current:
+                    r.reported.setdefault(d["ip"], set()).add(wid)
+            if done and current and w is not None:
+                r.done[wid] = r.handed.get(wid, -1)
+            self._cond.notify_all()
+        for reason, n in dropped.items():
+            scan_metrics.inc("cluster_results_dropped_total", n, reason=reason)
+        if dropped:
+            print(f"[WARN] Dropped {sum(dropped.values())} results from worker {wid}: {dropped}", flush=True)
+        if self.on_result is not None:
+            for d, primary in routed:
+                self.on_result(d, primary)
+        return {"ok": True, "known": w is not None, "dropped": sum(dropped.values())}
+
+    # ---- rounds ----
+    def _round_complete(self, r: _Round) -> bool:
+        return all(r.handed.get(wid) == w.version and r.done.get(wid) == w.version
+                   for wid, w in self.workers.items())
+
+    def run_round(self, entries, deadline: float | None = None) -> dict:
+        """Open a round over `entries` and block until every live worker finished its shard,
+        all workers are gone, or `deadline` seconds pass."""
+        deadline_at = time.monotonic() + (deadline or ROUND_TIMEOUT_SEC)
+        with self._cond:
+            self._set_entries(entries)
+            self._round_seq += 1
+            r = self.round = _Round(self._round_seq)
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if not self.workers or self._round_complete(r) or now >= deadline_at:
+                    break
+                self._cond.wait(min(1.0, deadline_at - now))
+            r.finished = True
+            self.round = None
+            return {"round": r.id, "complete": bool(self.workers) and self._round_complete(r),
+                    "workers": sorted(r.handed), "servers_reported": len(r.reported)}
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            self._expire(now)
+            return {
+                "replicas": self.replicas,
+                "rebalances": self.rebalances,
+                "round": self.round.id if self.round else None,
+                "workers": [{"worker": wid, "vantage": w.vantage, "shard": len(w.entries),
+                             "last_seen_sec": round(now - w.last_seen, 1)}
+                            for wid, w in sorted(self.workers.items())],
+            }
+
+
+# -------------------- worker side --------------------
+def _post(url: str, payload: dict, token: str = "", timeout: float = 10.0) -> dict:
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST",
+                                 headers={"Content-Type": "application/json"})
+    if token:
+        req.add_header("X-Cluster-Token", token)
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8") or "{}")
+
+
+def _run_todo(base: str, wid: str, vantage: str, round_id: int, todo, scan, token: str):
+    buf, lock, finished = [], threading.Lock(), threading.Event()
+
+    def on_result(d):
+        with lock:
+            buf.append(d)
+
+    def flush(done=False):
+        with lock:
+            batch = buf[:]
+            del buf[:]
+        try:
+            _post(base + "/worker/results", {"worker": wid, "vantage": vantage, "round": round_id,
+                                             "results": batch, "done": done}, token)
+        except (OSError, ValueError):
+            with lock:
+                buf[:0] = batch   # keep them for the next flush
+            raise
+
+    def flusher():
+        while not finished.wait(RESULT_FLUSH_SEC):
+            try:
+                flush()
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Could not send results: {e}", flush=True)
+
+    t = threading.Thread(target=flusher, name="worker-flush", daemon=True)
+    t.start()
+    started = time.time()
+    try:
+        scan(todo, on_result)
+    finally:
+        finished.set()
+        t.join()
+    for attempt in range(3):
+        try:
+            flush(done=True)
+            break
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Could not send results: {e}", flush=True)
+            time.sleep(WORKER_RETRY_SEC)
+    print(f"[INFO] Round {round_id}: {len(todo)} servers in {time.time() - started:.1f}s", flush=True)
+
+
+def run_worker(base: str, vantage: str, wid: str, scan, token: str = "", stop: threading.Event | None = None):
+    """Worker loop; `scan(entries, on_result)` runs one scan with the normal engine."""
+    base = base.rstrip("/")
+    stop = stop or threading.Event()
+    version = None
+    print(f"[INFO] Worker {wid} ({vantage}) polling {base}", flush=True)
+    while not stop.is_set():
+        try:
+            resp = _post(base + "/worker/poll", {"worker": wid, "vantage": vantage, "have": version}, token)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Coordinator unreachable: {e}", flush=True)
+            stop.wait(WORKER_RETRY_SEC)
+            continue
+        if resp.get("entries") is not None:
+            version = resp["shard_version"]
+            print(f"[INFO] Shard v{version}: {len(resp['entries'])} servers", flush=True)
+        if resp.get("todo") is not None:
+            _run_todo(base, wid, vantage, resp["round"], [tuple(e) for e in resp["todo"]], scan, token)
+            continue   # poll again right away: a rebalance may have handed us more
+        stop.wait(resp.get("poll_sec", WORKER_POLL_SEC))
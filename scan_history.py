@@ -0,0 +1,268 @@
+# scan_history.py
+# Persistent scan history in SQLite (stdlib only), sized for a scheduler running around the clock:
+# - raw samples keyed (server, ts) in WITHOUT ROWID tables -> a server's time range is one index walk
+# - minute and hour rollups maintained on insert (UPSERT) for exactly the raw rows that were
+#   inserted, so long ranges never touch raw rows and the two never disagree
+# - one writer thread batches inserts into a transaction every HISTORY_FLUSH_SEC; WAL lets
+#   readers (web_view history endpoints) run while it writes
+# - retention per resolution; pruning walks each server's key range, never the whole table
+import queue
+import sqlite3
+import threading
+import time
+
+import scan_metrics
+
+HISTORY_FLUSH_SEC = 2.0
+HISTORY_RAW_DAYS = 3         # retention of individual samples
+HISTORY_1M_DAYS = 30         # retention of minute rollups
+HISTORY_1H_DAYS = 730        # retention of hour rollups
+HISTORY_PRUNE_SEC = 3600.0   # how often the writer enforces retention
+
+ROLLUPS = {"1m": 60, "1h": 3600}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, name TEXT);
+CREATE TABLE IF NOT EXISTS maps (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS samples (
+    server_id INTEGER NOT NULL, ts INTEGER NOT NULL,
+    online INTEGER NOT NULL, players INTEGER, max_players INTEGER,
+    ping_ms INTEGER, jitter_ms INTEGER, map_id INTEGER,
+    PRIMARY KEY (server_id, ts)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{res} (
+    server_id INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL, online_n INTEGER NOT NULL, full_n INTEGER NOT NULL,
+    players_sum INTEGER NOT NULL, players_max INTEGER,
+    ping_n INTEGER NOT NULL, ping_sum INTEGER NOT NULL, ping_min INTEGER,
+    PRIMARY KEY (server_id, bucket)
+) WITHOUT ROWID;
+"""
+
+# a list label change renames the server; results without a name leave it alone
+SERVER_UPSERT = """
+INSERT INTO servers (key, name) VALUES (?, ?)
+ON CONFLICT (key) DO UPDATE SET name = excluded.name
+WHERE excluded.name IS NOT NULL AND name IS NOT excluded.name
+"""
+
+# samples are keyed by the second; a rollup only counts the rows this actually inserted
+SAMPLE_INSERT = "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (server_id, ts) DO NOTHING"
+
+# NULL-safe min/max: SQLite's two-argument min()/max() return NULL if either side is NULL
+ROLLUP_UPSERT = """
+INSERT INTO rollup_{res} (server_id, bucket, n, online_n, full_n, players_sum, players_max, ping_n, ping_sum, ping_min)
+VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (server_id, bucket) DO UPDATE SET
+    n = n + 1,
+    online_n = online_n + excluded.online_n,
+    full_n = full_n + excluded.full_n,
+    players_sum = players_sum + excluded.players_sum,
+    players_max = max(coalesce(players_max, excluded.players_max), coalesce(excluded.players_max, players_max)),
+    ping_n = ping_n + excluded.ping_n,
+    ping_sum = ping_sum + excluded.ping_sum,
+    ping_min = min(coalesce(ping_min, excluded.ping_min), coalesce(excluded.ping_min, ping_min))
+"""
+
+
+def _int(v):
+    try:
+        return None if v is None or v == "" else int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class HistoryStore:
+    """Append-only history of query_servers results with automatic rollups and retention.
+
+    record() only enqueues; a writer thread owns the write connection. Queries open their
+    own read connection, so they can run from any Flask thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._q: queue.Queue = queue.Queue()
+        self._closed = threading.Event()
+        self._ids: dict[str, tuple[int, str | None]] = {}   # key -> (id, name as stored)
+        self._map_ids: dict[str, int] = {}
+        self.written = 0
+        self.duplicates = 0      # samples dropped: the server already has one in that second
+        db = self._connect()
+        db.executescript(SCHEMA + "".join(ROLLUP_SCHEMA.format(res=r) for r in ROLLUPS))
+        db.close()
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # ---- writing ----
+    def record(self, results, ts: float | None = None):
+        """Queue scan results (query_servers dicts); stale carry-overs are not history."""
+        ts = int(time.time() if ts is None else ts)
+        batch = [d for d in results if not d.get("stale")]
+        if batch:
+            self._q.put((ts, batch))
+
+    def close(self):
+        self._closed.set()
+        self._writer.join(timeout=10)
+
+    def _run(self):
+        db = self._connect()
+        next_prune = time.monotonic()
+        while True:
+            items = []
+            try:
+                items.append(self._q.get(timeout=HISTORY_FLUSH_SEC))
+                while True:
+                    items.append(self._q.get_nowait())
+            except queue.Empty:
+                pass
+            if items:
+                try:
+                    with db:
+                        for ts, batch in items:
+                            self._write(db, ts, batch)
+                except sqlite3.Error as e:
+                    print(f"[WARN] History write failed: {e}", flush=True)
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + HISTORY_PRUNE_SEC
+                try:
+                    self.prune(db)
+                except sqlite3.Error as e:
+                    print(f"[WARN] History prune failed: {e}", flush=True)
+            if self._closed.is_set() and self._q.empty():
+                break
+        db.close()
+
+    def _server_id(self, db, key: str, name: str | None) -> int:
+        hit = self._ids.get(key)
+        if hit is not None and (name is None or hit[1] == name):
+            return hit[0]
+        db.execute(SERVER_UPSERT, (key, name))
+        sid, name = db.execute("SELECT id, name FROM servers WHERE key = ?", (key,)).fetchone()
+        self._ids[key] = (sid, name)
+        return sid
+
+    def _map_id(self, db, name: str | None) -> int | None:
+        if not name:
+            return None
+        mid = self._map_ids.get(name)
+        if mid is None:
+            db.execute("INSERT INTO maps (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (name,))
+            mid = self._map_ids[name] = db.execute("SELECT id FROM maps WHERE name = ?", (name,)).fetchone()[0]
+        return mid
+
+    def _write(self, db, ts: int, batch: list[dict]):
+        rollups = {r: [] for r in ROLLUPS}
+        written = 0
+        for d in batch:
+            sid = self._server_id(db, d["ip"], d.get("name"))
+            online = 1 if d.get("online") else 0
+            players, mx, ping = _int(d.get("player_count")), _int(d.get("max_players")), _int(d.get("ping_ms"))
+            full = 1 if online and players is not None and mx and players >= mx else 0
+            cur = db.execute(SAMPLE_INSERT, (sid, ts, online, players, mx, ping, _int(d.get("jitter_ms")),
+                                             self._map_id(db, d.get("map"))))
+            if cur.rowcount != 1:
+                # second sample of this server within the same second (e.g. scheduler + full scan):
+                # the first one stands
+                self.duplicates += 1
+                scan_metrics.inc("history_duplicates_total")
+                continue
+            written += 1
+            for res, width in ROLLUPS.items():
+                rollups[res].append((sid, ts - ts % width, online, full, players or 0,
+                                     players, 1 if ping is not None else 0, ping or 0, ping))
+        for res, rows in rollups.items():
+            db.executemany(ROLLUP_UPSERT.format(res=res), rows)
+        self.written += written
+
+    def prune(self, db=None):
+        """Drop rows past their resolution's retention (walks each server's key range)."""
+        own = db is None
+        db = self._connect() if own else db
+        now = int(time.time())
+        cutoffs = [("samples", "ts", now - HISTORY_RAW_DAYS * 86400),
+                   ("rollup_1m", "bucket", now - HISTORY_1M_DAYS * 86400),
+                   ("rollup_1h", "bucket", now - HISTORY_1H_DAYS * 86400)]
+        ids = [r[0] for r in db.execute("SELECT id FROM servers")]
+        with db:
+            for table, col, cutoff in cutoffs:
+                db.executemany(f"DELETE FROM {table} WHERE server_id = ? AND {col} < ?",
+                               [(sid, cutoff) for sid in ids])
+        if own:
+            db.close()
+
+    # ---- reading ----
+    def servers(self) -> list[dict]:
+        db = self._connect()
+        try:
+            rows = db.execute("""SELECT s.key, s.name, max(h.bucket), sum(h.n)
+                                 FROM servers s LEFT JOIN rollup_1h h ON h.server_id = s.id
+                                 GROUP BY s.id ORDER BY s.key""").fetchall()
+        finally:
+            db.close()
+        return [{"ip": k, "name": nm, "last_hour": last, "samples": n or 0} for (k, nm, last, n) in rows]
+
+    def history(self, key: str, since: float, until: float | None = None, resolution: str = "auto") -> dict:
+        """Points for one server between `since` and `until` (unix seconds).
+
+        resolution "auto" picks raw for spans up to 12 h, minutes up to 7 days, hours beyond.
+        """
+        until = int(time.time() if until is None else until)
+        since = int(since)
+        if resolution == "auto":
+            span = until - since
+            resolution = "raw" if span <= 12 * 3600 else ("1m" if span <= 7 * 86400 else "1h")
+        db = self._connect()
+        try:
+            row = db.execute("SELECT id FROM servers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return {"ip": key, "resolution": resolution, "points": []}
+            if resolution == "raw":
+                cur = db.execute("""SELECT s.ts, s.online, s.players, s.max_players, s.ping_ms, s.jitter_ms, m.name
+                                    FROM samples s LEFT JOIN maps m ON m.id = s.map_id
+                                    WHERE s.server_id = ? AND s.ts BETWEEN ? AND ? ORDER BY s.ts""",
+                                 (row[0], since, until))
+                points = [{"t": t, "online": bool(on), "players": pl, "max_players": mx,
+                           "ping_ms": pg, "jitter_ms": jt, "map": mp}
+                          for (t, on, pl, mx, pg, jt, mp) in cur]
+            elif resolution in ROLLUPS:
+                cur = db.execute(f"""SELECT bucket, n, online_n, full_n, players_sum, players_max, ping_n, ping_sum, ping_min
+                                     FROM rollup_{resolution}
+                                     WHERE server_id = ? AND bucket BETWEEN ? AND ? ORDER BY bucket""",
+                                 (row[0], since - ROLLUPS[resolution], until))
+                points = [{"t": b, "samples": n, "online": round(on / n, 3), "full": round(fl / n, 3),
+                           "players_avg": round(ps / on, 1) if on else None, "players_max": pm,
+                           "ping_min": pmin, "ping_avg": round(psum / pn, 1) if pn else None}
+                          for (b, n, on, fl, ps, pm, pn, psum, pmin) in cur]
+            else:
+                raise ValueError(f"unknown resolution {resolution!r}")
+        finally:
+            db.close()
+        return {"ip": key, "resolution": resolution, "points": points}
+
+    def profile(self, key: str, days: int = 28) -> dict:
+        """Hour-of-week profile (local time) from hour rollups: when is the server busy / full."""
+        db = self._connect()
+        try:
+            cur = db.execute("""SELECT CAST(strftime('%w', h.bucket, 'unixepoch', 'localtime') AS INTEGER),
+                                       CAST(strftime('%H', h.bucket, 'unixepoch', 'localtime') AS INTEGER),
+                                       sum(h.n), sum(h.online_n), sum(h.full_n), sum(h.players_sum)
+                                FROM rollup_1h h JOIN servers s ON s.id = h.server_id
+                                WHERE s.key = ? AND h.bucket >= ?
+                                GROUP BY 1, 2 ORDER BY 1, 2""",
+                             (key, int(time.time()) - days * 86400))
+            cells = [{"weekday": wd, "hour": hr, "samples": n, "online": round(on / n, 3),
+                      "full": round(fl / n, 3), "players_avg": round(ps / on, 1) if on else None}
+                     for (wd, hr, n, on, fl, ps) in cur]
+        finally:
+            db.close()
+        return {"ip": key, "days": days, "cells": cells}
@@ -0,0 +1,168 @@
+# scan_metrics.py
+# Process-wide counters and histograms for the scanner (no prometheus_client dependency):
+# - query_servers.py records per-phase timings and probe outcomes into REGISTRY
+# - render() produces the Prometheus text exposition format (web_view.py serves it at /metrics)
+# - snapshot() + summarize() turn two points in time into a per-scan summary for /status
+import bisect
+import math
+import threading
+
+# seconds; covers LAN RTTs up to whole-scan durations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15,
+                   0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "scan_duration_seconds": "Wall time of a full scan",
+    "scans_total": "Full scans finished, by engine",
+    "server_query_seconds": "Time from the start of a server's query to its result",
+    "query_phase_seconds": "Time spent per query phase (info, icmp_wait, fallback)",
+    "queue_wait_seconds": "Time a server query waited for a worker thread / inflight slot",
+    "a2s_rtt_seconds": "Round-trip time of successful A2S_INFO requests",
+    "a2s_requests_total": "A2S_INFO requests by result (ok, timeout, error)",
+    "icmp_rtt_seconds": "Round-trip time of answered ICMP echoes",
+    "icmp_probes_total": "ICMP echoes by result (ok, fail)",
+    "a2s_fallback_total": "Servers whose ping came from A2S because ICMP got no reply",
+    "servers_total": "Server query outcomes (online, offline, skipped)",
+    "dns_lookups_total": "Host name lookups by result (ok, fail); cached answers are not counted",
+    "dns_lookup_seconds": "Duration of host name lookups",
+    "send_queue_delay_seconds": "Time a packet waited for the send pacer, by kind (a2s, icmp)",
+    "master_pages_total": "Master server reply pages received during discovery",
+    "discovery_probes_total": "Discovery INFO pre-probes by result (matched, other_map, no_reply)",
+    "cluster_results_dropped_total": "Worker results rejected by the coordinator (stale_round, not_in_shard, not_listed)",
+    "details_requests_total": "A2S_PLAYER / A2S_RULES requests for server details, by kind and result",
+    "history_duplicates_total": "History samples dropped because the server already had one in that second",
+}
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        # name -> label key -> [bucket counts..., +Inf count, sum]
+        self._hists: dict[str, dict[tuple, list]] = {}
+
+    def inc(self, name: str, n: float = 1, **labels):
+        k = _key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[k] = series.get(k, 0) + n
+
+    def observe(self, name: str, value: float, **labels):
+        k = _key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            h = self._hists.setdefault(name, {}).get(k)
+            if h is None:
+                h = self._hists[name][k] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {n: dict(s) for n, s in self._counters.items()},
+                "hists": {n: {k: list(h) for k, h in s.items()} for n, s in self._hists.items()},
+            }
+
+    # ---- Prometheus text format ----
+    def render(self, prefix: str = "cs2ze_") -> str:
+        snap = self.snapshot()
+        out = []
+        for name in sorted(snap["counters"]):
+            full = prefix + name
+            out.append(f"# HELP {full} {HELP.get(name, name)}")
+            out.append(f"# TYPE {full} counter")
+            for k, v in sorted(snap["counters"][name].items()):
+                out.append(f"{full}{_fmt_labels(k)} {_fmt_num(v)}")
+        for name in sorted(snap["hists"]):
+            full = prefix + name
+            out.append(f"# HELP {full} {HELP.get(name, name)}")
+            out.append(f"# TYPE {full} histogram")
+            for k, h in sorted(snap["hists"][name].items()):
+                cum = 0
+                for le, c in zip(self.buckets, h):
+                    cum += c
+                    out.append(f"{full}_bucket{_fmt_labels(k + (('le', _fmt_num(le)),))} {cum}")
+                cum += h[len(self.buckets)]
+                out.append(f"{full}_bucket{_fmt_labels(k + (('le', '+Inf'),))} {cum}")
+                out.append(f"{full}_sum{_fmt_labels(k)} {_fmt_num(h[-1])}")
+                out.append(f"{full}_count{_fmt_labels(k)} {cum}")
+        return "\n".join(out) + "\n"
+
+    # ---- per-scan summary ----
+    def summarize(self, before: dict, after: dict | None = None) -> dict:
+        """Difference between two snapshots as plain JSON: counters and histogram count/mean/p50/p95 (ms).
+
+        Percentiles are bucket estimates. Anything recorded in between is included
+        (e.g. scheduler probes overlapping a scan).
+        """
+        after = self.snapshot() if after is None else after
+        out = {"counters": {}, "timings_ms": {}}
+        for name, series in after["counters"].items():
+            old = before["counters"].get(name, {})
+            for k, v in series.items():
+                d = v - old.get(k, 0)
+                if d:
+                    out["counters"][_flat_name(name, k)] = d
+        for name, series in after["hists"].items():
+            old = before["hists"].get(name, {})
+            for k, h in series.items():
+                prev = old.get(k)
+                diff = h if prev is None else [a - b for a, b in zip(h, prev)]
+                count = sum(diff[:-1])
+                if not count:
+                    continue
+                out["timings_ms"][_flat_name(name, k)] = {
+                    "count": count,
+                    "mean": round(diff[-1] / count * 1000, 1),
+                    "p50": _ms(self._quantile(diff, 0.50)),
+                    "p95": _ms(self._quantile(diff, 0.95)),
+                }
+        return out
+
+    def _quantile(self, h: list, q: float) -> float | None:
+        """Linear interpolation inside the bucket holding the q-th observation (like histogram_quantile)."""
+        counts = h[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cum, lower = 0, 0.0
+        for i, c in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else math.inf
+            if c and cum + c >= rank:
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - cum) / c
+            cum += c
+            lower = upper
+        return lower
+
+
+def _flat_name(name: str, k: tuple) -> str:
+    return name + "".join(f".{v}" for _l, v in k)
+
+
+def _ms(v):
+    return None if v is None else round(v * 1000, 1)
+
+
+def _fmt_labels(k: tuple) -> str:
+    if not k:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{l}="{esc(v)}"' for l, v in k) + "}"
+
+
+def _fmt_num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
@@ -0,0 +1,63 @@
+# send_pacer.py
+# Global packet pacing for query_servers.py: every A2S and ICMP send takes a token first.
+# - token bucket: `rate` packets/second sustained, `burst` packets at once after idle time
+# - non-blocking: reserve() returns how long to hold the packet, so the event loop and the
+#   ICMP reader thread schedule the send instead of sleeping
+# - senders stamp their RTT clock when the packet actually leaves, so our own queueing
+#   never shows up as server latency
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket handing out send slots.
+
+    Tokens may go negative: each reservation queues behind the ones already made, so
+    packets leave at `rate` per second in reservation order. rate <= 0 disables pacing.
+    `observer(kind, delay_s)` is called for every reservation (metrics hook). All kinds
+    share one budget; `clock` (seconds, monotonic) is replaceable for tests.
+    """
+
+    def __init__(self, rate: float, burst: int, observer=None, clock=time.perf_counter):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.observer = observer
+        self.clock = clock
+        self._tokens = float(self.burst)
+        self._stamp = clock()
+        self._lock = threading.Lock()
+        self.reserved = 0
+        self.delayed = 0
+        self.delay_sum = 0.0
+        self.delay_max = 0.0
+
+    def reserve(self, kind: str = "") -> float:
+        """Take one token; return seconds the caller must wait before sending (0.0 = now)."""
+        if self.rate <= 0:
+            delay = 0.0
+        else:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                self._tokens -= 1
+                delay = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+                self.reserved += 1
+                if delay > 0:
+                    self.delayed += 1
+                    self.delay_sum += delay
+                    self.delay_max = max(self.delay_max, delay)
+        if self.observer is not None:
+            self.observer(kind, delay)
+        return delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "reserved": self.reserved,
+                "delayed": self.delayed,
+                "mean_delay_ms": round(self.delay_sum / self.delayed * 1000, 1) if self.delayed else 0.0,
+                "max_delay_ms": round(self.delay_max * 1000, 1),
+            }
@@ -0,0 +1,102 @@
+# server_details.py
+# On-demand A2S_PLAYER / A2S_RULES for single servers (the scan itself only sends A2S_INFO):
+# - requests go over the scanner's shared A2STransport, which remembers each server's challenge;
+#   the first request of a pair learns it, the second one goes out with it and skips a round trip
+# - DetailCache keeps players and rules under separate TTLs (the player list moves all the time,
+#   rules hardly ever); a cache hit costs no packets, failures are not cached
+# - callers decide what gets enriched: web_view asks for the server the user opens, the resident
+#   Scanner refreshes servers whose map just changed (query_servers.DETAILS_ON_MAP_CHANGE)
+import time
+import asyncio
+import threading
+
+import scan_metrics
+
+PLAYERS_TTL = 15.0      # seconds a player list is served from the cache
+RULES_TTL = 600.0       # seconds for server rules (cvars); a map change drops them early
+DETAILS_TIMEOUT = 2.0   # per request, challenge round trip included
+KINDS = ("players", "rules")
+TTLS = {"players": PLAYERS_TTL, "rules": RULES_TTL}
+
+
+class DetailCache:
+    """Thread-safe (server key, kind) -> (fetched_at, value) with a TTL per kind."""
+
+    def __init__(self, ttls: dict | None = None):
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self._lock = threading.Lock()
+        self._data: dict[tuple[str, str], tuple[float, object]] = {}
+
+    def get(self, key: str, kind: str, now: float | None = None):
+        """(fetched_at, value) while fresh, else None."""
+        now = time.time() if now is None else now
+        with self._lock:
+            hit = self._data.get((key, kind))
+        if hit is None or now - hit[0] > self.ttls.get(kind, 0.0):
+            return None
+        return hit
+
+    def put(self, key: str, kind: str, value, now: float | None = None):
+        with self._lock:
+            self._data[(key, kind)] = (time.time() if now is None else now, value)
+
+    def invalidate(self, key: str, kinds=KINDS):
+        with self._lock:
+            for kind in kinds:
+                self._data.pop((key, kind), None)
+
+    def forget(self, keys):
+        keys = set(keys)
+        with self._lock:
+            for k in [k for k in self._data if k[0] in keys]:
+                del self._data[k]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def _players_json(players) -> list[dict]:
+    out = [{"name": p.name, "score": p.score, "duration_sec": int(p.duration)} for p in players]
+    out.sort(key=lambda p: (-p["score"], -p["duration_sec"]))
+    return out
+
+
+def _rules_json(rules) -> dict:
+    return {str(k): str(v) for k, v in sorted(rules.items())}
+
+
+async def fetch_details(transport, key: str, address: tuple[str, int], cache: DetailCache,
+                        kinds=KINDS, timeout: float = DETAILS_TIMEOUT, force: bool = False) -> dict:
+    """Players and/or rules of one server (`address` numeric), from `cache` when still fresh.
+
+    Returns {kind: {"value", "age_sec", "error"}}; `force` skips the cache.
+    """
+    now = time.time()
+    out, todo = {}, []
+    for kind in kinds:
+        hit = None if force else cache.get(key, kind, now)
+        if hit is None:
+            todo.append(kind)
+        else:
+            out[kind] = {"value": hit[1], "age_sec": round(now - hit[0], 1), "error": None}
+
+    async def one(kind):
+        try:
+            resp = await transport.request(address, kind, timeout)
+        except Exception as e:
+            scan_metrics.inc("details_requests_total", kind=kind, result="fail")
+            out[kind] = {"value": None, "age_sec": None, "error": f"{type(e).__name__}: {e}"}
+            return
+        scan_metrics.inc("details_requests_total", kind=kind, result="ok")
+        value = _players_json(resp) if kind == "players" else _rules_json(resp)
+        cache.put(key, kind, value)
+        out[kind] = {"value": value, "age_sec": 0.0, "error": None}
+
+    if todo:
+        rest = todo
+        if len(todo) > 1 and not transport.knows_challenge(address):
+            await one(todo[0])   # teaches the transport the challenge the others reuse
+            rest = todo[1:]
+        await asyncio.gather(*(one(kind) for kind in rest))
+    return {kind: out[kind] for kind in kinds}
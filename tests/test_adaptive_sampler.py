@@ -0,0 +1,48 @@
+from query_servers import SAMPLE_TOLERANCE_MS, AdaptiveSampler
+
+
+def _run(sampler, rounds):
+    """Feed successive rounds; returns how many probes each next_round() asked for."""
+    asked = []
+    it = iter(rounds)
+    while True:
+        n = sampler.next_round()
+        asked.append(n)
+        if not n:
+            return asked
+        sampler.add(next(it)[:n])
+
+
+def test_tight_first_round_stops():
+    s = AdaptiveSampler(first=3, cap=9)
+    assert _run(s, [[20.0, 20.5, 21.0]]) == [3, 0]
+    assert s.sent == 3
+
+
+def test_noisy_server_gets_more_probes_until_stable():
+    s = AdaptiveSampler(first=3, cap=9)
+    rounds = [[20.0, 80.0, 60.0], [21.0], [22.0], [20.5], [21.5]]
+    asked = _run(s, rounds)
+    assert asked[0] == 3 and asked[-1] == 0
+    assert all(n == 1 for n in asked[1:-1])
+    assert 3 < s.sent < 9
+
+
+def test_cap_is_respected():
+    s = AdaptiveSampler(first=3, cap=6)
+    # min keeps dropping by more than the tolerance, so it never looks converged
+    rounds = [[300.0, 200.0, 250.0]] + [[200.0 - 10 * SAMPLE_TOLERANCE_MS * i] for i in range(1, 10)]
+    _run(s, rounds)
+    assert s.sent == 6
+
+
+def test_no_reply_in_first_round_ends_sampling():
+    s = AdaptiveSampler(first=3, cap=9)
+    assert _run(s, [[None, None, None]]) == [3, 0]
+
+
+def test_existing_samples_count_toward_the_first_round():
+    s = AdaptiveSampler(first=3, cap=9, have=[(20.0, "x")], key=lambda v: v[0])
+    assert s.next_round() == 2
+    s.add([(20.2, "y"), (20.4, "z")])
+    assert s.next_round() == 0
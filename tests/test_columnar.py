@@ -0,0 +1,81 @@
+import gzip
+import json
+import random
+
+import pytest
+
+import columnar
+
+
+def _rows(seed, n=200):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        cur, mx = rng.choice([(None, None), (0, 64), (rng.randint(0, 64), 64), (None, 32), (5, None)])
+        rows.append({
+            "ip": f"10.1.{i // 250}.{i % 250}:27015",
+            "name": rng.choice(["GFL | ZE", "Mapeadores", "僵尸逃跑", "", "quote \"q\""]),
+            "online": rng.choice([True, False]),
+            "player": "" if cur is None and mx is None else f"{'' if cur is None else cur}/{'' if mx is None else mx}",
+            "map": rng.choice(["ze_mako_reactor_v5", "ze_ffvii_temple", "", "ze_lotr_minas_tirith"]),
+            "ping_ms": rng.choice([None, rng.randint(1, 300)]),
+            "jitter_ms": rng.choice([None, rng.randint(0, 30)]),
+            "ping_window": rng.choice([None, {"n": 40, "min": 10.0, "p50": 12.5, "p95": 20.0, "p99": 31.2}]),
+            "vantage_ping": rng.choice([None, {"eu": 40, "us": 120}]),
+            "ping_method": rng.choice(["ICMP", "A2S", ""]),
+            "error": rng.choice(["", "timed out", "could not resolve: x"]),
+            "stale": rng.random() < 0.1,
+        })
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_round_trip(seed):
+    rows = _rows(seed)
+    body = json.loads(columnar.encode_rows(rows, header={"version": "v7", "data_time": "t"}))
+    assert body["format"] == columnar.FORMAT and body["n"] == len(rows)
+    assert body["version"] == "v7" and body["data_time"] == "t"
+    assert columnar.decode_rows(body) == rows
+
+
+def test_strings_are_dictionary_encoded():
+    rows = _rows(1, 500)
+    body = json.loads(columnar.encode_rows(rows))
+    for c in columnar.DICT_COLUMNS:
+        assert all(isinstance(v, int) for v in body["columns"][c])
+        assert len(body["dicts"][c]) == len({r[c] for r in rows})
+
+
+def test_csv_style_values_are_normalized():
+    # rows read back from the CSV carry strings
+    row = {"ip": "1.1.1.1:1", "name": None, "online": "True", "player": "12/64", "map": "ze_x",
+           "ping_ms": "45", "jitter_ms": "", "ping_method": "ICMP", "error": None, "stale": "false"}
+    out = columnar.decode_rows(json.loads(columnar.encode_rows([row])))[0]
+    assert out["online"] is True and out["stale"] is False
+    assert out["ping_ms"] == 45 and out["jitter_ms"] is None
+    assert out["name"] == "" and out["error"] == "" and out["player"] == "12/64"
+
+
+def test_empty():
+    body = json.loads(columnar.encode_rows([]))
+    assert body["n"] == 0 and columnar.decode_rows(body) == []
+
+
+def test_compress_round_trip():
+    raw = columnar.encode_rows(_rows(2))
+    assert gzip.decompress(columnar.compress(raw, "gzip")) == raw
+    assert columnar.compress(raw, "identity") is raw
+    with pytest.raises(ValueError):
+        columnar.compress(raw, "br")
+    if columnar.zstandard is not None:
+        assert columnar.zstandard.ZstdDecompressor().decompress(columnar.compress(raw, "zstd")) == raw
+
+
+def test_pick_coding():
+    http = pytest.importorskip("werkzeug.http")
+    parse = http.parse_accept_header
+    assert columnar.pick_coding(parse("gzip, deflate")) == "gzip"
+    assert columnar.pick_coding(parse("br")) == "identity"
+    assert columnar.pick_coding(parse("gzip;q=0")) == "identity"
+    expected = "zstd" if columnar.zstandard is not None else "gzip"
+    assert columnar.pick_coding(parse("zstd, gzip")) == expected
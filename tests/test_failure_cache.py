@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from query_servers import FailureCache, NEG_BACKOFF_BASE, NEG_BACKOFF_MAX, NEG_FAIL_THRESHOLD
+
+
+def _fail(cache, key, times, now):
+    for _ in range(times):
+        cache.record(key, ok=False, error="timed out", now=now)
+
+
+def test_below_threshold_stays_full():
+    cache = FailureCache()
+    _fail(cache, "a:1", NEG_FAIL_THRESHOLD - 1, now=100.0)
+    assert cache.mode("a:1", now=100.0) == "full"
+
+
+def test_backoff_skips_then_retries():
+    cache = FailureCache()
+    _fail(cache, "a:1", NEG_FAIL_THRESHOLD, now=100.0)
+    assert cache.mode("a:1", now=100.0) == "skip"
+    assert cache.mode("a:1", now=100.0 + NEG_BACKOFF_BASE - 0.001) == "skip"
+    assert cache.mode("a:1", now=100.0 + NEG_BACKOFF_BASE) == "retry"
+
+
+@pytest.mark.parametrize("extra", [1, 2, 5])
+def test_backoff_doubles_per_failure(extra):
+    cache = FailureCache()
+    _fail(cache, "a:1", NEG_FAIL_THRESHOLD + extra, now=0.0)
+    wait = min(NEG_BACKOFF_MAX, NEG_BACKOFF_BASE * 2 ** extra)
+    assert cache.mode("a:1", now=wait - 0.001) == "skip"
+    assert cache.mode("a:1", now=wait) == "retry"
+
+
+def test_backoff_is_capped():
+    cache = FailureCache()
+    _fail(cache, "a:1", NEG_FAIL_THRESHOLD + 40, now=0.0)
+    assert cache.mode("a:1", now=NEG_BACKOFF_MAX) == "retry"
+
+
+def test_success_clears_record():
+    cache = FailureCache()
+    _fail(cache, "a:1", NEG_FAIL_THRESHOLD + 3, now=0.0)
+    cache.record("a:1", ok=True, now=1.0)
+    assert cache.mode("a:1", now=1.0) == "full"
+    assert cache.describe("a:1", now=1.0) is None
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "health.json")
+    cache = FailureCache(path)
+    _fail(cache, "a:1", NEG_FAIL_THRESHOLD, now=100.0)
+    cache.save()
+    assert json.loads(open(path, encoding="utf-8").read())["a:1"]["fails"] == NEG_FAIL_THRESHOLD
+    again = FailureCache(path)
+    assert again.mode("a:1", now=100.0) == "skip"
+    assert f"failed {NEG_FAIL_THRESHOLD}x" in again.describe("a:1", now=100.0)
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "health.json"
+    path.write_text("not json", encoding="utf-8")
+    assert FailureCache(str(path)).mode("a:1") == "full"
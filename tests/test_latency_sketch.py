@@ -0,0 +1,89 @@
+import math
+import random
+
+import pytest
+
+from latency_sketch import SKETCH_ALPHA, SKETCH_MIN_VALUE, LatencyBook, LogSketch, RollingSketch
+
+QUANTILES = (0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0)
+
+
+def _exact(sorted_vals, q):
+    # the sketch's rank convention: the value at position floor(q * (n - 1))
+    return sorted_vals[math.floor(q * (len(sorted_vals) - 1))]
+
+
+def _within(est, exact, alpha=SKETCH_ALPHA):
+    return abs(est - exact) <= alpha * exact + 1e-9
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_quantiles_within_relative_error(seed):
+    rng = random.Random(seed)
+    # 20..200 ms fits in the bucket budget, so no bucket is ever merged
+    vals = [math.exp(rng.uniform(math.log(20), math.log(200))) for _ in range(5000)]
+    sk = LogSketch()
+    for v in vals:
+        sk.add(v)
+    assert len(sk.bins) <= sk.max_bins
+    vals.sort()
+    for q in QUANTILES:
+        assert _within(sk.quantile(q), _exact(vals, q)), q
+
+
+def test_collapsing_keeps_the_upper_tail_exact():
+    rng = random.Random(7)
+    vals = [rng.lognormvariate(math.log(40), 1.2) + 1 for _ in range(20000)]
+    sk = LogSketch(max_bins=64)
+    for v in vals:
+        sk.add(v)
+    assert len(sk.bins) <= 64
+    vals.sort()
+    # the lowest kept bucket holds everything folded into it; every bucket above it is untouched
+    floor = sk.gamma ** min(sk.bins)
+    checked = [q for q in (0.5, 0.9, 0.95, 0.99, 0.999) if _exact(vals, q) > floor]
+    assert 0.99 in checked
+    for q in checked:
+        assert _within(sk.quantile(q), _exact(vals, q)), q
+
+
+def test_merge_matches_a_single_sketch():
+    rng = random.Random(3)
+    vals = [rng.uniform(5, 300) for _ in range(3000)]
+    whole, a, b = LogSketch(), LogSketch(), LogSketch()
+    for i, v in enumerate(vals):
+        whole.add(v)
+        (a if i % 2 else b).add(v)
+    a.merge(b)
+    assert a.count == whole.count and a.bins == whole.bins
+    for q in QUANTILES:
+        assert a.quantile(q) == whole.quantile(q)
+
+
+def test_small_values_and_extremes():
+    sk = LogSketch()
+    assert sk.quantile(0.5) is None
+    for v in (SKETCH_MIN_VALUE / 2, 0.0, 10.0):
+        sk.add(v)
+    assert sk.quantile(0.0) == 0.0
+    assert sk.quantile(1.0) == 10.0
+
+
+def test_rolling_window_expires_whole_slots():
+    rs = RollingSketch(window=60, slots=6)
+    rs.add(100.0, now=0)
+    rs.add(10.0, now=55)
+    assert rs.window(now=59).count == 2
+    assert rs.window(now=61).count == 1
+    assert rs.summary(now=61)["min"] == 10.0
+    assert rs.summary(now=200) is None
+
+
+def test_latency_book_forget():
+    book = LatencyBook()
+    book.add("a:1", "ICMP", [10, 11, 12], now=0)
+    book.add("b:1", "A2S", [20], now=0)
+    assert book.count("a:1", "ICMP", now=0) == 3
+    book.forget(["a:1"])
+    assert book.count("a:1", "ICMP", now=0) == 0
+    assert book.summary("b:1", "A2S", now=0)["n"] == 1
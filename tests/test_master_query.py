@@ -0,0 +1,106 @@
+import asyncio
+import math
+import sys
+
+import pytest
+
+import a2s_transport
+import master_query
+from bench_scan import MASTER_ADDR, MASTER_PAGE_SIZE, FarmProcess
+from master_query import FIRST_SEED, MasterClient, decode_query, encode_query, encode_reply, parse_reply
+
+SERVERS = 600
+DEAD = SERVERS // 10     # the stand-in master also lists this many addresses nobody answers on
+
+needs_farm = pytest.mark.skipif(not sys.platform.startswith("linux"),
+                                reason="the fake farm binds 127.1.x.y, which only Linux routes by default")
+
+
+@pytest.fixture(scope="module")
+def farm():
+    with FarmProcess(SERVERS, hosts=SERVERS // 4, latency_ms=5.0, discover=True) as f:
+        yield f
+
+
+def _addr(key):
+    ip, port = key.rsplit(":", 1)
+    return ip, int(port)
+
+
+# ---- wire format ----
+def test_query_encoding():
+    packet = encode_query(("1.2.3.4", 27015), r"\appid\730\map\ze_*", region=3)
+    assert packet == b"\x31\x03" + b"1.2.3.4:27015\x00" + b"\\appid\\730\\map\\ze_*\x00"
+    assert decode_query(packet) == (3, ("1.2.3.4", 27015), r"\appid\730\map\ze_*")
+    assert encode_query(FIRST_SEED)[:2] == b"\x31\xff"
+    assert decode_query(encode_query(FIRST_SEED))[1] == FIRST_SEED
+
+
+def test_decode_query_rejects_other_packets():
+    with pytest.raises(ValueError):
+        decode_query(b"\xff\xff\xff\xffTSource Engine Query\x00")
+
+
+def test_reply_round_trip_with_terminator():
+    addrs = [("10.0.0.1", 27015), ("192.168.1.200", 65535), FIRST_SEED]
+    data = encode_reply(addrs)
+    assert data.startswith(master_query.REPLY_HEADER)
+    assert parse_reply(data) == addrs
+
+
+def test_truncated_reply_drops_the_partial_address():
+    data = encode_reply([("10.0.0.1", 27015), ("10.0.0.2", 27016)])
+    assert parse_reply(data[:-3]) == [("10.0.0.1", 27015)]
+    assert parse_reply(master_query.REPLY_HEADER) == []
+    with pytest.raises(ValueError):
+        parse_reply(b"\xff\xff\xff\xff\x49" + data[6:])
+
+
+# ---- against the stand-in master ----
+async def _all_pages(seeds):
+    client = await MasterClient(MASTER_ADDR, timeout=1.0).open()
+    page = client.page
+
+    async def recording_page(seed, *args):
+        seeds.append(seed)
+        return await page(seed, *args)
+    client.page = recording_page
+    try:
+        return [p async for p in client.pages(gap=0)]
+    finally:
+        client.close()
+
+
+@needs_farm
+def test_pages_follow_the_last_seen_address(farm):
+    seeds = []
+    pages = asyncio.run(_all_pages(seeds))
+    assert len(pages) == math.ceil((SERVERS + DEAD) / MASTER_PAGE_SIZE)
+    assert seeds == [FIRST_SEED] + [p[-1] for p in pages[:-1]]
+    flat = [a for p in pages for a in p]
+    assert FIRST_SEED not in flat                    # the terminator ends paging, it is not an address
+    assert len(flat) == len(set(flat)) == SERVERS + DEAD
+    assert {_addr(p["ip"]) for p in farm.profiles} <= set(flat)
+
+
+@needs_farm
+def test_discover_finds_exactly_the_unlisted_ze_servers(farm):
+    listed = farm.profiles[::2]
+    expected = {p["ip"] for p in farm.profiles[1::2] if p["map"].startswith(master_query.DISCOVERY_MAP_PREFIX)}
+    found = []
+
+    async def run():
+        transport = await a2s_transport.A2STransport().open()
+        try:
+            return await master_query.discover(transport, {p["ip"] for p in listed},
+                                               lambda ip, port, name: found.append(f"{ip}:{port}"),
+                                               master=MASTER_ADDR, timeout=0.5)
+        finally:
+            transport.close()
+
+    stats = asyncio.run(run())
+    assert stats["error"] is None
+    assert set(found) == expected and len(found) == len(expected)
+    assert stats["duplicates"] == len(listed)
+    assert stats["probed"] == SERVERS + DEAD - len(listed)
+    assert stats["answered"] == SERVERS - len(listed)
@@ -0,0 +1,121 @@
+import json
+import random
+
+import pytest
+
+from row_index import NUMERIC, SORT_KEYS, Query, RowIndex
+
+MAPS = ["ze_Mako_Reactor_v5", "ze_mako_reactor_v6", "ze_FFVII_Temple", "ze_lotr_minas_tirith",
+        "de_dust2", "ze_paranoid_rezurrection", ""]
+
+
+def _rows(seed, n=300):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        mx = rng.choice([None, 32, 64, 64])
+        cur = rng.choice([None, 0, rng.randint(0, 64)]) if mx else None
+        player = "" if cur is None and mx is None else f"{'' if cur is None else cur}/{mx or ''}"
+        rows.append({
+            "ip": f"10.0.{i // 200}.{i % 200}:27015",
+            "name": rng.choice(["GFL", "Mapeadores", "ZE #1", "", "nide"]) + f" {rng.randint(0, 9)}",
+            "online": rng.choice([True, False, "True", "", "false"]),
+            "player": player,
+            "map": rng.choice(MAPS),
+            "ping_ms": rng.choice([None, "", rng.randint(1, 250)]),
+            "jitter_ms": rng.choice([None, rng.randint(0, 20)]),
+        })
+    return rows
+
+
+def _num(v):
+    try:
+        return None if v in (None, "") else float(v)
+    except ValueError:
+        return None
+
+
+def _value(r, col):
+    cur, _, mx = str(r["player"]).partition("/")
+    cur, mx = _num(cur), _num(mx)
+    return {"players": cur, "max_players": mx, "free": None if cur is None or mx is None else mx - cur,
+            "ping": _num(r["ping_ms"]), "jitter": _num(r["jitter_ms"])}[col]
+
+
+def _brute(rows, q):
+    """Straight filter + sort over every row; the reference the indexes must agree with."""
+    def keep(r):
+        m = (r["map"] or "").lower()
+        if q.online and str(r["online"]).lower() not in ("true", "1", "yes"):
+            return False
+        if q.map_prefix and not m.startswith(q.map_prefix.lower()):
+            return False
+        if q.map_contains and q.map_contains.lower() not in m:
+            return False
+        for col, lo, hi in (("players", q.players_min, q.players_max), ("free", q.free_min, None),
+                            ("ping", None, q.ping_max)):
+            if lo is None and hi is None:
+                continue
+            v = _value(r, col)
+            if v is None or (lo is not None and v < lo) or (hi is not None and v > hi):
+                return False
+        return True
+
+    match = [r for r in rows if keep(r)]
+    desc, col = q.sort.startswith("-"), q.sort.lstrip("-")
+    if col in NUMERIC:
+        have = [r for r in match if _value(r, col) is not None]
+        have.sort(key=lambda r: (-_value(r, col) if desc else _value(r, col), r["ip"]))
+        ordered = have + sorted((r for r in match if _value(r, col) is None), key=lambda r: r["ip"])
+    else:
+        ordered = sorted(match, key=lambda r: (str(r[col] or "").lower(), r["ip"]), reverse=desc)
+    end = None if q.limit is None else q.offset + q.limit
+    return len(match), ordered[q.offset:end]
+
+
+def _random_query(rng):
+    return Query(
+        map_prefix=rng.choice(["", "", "ze_", "ZE_MAKO", "de_", "zz"]),
+        map_contains=rng.choice(["", "", "reactor", "TEMPLE", "_"]),
+        players_min=rng.choice([None, None, 0, 10, 40.5]),
+        players_max=rng.choice([None, None, 0, 30, 64]),
+        free_min=rng.choice([None, None, 1, 8]),
+        ping_max=rng.choice([None, None, 50, 120]),
+        online=rng.random() < 0.4,
+        sort=rng.choice(["", "-"]) + rng.choice(SORT_KEYS),
+        offset=rng.choice([0, 0, 5, 290]),
+        limit=rng.choice([None, 1, 10, 50]),
+    )
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_brute_force(seed):
+    rows = _rows(seed)
+    index = RowIndex(rows)
+    rng = random.Random(1000 + seed)
+    for _ in range(300):
+        q = _random_query(rng)
+        assert index.query(q) == _brute(rows, q), q
+
+
+def test_unfiltered_query_is_every_row():
+    rows = _rows(9)
+    total, page = RowIndex(rows).query(Query(sort="ip"))
+    assert total == len(rows)
+    assert [r["ip"] for r in page] == sorted(r["ip"] for r in rows)
+
+
+def test_page_json_is_memoized_and_carries_the_header():
+    rows = _rows(5)
+    index = RowIndex(rows, header={"version": "v1"})
+    q = Query(map_prefix="ze_", limit=10)
+    body = index.page_json(q)
+    assert index.page_json(q) is body
+    doc = json.loads(body)
+    total, page = _brute(rows, q)
+    assert doc["version"] == "v1" and doc["total"] == total and doc["rows"] == page
+
+
+def test_unknown_sort_key():
+    with pytest.raises(ValueError):
+        RowIndex(_rows(1, 5)).query(Query(sort="-bogus"))
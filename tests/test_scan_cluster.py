@@ -0,0 +1,65 @@
+from collections import Counter
+
+import pytest
+
+from scan_cluster import HashRing
+
+KEYS = [f"10.0.{i // 250}.{i % 250}:27015" for i in range(4000)]
+
+
+def _primaries(ring):
+    return {k: ring.owners(k)[0] for k in KEYS}
+
+
+def _members(n):
+    return {f"w{i}": f"site{i}" for i in range(n)}
+
+
+def test_every_key_has_one_primary_and_shards_are_even():
+    ring = HashRing(_members(4))
+    load = Counter(_primaries(ring).values())
+    assert set(load) == set(_members(4))
+    assert max(load.values()) < 2 * len(KEYS) / 4
+
+
+def test_owners_are_deterministic():
+    a, b = HashRing(_members(5)), HashRing(dict(reversed(list(_members(5).items()))))
+    assert _primaries(a) == _primaries(b)
+
+
+def test_adding_a_worker_only_moves_keys_to_it():
+    before = _primaries(HashRing(_members(4)))
+    after = _primaries(HashRing(_members(5)))
+    moved = [k for k in KEYS if before[k] != after[k]]
+    assert all(after[k] == "w4" for k in moved)
+    # about a fifth of the keys should move; all or none would mean the ring is not consistent
+    assert 0.1 * len(KEYS) < len(moved) < 0.35 * len(KEYS)
+
+
+def test_removing_a_worker_only_moves_its_keys():
+    before = _primaries(HashRing(_members(5)))
+    members = _members(5)
+    del members["w2"]
+    after = _primaries(HashRing(members))
+    for k in KEYS:
+        if before[k] != "w2":
+            assert after[k] == before[k]
+        else:
+            assert after[k] != "w2"
+
+
+def test_replicas_use_distinct_vantages():
+    members = {"a1": "eu", "a2": "eu", "b1": "us", "c1": "asia"}
+    ring = HashRing(members)
+    for k in KEYS[:500]:
+        owners = ring.owners(k, 3)
+        assert len(owners) == 3
+        assert len({members[w] for w in owners}) == 3
+    # only two vantages left: asking for more returns what exists
+    assert len(HashRing({"a1": "eu", "a2": "eu", "b1": "us"}).owners(KEYS[0], 3)) == 2
+
+
+@pytest.mark.parametrize("members", [{}, {"w0": "x"}])
+def test_degenerate_rings(members):
+    owners = HashRing(members).owners(KEYS[0])
+    assert owners == list(members)
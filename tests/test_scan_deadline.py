@@ -0,0 +1,63 @@
+import asyncio
+import sys
+
+import pytest
+
+import query_servers
+from bench_scan import FarmProcess
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"),
+                                reason="the fake farm binds 127.1.x.y, which only Linux routes by default")
+
+SLOW_MS = 300.0
+
+
+@pytest.fixture(scope="module")
+def slow_farm():
+    with FarmProcess(40, hosts=10, latency_ms=SLOW_MS) as farm:
+        yield farm
+
+
+@pytest.fixture(autouse=True)
+def _no_icmp(monkeypatch):
+    monkeypatch.setattr(query_servers, "ICMP_ENGINE", "off")
+
+
+def _entries(farm):
+    return [(ip, int(port), "slow") for ip, port in (p["ip"].rsplit(":", 1) for p in farm.profiles)]
+
+
+def _previous(entries):
+    prev = {}
+    for h, p, nm in entries:
+        r = query_servers._empty_result(h, p, nm)
+        r.update(online=True, player_count=10, max_players=64, map="ze_previous", ping_ms=42)
+        prev[r["ip"]] = r
+    return prev
+
+
+def _scan(engine, entries, deadline):
+    if engine == "threads":
+        return query_servers.scan_threads(entries, deadline=deadline)
+    return asyncio.run(query_servers.scan_async(entries, deadline=deadline))
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_servers_slower_than_the_deadline_keep_previous_values(slow_farm, engine):
+    entries = _entries(slow_farm)
+    previous = _previous(entries)
+    results = _scan(engine, entries, deadline=0.2)
+    assert results == []          # nothing answered in time, and nothing is reported offline
+    stale = query_servers.stale_results(entries, results, previous)
+    assert len(stale) == len(entries)
+    for d in stale:
+        assert d["stale"] is True
+        assert d["online"] is True and d["map"] == "ze_previous" and d["ping_ms"] == 42
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_servers_within_the_deadline_are_fresh(slow_farm, engine):
+    entries = _entries(slow_farm)
+    results = _scan(engine, entries, deadline=5.0)
+    assert len(results) == len(entries)
+    assert all(d["online"] and not d["stale"] for d in results)
@@ -0,0 +1,110 @@
+import sqlite3
+import time
+
+import pytest
+
+import scan_history
+from scan_history import HistoryStore
+
+
+def _result(key="1.1.1.1:27015", name="A", online=True, players=10, mx=64, ping=30, map_name="ze_a", **extra):
+    return {"ip": key, "name": name, "online": online, "player_count": players, "max_players": mx,
+            "ping_ms": ping, "jitter_ms": 1, "map": map_name, **extra}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = HistoryStore(str(tmp_path / "history.sqlite3"))
+    yield s
+    s.close()
+
+
+def _flush(store):
+    # close() drains the queue; reads open their own connection, so they still work afterwards
+    store.close()
+    return sqlite3.connect(store.path)
+
+
+def test_rename_updates_the_stored_name(store):
+    now = int(time.time())
+    store.record([_result(name="Old label")], ts=now - 2)
+    store.record([_result(name="New label")], ts=now - 1)
+    store.record([_result(name=None)], ts=now)
+    _flush(store)
+    assert [s["name"] for s in store.servers()] == ["New label"]
+
+
+def test_same_second_duplicates_are_dropped_and_counted(store):
+    now = int(time.time())
+    store.record([_result(ping=20)], ts=now)
+    store.record([_result(ping=90), _result(key="2.2.2.2:27015", ping=50)], ts=now)
+    db = _flush(store)
+    assert db.execute("SELECT count(*) FROM samples").fetchone()[0] == 2
+    assert db.execute("SELECT sum(n), sum(ping_sum) FROM rollup_1m").fetchone() == (2, 70)
+    assert store.written == 2 and store.duplicates == 1
+
+
+def test_record_skips_stale_carry_overs(store):
+    now = int(time.time())
+    store.record([_result(stale=True), _result(key="2.2.2.2:27015")], ts=now)
+    store.record([_result(stale=True)], ts=now + 1)
+    db = _flush(store)
+    keys = [k for (k,) in db.execute("SELECT s.key FROM samples x JOIN servers s ON s.id = x.server_id")]
+    assert keys == ["2.2.2.2:27015"]
+
+
+def test_rollup_values(store):
+    t = int(time.time()) // 60 * 60 - 60   # four samples inside the previous minute
+    store.record([_result(online=False, players=None, mx=None, ping=None, map_name=None)], ts=t)
+    store.record([_result(players=64, mx=64, ping=None)], ts=t + 1)   # full
+    store.record([_result(players=10, ping=30)], ts=t + 2)
+    store.record([_result(players=5, ping=20)], ts=t + 3)
+    db = _flush(store)
+    for res in ("1m", "1h"):
+        row = db.execute(f"SELECT n, online_n, full_n, players_sum, players_max, ping_n, ping_sum, ping_min "
+                         f"FROM rollup_{res}").fetchall()
+        # players_max / ping_min skip the NULLs of the offline and unpinged samples
+        assert row == [(4, 3, 1, 79, 64, 2, 50, 20)], res
+    point = store.history("1.1.1.1:27015", since=t, until=t + 60, resolution="1m")["points"][0]
+    assert point == {"t": t, "samples": 4, "online": 0.75, "full": 0.25, "players_avg": 26.3,
+                     "players_max": 64, "ping_min": 20, "ping_avg": 25.0}
+
+
+@pytest.mark.parametrize("span, resolution", [(3600, "raw"), (12 * 3600, "raw"), (2 * 86400, "1m"),
+                                              (7 * 86400, "1m"), (30 * 86400, "1h")])
+def test_history_picks_the_resolution_by_span(store, span, resolution):
+    now = int(time.time())
+    store.record([_result()], ts=now - 30)
+    _flush(store)
+    out = store.history("1.1.1.1:27015", since=now - span, until=now)
+    assert out["resolution"] == resolution
+    assert len(out["points"]) == 1
+
+
+def test_history_of_unknown_server_and_resolution(store):
+    now = int(time.time())
+    assert store.history("9.9.9.9:1", since=now - 60)["points"] == []
+    store.record([_result()], ts=now)
+    _flush(store)
+    with pytest.raises(ValueError):
+        store.history("1.1.1.1:27015", since=now - 60, resolution="5m")
+
+
+def test_prune_keeps_each_resolution_for_its_retention(store):
+    store.close()
+    now = int(time.time())
+    day = 86400
+    ages = {"fresh": 60, "raw_expired": scan_history.HISTORY_RAW_DAYS * day + 3600,
+            "1m_expired": scan_history.HISTORY_1M_DAYS * day + 3600,
+            "all_expired": scan_history.HISTORY_1H_DAYS * day + 2 * 3600}
+    db = store._connect()
+    with db:
+        for key, age in ages.items():
+            store._write(db, now - age, [_result(key=key)])
+    store.prune()
+    left = {res: {k for (k,) in db.execute(f"SELECT s.key FROM {table} x JOIN servers s ON s.id = x.server_id")}
+            for res, table in (("raw", "samples"), ("1m", "rollup_1m"), ("1h", "rollup_1h"))}
+    db.close()
+    assert left["raw"] == {"fresh"}
+    assert left["1m"] == {"fresh", "raw_expired"}
+    assert left["1h"] == {"fresh", "raw_expired", "1m_expired"}
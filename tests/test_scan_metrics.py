@@ -0,0 +1,48 @@
+import pytest
+
+from scan_metrics import Registry
+
+
+def test_counters_render_with_labels():
+    reg = Registry(buckets=(0.1, 1.0))
+    reg.inc("servers_total", result="online")
+    reg.inc("servers_total", 2, result="online")
+    reg.inc("servers_total", result="offline")
+    text = reg.render()
+    assert "# TYPE cs2ze_servers_total counter" in text
+    assert 'cs2ze_servers_total{result="online"} 3' in text
+    assert 'cs2ze_servers_total{result="offline"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = Registry(buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 2.0):
+        reg.observe("a2s_rtt_seconds", v)
+    lines = reg.render().splitlines()
+    assert 'cs2ze_a2s_rtt_seconds_bucket{le="0.1"} 2' in lines
+    assert 'cs2ze_a2s_rtt_seconds_bucket{le="1"} 3' in lines
+    assert 'cs2ze_a2s_rtt_seconds_bucket{le="+Inf"} 4' in lines
+    assert "cs2ze_a2s_rtt_seconds_count 4" in lines
+    assert "cs2ze_a2s_rtt_seconds_sum 2.65" in lines
+
+
+def test_label_values_are_escaped():
+    reg = Registry()
+    reg.inc("scans_total", engine='a"b\\c\nd')
+    assert 'cs2ze_scans_total{engine="a\\"b\\\\c\\nd"} 1' in reg.render()
+
+
+def test_summarize_reports_only_the_difference():
+    reg = Registry(buckets=(0.01, 0.1, 1.0))
+    reg.inc("servers_total", 5, result="online")
+    reg.observe("scan_duration_seconds", 0.5)
+    before = reg.snapshot()
+    reg.inc("servers_total", 2, result="online")
+    for _ in range(4):
+        reg.observe("scan_duration_seconds", 0.05)
+    out = reg.summarize(before)
+    assert out["counters"] == {"servers_total.online": 2}
+    t = out["timings_ms"]["scan_duration_seconds"]
+    assert t["count"] == 4
+    assert t["mean"] == pytest.approx(50.0)
+    assert 10.0 <= t["p50"] <= 100.0 and 10.0 <= t["p95"] <= 100.0
@@ -0,0 +1,73 @@
+import pytest
+
+from send_pacer import TokenBucket
+
+
+class Clock:
+    def __init__(self, t=1000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+def _bucket(rate=100.0, burst=5, **kw):
+    clock = Clock()
+    return TokenBucket(rate, burst, clock=clock, **kw), clock
+
+
+def test_burst_goes_out_at_once_then_queues_at_rate():
+    b, _clock = _bucket()
+    delays = [b.reserve("a2s") for _ in range(8)]
+    assert delays[:5] == [0.0] * 5
+    assert delays[5:] == pytest.approx([0.01, 0.02, 0.03])
+
+
+def test_refill_follows_the_clock():
+    b, clock = _bucket()
+    for _ in range(7):
+        b.reserve()                       # 5 from the burst, 2 queued: tokens at -2
+    clock.t += 0.05                       # +5 tokens
+    assert [b.reserve() for _ in range(3)] == pytest.approx([0.0, 0.0, 0.0], abs=1e-9)
+    assert b.reserve() == pytest.approx(0.01)
+
+
+def test_idle_time_refills_only_up_to_the_burst():
+    b, clock = _bucket(burst=3)
+    clock.t += 3600
+    delays = [b.reserve() for _ in range(5)]
+    assert delays[:3] == [0.0] * 3 and delays[3:] == pytest.approx([0.01, 0.02])
+
+
+def test_kinds_share_one_budget_and_are_reported():
+    seen = []
+    b, _clock = _bucket(burst=2, observer=lambda kind, delay: seen.append((kind, delay)))
+    b.reserve("a2s")
+    b.reserve("icmp")
+    b.reserve("icmp")
+    b.reserve("a2s")
+    assert [k for k, _d in seen] == ["a2s", "icmp", "icmp", "a2s"]
+    assert [d for _k, d in seen] == pytest.approx([0.0, 0.0, 0.01, 0.02])
+
+
+def test_queued_delay_shrinks_as_time_passes():
+    b, clock = _bucket(burst=1)
+    b.reserve()
+    assert b.reserve() == pytest.approx(0.01)
+    clock.t += 0.004
+    assert b.reserve() == pytest.approx(0.016)     # behind the previous one, minus the time gone by
+
+
+def test_disabled_pacer_never_delays():
+    b, _clock = _bucket(rate=0)
+    assert all(b.reserve() == 0.0 for _ in range(100))
+    assert b.stats()["reserved"] == 0
+
+
+def test_stats():
+    b, _clock = _bucket(burst=1)
+    for _ in range(3):
+        b.reserve()
+    st = b.stats()
+    assert st["reserved"] == 3 and st["delayed"] == 2
+    assert st["mean_delay_ms"] == pytest.approx(15.0) and st["max_delay_ms"] == pytest.approx(20.0)
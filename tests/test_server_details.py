@@ -0,0 +1,124 @@
+import asyncio
+import sys
+import time
+
+import pytest
+
+import a2s_transport
+import server_details
+from bench_scan import FarmProcess
+from server_details import DetailCache, fetch_details
+
+needs_farm = pytest.mark.skipif(not sys.platform.startswith("linux"),
+                                reason="the fake farm binds 127.1.x.y, which only Linux routes by default")
+TIMEOUT = 0.5
+
+
+@pytest.fixture(scope="module")
+def farm():
+    with FarmProcess(10, hosts=5, latency_ms=5.0) as f:
+        yield f
+
+
+def _pick(farm, rules):
+    p = next(p for p in farm.profiles if p["rules"] == rules)
+    ip, port = p["ip"].rsplit(":", 1)
+    return p, (ip, int(port))
+
+
+def _run(steps):
+    """Run `steps(transport)` on a fresh loop with an open shared transport."""
+    async def main():
+        transport = await a2s_transport.A2STransport().open()
+        try:
+            return await steps(transport)
+        finally:
+            transport.close()
+    return asyncio.run(main())
+
+
+# ---- DetailCache ----
+def test_cache_hit_until_the_kinds_ttl():
+    cache = DetailCache({"players": 15.0, "rules": 600.0})
+    cache.put("a:1", "players", ["p"], now=100.0)
+    cache.put("a:1", "rules", {"r": "1"}, now=100.0)
+    assert cache.get("a:1", "players", now=115.0) == (100.0, ["p"])
+    assert cache.get("a:1", "players", now=115.1) is None
+    assert cache.get("a:1", "rules", now=699.0) == (100.0, {"r": "1"})
+    assert cache.get("b:1", "players", now=100.0) is None
+
+
+def test_cache_invalidate_and_forget():
+    cache = DetailCache()
+    for key in ("a:1", "b:1"):
+        for kind in server_details.KINDS:
+            cache.put(key, kind, kind, now=0.0)
+    cache.invalidate("a:1", kinds=("rules",))
+    assert cache.get("a:1", "rules", now=0.0) is None and cache.get("a:1", "players", now=0.0)
+    cache.forget(["a:1"])
+    assert len(cache) == 2 and cache.get("b:1", "rules", now=0.0)
+
+
+# ---- fetch_details against the fake farm ----
+@needs_farm
+def test_fetch_then_serve_from_the_cache(farm):
+    profile, address = _pick(farm, rules=True)
+    key, cache = profile["ip"], DetailCache()
+
+    async def steps(transport):
+        first = await fetch_details(transport, key, address, cache, timeout=TIMEOUT)
+        sent = transport.sent
+        second = await fetch_details(transport, key, address, cache, timeout=TIMEOUT)
+        return first, second, transport.sent - sent
+
+    first, second, resent = _run(steps)
+    assert first["players"]["error"] is None and len(first["players"]["value"]) == profile["players"]
+    assert first["rules"]["value"]["mapname"] == profile["map"]
+    assert resent == 0                                   # a cache hit costs no packets
+    assert second["players"]["value"] == first["players"]["value"]
+    assert second["rules"]["value"] == first["rules"]["value"]
+
+
+@needs_farm
+def test_expired_or_forced_entries_are_refetched(farm):
+    profile, address = _pick(farm, rules=True)
+    key, cache = profile["ip"], DetailCache()
+
+    async def steps(transport):
+        await fetch_details(transport, key, address, cache, timeout=TIMEOUT)
+        fetched_at, value = cache.get(key, "players")
+        cache.put(key, "players", value, now=fetched_at - server_details.PLAYERS_TTL - 1)   # age it out
+        sent = transport.sent
+        out = await fetch_details(transport, key, address, cache, timeout=TIMEOUT)
+        refetched = transport.sent - sent
+        sent = transport.sent
+        forced = await fetch_details(transport, key, address, cache, timeout=TIMEOUT, force=True)
+        return out, refetched, forced, transport.sent - sent
+
+    out, refetched, forced, forced_sent = _run(steps)
+    assert refetched == 1                                # players only; the challenge is already known
+    assert out["players"]["age_sec"] == 0.0 and out["rules"]["error"] is None
+    assert forced_sent == 2 and forced["rules"]["age_sec"] == 0.0
+
+
+@needs_farm
+def test_failed_rules_do_not_poison_the_cached_players(farm):
+    profile, address = _pick(farm, rules=False)
+    key, cache = profile["ip"], DetailCache()
+
+    async def steps(transport):
+        first = await fetch_details(transport, key, address, cache, timeout=TIMEOUT)
+        sent = transport.sent
+        second = await fetch_details(transport, key, address, cache, timeout=TIMEOUT)
+        return first, second, transport.sent - sent
+
+    started = time.time()
+    first, second, resent = _run(steps)
+    assert first["players"]["error"] is None and len(first["players"]["value"]) == profile["players"]
+    assert first["rules"]["value"] is None and "Timeout" in first["rules"]["error"]
+    assert cache.get(key, "rules") is None                # failures are not cached ...
+    hit = cache.get(key, "players")
+    assert hit is not None and hit[0] >= started          # ... and leave the players entry alone
+    assert resent == 1                                    # the retry only asks for the rules again
+    assert second["players"]["value"] == first["players"]["value"] and second["players"]["age_sec"] >= 0
+    assert second["rules"]["error"] is not None
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from query_servers import ServerList, parse_line, read_server_list
+
+
+def _write(path, text, mtime):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))   # well in the past, so reload() does not wait for it to settle
+
+
+@pytest.mark.parametrize("line, entry", [
+    ("1.2.3.4:27016 | GFL", ("1.2.3.4", 27016, "GFL")),
+    ("1.2.3.4", ("1.2.3.4", 27015, "")),
+    ('ze.example.org:27020, "Quoted"', ("ze.example.org", 27020, "Quoted")),
+    ("  # comment", None),
+    ("", None),
+    ("1.2.3.4:abc", None),
+])
+def test_parse_line(line, entry):
+    assert parse_line(line) == entry
+
+
+def test_duplicates_keep_first_line_but_take_a_later_name(tmp_path):
+    p = tmp_path / "list.txt"
+    p.write_text("1.1.1.1:1\n1.1.1.1:1 | Named\n1.1.1.1:1 | Other\n", encoding="utf-8")
+    assert read_server_list(str(p)) == [("1.1.1.1", 1, "Named")]
+
+
+def test_reload_reports_added_removed_renamed(tmp_path):
+    p = tmp_path / "list.txt"
+    _write(p, "1.1.1.1:1 | A\n2.2.2.2:2 | B\n3.3.3.3:3\n", 1_000_000)
+    sl = ServerList(str(p))
+    first = sl.reload()
+    assert sorted(e[0] for e in first.added) == ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+    assert sl.reload() is None          # unchanged file: no re-parse
+
+    _write(p, "1.1.1.1:1 | A2\n3.3.3.3:3\n4.4.4.4:4 | D\n", 1_000_100)
+    diff = sl.reload()
+    assert diff.added == [("4.4.4.4", 4, "D")]
+    assert diff.removed == ["2.2.2.2:2"]
+    assert diff.renamed == [("1.1.1.1", 1, "A2")]
+    assert set(sl.index) == {"1.1.1.1:1", "3.3.3.3:3", "4.4.4.4:4"}
+
+
+def test_reload_waits_for_a_fresh_save(tmp_path):
+    p = tmp_path / "list.txt"
+    _write(p, "1.1.1.1:1\n", 1_000_000)
+    sl = ServerList(str(p))
+    sl.reload()
+    p.write_text("1.1.1.1:1\n2.2.2.2:2\n", encoding="utf-8")   # mtime = now: may be half-written
+    assert sl.reload() is None
+    os.utime(p, (1_000_100, 1_000_100))
+    assert sl.reload().added == [("2.2.2.2", 2, "")]
+
+
+def test_missing_file_keeps_the_last_index(tmp_path):
+    p = tmp_path / "list.txt"
+    with pytest.raises(FileNotFoundError):
+        ServerList(str(p)).reload()
+    _write(p, "1.1.1.1:1\n", 1_000_000)
+    sl = ServerList(str(p))
+    sl.reload()
+    p.unlink()
+    assert sl.reload() is None
+    assert list(sl.index) == ["1.1.1.1:1"]
@@ -0,0 +1,89 @@
+import pytest
+
+import query_servers
+import web_view
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_view, "HISTORY_DB", "")
+    monkeypatch.setattr(web_view, "CSV_FILE", str(tmp_path / "servers_output.csv"))
+    monkeypatch.setattr(web_view, "SNAPSHOT", None)
+    monkeypatch.setattr(web_view, "_SNAPSHOT_GEN", 0)
+    monkeypatch.setattr(web_view, "LATEST", {})
+    return web_view.app.test_client()
+
+
+def _result(n, players=10, map_name="ze_a"):
+    r = query_servers._empty_result(f"10.0.0.{n}", 27015, f"server {n}")
+    r.update(online=True, player_count=players, max_players=64, map=map_name, ping_ms=20 + n,
+             jitter_ms=1, ping_method="ICMP")
+    return r
+
+
+def _get(client, **args):
+    resp = client.get("/data", query_string=args)
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def _apply(rows, delta):
+    """What the page does with a delta: drop `removed`, replace or add `rows` by ip."""
+    assert delta["delta"] is True
+    by_ip = {r["ip"]: r for r in rows}
+    for ip in delta["removed"]:
+        by_ip.pop(ip, None)
+    by_ip.update((r["ip"], r) for r in delta["rows"])
+    return by_ip
+
+
+def _by_ip(doc):
+    return {r["ip"]: r for r in doc["rows"]}
+
+
+def test_delta_applied_to_the_old_snapshot_gives_the_new_one(client):
+    web_view._publish_results([_result(1), _result(2), _result(3)])
+    old = _get(client)
+    assert old["delta"] is False and len(old["rows"]) == 3
+
+    web_view._publish_results([_result(1), _result(2, players=40), _result(4)])   # 2 changed, 3 gone, 4 new
+    delta = _get(client, since=old["version"])
+    new = _get(client)
+    assert sorted(r["ip"] for r in delta["rows"]) == ["10.0.0.2:27015", "10.0.0.4:27015"]
+    assert delta["removed"] == ["10.0.0.3:27015"]
+    assert delta["version"] == new["version"] != old["version"]
+    assert _apply(old["rows"], delta) == _by_ip(new)
+
+
+def test_delta_across_several_publishes(client):
+    web_view._publish_results([_result(1), _result(2), _result(3)])
+    old = _get(client)
+    web_view._publish_results([_result(1, players=5), _result(2)])                # 3 removed
+    web_view._publish_results([_result(1, players=10), _result(2), _result(3)], replace=True)   # 1 back, 3 back
+    web_view._publish_results([_result(5)], replace=False)                         # partial refresh adds 5
+    delta = _get(client, since=old["version"])
+    new = _get(client)
+    assert "10.0.0.3:27015" not in delta["removed"]
+    assert _apply(old["rows"], delta) == _by_ip(new)
+
+
+def test_current_version_gives_an_empty_delta(client):
+    web_view._publish_results([_result(1), _result(2)])
+    cur = _get(client)
+    delta = _get(client, since=cur["version"])
+    assert delta["delta"] is True and delta["rows"] == [] and delta["removed"] == []
+
+
+@pytest.mark.parametrize("since", ["garbage", "0-1", "csv-1-2", "{boot}-999", "{boot}-x"])
+def test_unknown_version_returns_the_full_table(client, since):
+    web_view._publish_results([_result(1), _result(2)])
+    full = _get(client, since=since.format(boot=web_view.BOOT_ID))
+    assert full["delta"] is False
+    assert _by_ip(full) == _by_ip(_get(client))
+
+
+def test_csv_fallback_has_no_deltas(client):
+    # before the first scan the table comes from the CSV, whose version is not a generation
+    doc = _get(client)
+    assert doc["version"].startswith("csv-")
+    assert _get(client, since=doc["version"])["delta"] is False
@@ -1,19 +1,39 @@
 # web_view.py
-# Async scan: start in background, UI returns immediately and polls status.
-from flask import Flask, jsonify, render_template_string, make_response
-import csv, os, datetime, subprocess, threading, json, webbrowser
+# Async scan: start in background, UI returns immediately; progress is pushed over /events (SSE).
+# 扫描在进程内常驻的 query_servers.Scanner 上执行，结果直接发布到内存快照；CSV 只是可选导出。
+from flask import Flask, Response, jsonify, render_template_string, make_response, request
+import csv, os, datetime, threading, json, math, queue, time, webbrowser
+import concurrent.futures
+
+import columnar
+import query_servers
+import row_index
+import scan_cluster
+import scan_metrics
+import scan_history
 
 app = Flask(__name__)
 
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_FILE = os.path.join(PROJECT_DIR, "servers_output.csv")
-QUERY_SCRIPT = os.path.join(PROJECT_DIR, "query_servers.py")
-VENV_PY = os.path.join(PROJECT_DIR, "venv", "Scripts", "python.exe") if os.name == "nt" \
-           else os.path.join(PROJECT_DIR, "venv", "bin", "python")
-PYTHON_EXE = VENV_PY if os.path.exists(VENV_PY) else "python"
+LIST_FILE = os.path.join(PROJECT_DIR, "server_list.txt")
+EXPORT_CSV = True   # 每次扫描后仍导出 servers_output.csv（供外部工具/下次启动使用）
+AUTO_SCHEDULE = False   # True = 启动时就打开持续刷新（query_servers.ScanScheduler）
+SCAN_DEADLINE_SEC = 60  # 整次扫描的时间预算；没扫完的服务器保留上次的值并标记 stale
+LIST_POLL_SEC = 2.0     # 多久检查一次 server_list.txt 是否被修改（只探测新增的服务器）
+HISTORY_DB = os.path.join(PROJECT_DIR, "scan_history.sqlite3")   # 扫描历史（SQLite）；"" 关闭
+# 分布式扫描：有 worker（python query_servers.py --worker http://本机:端口）在线时，整表扫描按一致性哈希
+# 分给它们，本机只做汇总；没有 worker 时照旧用本机的常驻扫描器。其它机器上的 worker 需要 BIND_HOST = "0.0.0.0"
+BIND_HOST = "127.0.0.1"
+CLUSTER_TOKEN = ""      # 非空时 worker 必须带同样的 --token
+CLUSTER_REPLICAS = 1    # 每台服务器由几个不同 vantage 的 worker 测量（>1 时多出来的只进 vantage_ping 列）
+DATA_PAGE_DEFAULT = 50  # /data?page= 不带 limit 时的每页行数
+DATA_PAGE_MAX = 1000    # limit 上限
+DETAILS_WAIT_SEC = 5.0  # /server/<ip> 最多等多久（玩家 + 规则两个请求，各自超时见 server_details.DETAILS_TIMEOUT）
 
 # 固定列顺序（player 是由 player_count/max_players 合并得到）
-FIXED_COLUMNS = ["ip","name","online","player","map","ping_ms","jitter_ms","ping_method","error"]
+FIXED_COLUMNS = ["ip","name","online","player","map","ping_ms","jitter_ms","ping_window","vantage_ping",
+                 "ping_method","error"]
 
 # ---- 扫描状态（内存） ----
 SCAN_STATE = {
@@ -24,15 +44,113 @@ SCAN_STATE = {
     "stdout_tail": "",
     "stderr_tail": "",
     "last_csv_mtime": None,
+    "last_scan": None,      # 上一次扫描的摘要：耗时、在线数、各阶段耗时（query_servers.ScanReport.metrics）
 }
 SCAN_LOCK = threading.Lock()
 
+# ---- 内存快照：最近一次扫描的结果 ----
+# 快照发布后不再修改，整体替换：{"rows", "data_time", "etag", "body", "version", "by_ip", "changed", "removed"}
+# rows 已排序，body 是预先序列化好的 /data 响应，etag 用于 If-None-Match -> 304。
+# version = etag；changed[ip] / removed[ip] 是该行最后一次变化 / 被删除时的 generation，
+# /data?since=<version> 只返回这之后变过的行（页面按 ip 就地打补丁）。
+SNAPSHOT = None          # None = 本进程还没有扫描过，回退读 CSV
+SNAPSHOT_LOCK = threading.Lock()
+_SNAPSHOT_GEN = 0
+BOOT_ID = f"{int(time.time()):x}"   # 放进 ETag，进程重启后 generation 重新计数也不会撞上旧缓存
+_CSV_SNAPSHOT = {"key": None, "snap": None}   # CSV 回退的缓存，按 (mtime_ns, size) 失效
+DERIVED_LOCK = threading.Lock()   # 快照上按需派生的东西（查询索引、列式编码）每个快照只建一次
+
+# 常驻扫描器：第一次扫描时创建，之后复用（列表解析/套接字/解析过的地址）
+SCANNER = None
+SCHEDULER = None
+SCANNER_LOCK = threading.Lock()
+
+# 每台服务器最近一次结果（ip -> query_servers 结果 dict）；快照由它生成
+LATEST = {}
+LATEST_LOCK = threading.Lock()
+
+# 各个 vantage（worker 所在位置）最近测到的延迟：ip -> {vantage: ping_ms}
+VANTAGE = {}
+VANTAGE_LOCK = threading.Lock()
+CLUSTER_ROUND = {"results": None}   # 分布式扫描进行中时收集 (结果, 是否主 owner)
+CLUSTER_ROUND_LOCK = threading.Lock()
+
+# 历史库：第一次发布结果时打开；写入在它自己的线程里批量进行
+HISTORY = None
+HISTORY_LOCK = threading.Lock()
+
+def _get_history():
+    global HISTORY
+    if not HISTORY_DB:
+        return None
+    with HISTORY_LOCK:
+        if HISTORY is None:
+            HISTORY = scan_history.HistoryStore(HISTORY_DB)
+        return HISTORY
+
+def _now_str():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
 def _csv_mtime_iso():
     if not os.path.exists(CSV_FILE):
         return None
     ts = os.path.getmtime(CSV_FILE)
     return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
 
+def _data_time_iso():
+    """当前数据的时间：内存快照的发布时间；没有快照时用 CSV 修改时间。"""
+    with SNAPSHOT_LOCK:
+        if SNAPSHOT is not None:
+            return SNAPSHOT["data_time"]
+    return _csv_mtime_iso()
+
+def _make_row(ip, name, online, cur, mx, map_name, ping_ms, jitter_ms, ping_method, error, stale=False,
+              ping_window=None, vantage_ping=None):
+    """合并为 player，并附带 _cur_num（排序用）。"""
+    cur_str = "" if cur is None else str(cur).strip()
+    mx_str  = "" if mx is None else str(mx).strip()
+
+    # 解析当前玩家数用于排序；解析失败给 -1 让它排到最后
+    try:
+        cur_num = int(cur_str)
+    except Exception:
+        cur_num = -1
+
+    # 组合显示用的 "cur/max"
+    player_val = f"{cur_str}/{mx_str}" if (cur_str or mx_str) else ""
+
+    return {
+        "ip":          ip or "",
+        "name":        name or "",
+        "online":      online,
+        "player":      player_val,
+        "map":         map_name or "",
+        "ping_ms":     ping_ms,
+        "jitter_ms":   jitter_ms,
+        "ping_window": ping_window,   # 最近一小时的 {n, min, p50, p95, p99}（常驻扫描器的滚动分位数）
+        "vantage_ping": vantage_ping, # 分布式扫描：{vantage: ping_ms}
+        "ping_method": ping_method or "",
+        "error":       error or "",
+        "stale":       bool(stale),   # 超过扫描期限没扫到，显示的是上一次的值
+        "_cur_num":    cur_num,  # 仅用于排序，稍后会删掉
+    }
+
+def _sort_rows(rows):
+    # 按当前玩家数降序；空值/解析失败的在最后
+    rows.sort(key=lambda r: r.get("_cur_num", -1), reverse=True)
+    for r in rows:
+        r.pop("_cur_num", None)
+    return rows
+
+def _row_from_result(d):
+    """query_servers 的结果 dict -> 页面行（含 _cur_num）。"""
+    return _make_row(d["ip"], d.get("name"), d["online"], d["player_count"], d["max_players"],
+                     d["map"], d["ping_ms"], d["jitter_ms"], d["ping_method"], d["error"],
+                     d.get("stale", False), d.get("ping_window"), d.get("vantage_ping"))
+
+def _rows_from_results(results):
+    return _sort_rows([_row_from_result(d) for d in results])
+
 def _read_csv_rows():
     """读取 CSV，合并为 player，并按当前玩家数降序排序。"""
     rows = []
@@ -42,38 +160,163 @@ def _read_csv_rows():
     with open(CSV_FILE, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            cur_str = (row.get("player_count") or "").strip()
-            mx_str  = (row.get("max_players") or "").strip()
-
-            # 解析当前玩家数用于排序；解析失败给 -1 让它排到最后
-            try:
-                cur_num = int(cur_str)
-            except Exception:
-                cur_num = -1
-
-            # 组合显示用的 "cur/max"
-            player_val = f"{cur_str}/{mx_str}" if (cur_str or mx_str) else ""
-
-            out = {
-                "ip":          row.get("ip", ""),
-                "name":        row.get("name", ""),
-                "online":      row.get("online", ""),
-                "player":      player_val,
-                "map":         row.get("map", ""),
-                "ping_ms":     row.get("ping_ms", ""),
-                "jitter_ms":   row.get("jitter_ms", ""),
-                "ping_method": row.get("ping_method", ""),
-                "error":       row.get("error", ""),
-                "_cur_num":    cur_num,  # 仅用于排序，稍后会删掉
-            }
-            rows.append(out)
+            rows.append(_make_row(
+                row.get("ip", ""), row.get("name", ""), row.get("online", ""),
+                row.get("player_count"), row.get("max_players"), row.get("map", ""),
+                row.get("ping_ms", ""), row.get("jitter_ms", ""), row.get("ping_method", ""),
+                row.get("error", ""), (row.get("stale") or "").strip().lower() == "true",
+            ))
+    return _sort_rows(rows)
 
-    # 按当前玩家数降序；空值/解析失败的在最后
-    rows.sort(key=lambda r: r.get("_cur_num", -1), reverse=True)
-    for r in rows:
-        r.pop("_cur_num", None)
+def _build_snapshot(rows, data_time, etag, gen=0, prev=None):
+    """prev = 上一个快照：没变的行沿用它记下的 generation，消失的行记进 removed。"""
+    by_ip = {r["ip"]: r for r in rows}
+    changed, removed = {}, {}
+    if prev is not None and prev.get("by_ip") is not None:
+        old = prev["by_ip"]
+        for ip, r in by_ip.items():
+            changed[ip] = prev["changed"][ip] if old.get(ip) == r else gen
+        removed = {ip: g for ip, g in prev["removed"].items() if ip not in by_ip}
+        removed.update((ip, gen) for ip in old if ip not in by_ip)
+    else:
+        changed = dict.fromkeys(by_ip, gen)
+    body = json.dumps({"data_time": data_time, "version": etag, "delta": False, "rows": rows},
+                      ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {"rows": rows, "data_time": data_time, "etag": etag, "body": body, "version": etag,
+            "gen": gen, "by_ip": by_ip, "changed": changed, "removed": removed}
 
-    return rows
+def _delta_body(snap, since):
+    """since 是页面手上的 version；同一进程、不比当前新时返回增量，否则 None（回整表）。"""
+    boot, _, g = (since or "").rpartition("-")
+    if boot != BOOT_ID or snap.get("by_ip") is None:
+        return None
+    try:
+        g = int(g)
+    except ValueError:
+        return None
+    if g > snap["gen"]:
+        return None
+    rows = [r for r in snap["rows"] if snap["changed"][r["ip"]] > g]
+    removed = [ip for ip, rg in snap["removed"].items() if rg > g]
+    return json.dumps({"data_time": snap["data_time"], "version": snap["version"], "delta": True,
+                       "rows": rows, "removed": removed},
+                      ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _publish_results(results, replace=True):
+    """replace=True：整次扫描，快照就是这批结果；False：持续刷新的局部结果，合并进去。"""
+    global SNAPSHOT, _SNAPSHOT_GEN
+    history = _get_history()
+    if history is not None and results:
+        history.record(results)
+    with LATEST_LOCK:
+        if replace:
+            LATEST.clear()
+        for d in results:
+            LATEST[d["ip"]] = d
+        rows = _rows_from_results(LATEST.values())
+    with SNAPSHOT_LOCK:
+        _SNAPSHOT_GEN += 1
+        SNAPSHOT = _build_snapshot(rows, _now_str(), f"{BOOT_ID}-{_SNAPSHOT_GEN}", _SNAPSHOT_GEN, SNAPSHOT)
+
+def _current_snapshot():
+    """当前快照；没扫描过时用 CSV（只在 mtime/size 变化时重新解析）。"""
+    with SNAPSHOT_LOCK:
+        if SNAPSHOT is not None:
+            return SNAPSHOT
+    try:
+        st = os.stat(CSV_FILE)
+        key = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None
+    with SNAPSHOT_LOCK:
+        if _CSV_SNAPSHOT["snap"] is not None and _CSV_SNAPSHOT["key"] == key:
+            return _CSV_SNAPSHOT["snap"]
+    rows = _read_csv_rows() if key else []
+    etag = f"csv-{key[0]:x}-{key[1]:x}" if key else "csv-none"
+    snap = _build_snapshot(rows, _csv_mtime_iso(), etag)
+    with SNAPSHOT_LOCK:
+        _CSV_SNAPSHOT.update({"key": key, "snap": snap})
+    return snap
+
+def _snapshot_index(snap):
+    """快照的查询索引：第一次带筛选参数的请求时建，之后随快照一起复用（快照本身不会再变）。"""
+    idx = snap.get("index")
+    if idx is None:
+        with DERIVED_LOCK:
+            idx = snap.get("index")
+            if idx is None:
+                idx = snap["index"] = row_index.RowIndex(
+                    snap["rows"], {"data_time": snap["data_time"], "version": snap["version"], "delta": False})
+    return idx
+
+def _columnar_body(snap, coding):
+    """?format=columns 的整表：列式 JSON 按 content coding 压好，每个快照每种编码只做一次。"""
+    enc = snap.get("columnar")
+    if enc is None or coding not in enc:
+        with DERIVED_LOCK:
+            enc = snap.setdefault("columnar", {})
+            if "identity" not in enc:
+                enc["identity"] = columnar.encode_rows(
+                    snap["rows"], {"data_time": snap["data_time"], "version": snap["version"], "delta": False})
+            if coding not in enc:
+                enc[coding] = columnar.compress(enc["identity"], coding)
+    return enc[coding]
+
+_QUERY_ARGS = ("map", "map_prefix", "players_min", "players_max", "free_min", "ping_max", "online",
+               "sort", "page", "limit", "offset")
+
+def _data_query(args):
+    """/data 的筛选/排序/分页参数 -> row_index.Query；一个都没带时 None。参数不对抛 ValueError。"""
+    if not any(k in args for k in _QUERY_ARGS):
+        return None
+
+    def num(name):
+        v = (args.get(name) or "").strip()
+        if not v:
+            return None
+        f = float(v)
+        if not math.isfinite(f):     # float() 认 nan/inf；nan 跟谁比都是 False，会把筛选变成空操作
+            raise ValueError(f"{name} must be a finite number: {v}")
+        return f
+
+    sort = args.get("sort") or "-players"
+    if sort.lstrip("-") not in row_index.SORT_KEYS:
+        raise ValueError(f"unknown sort key: {sort} (one of {', '.join(row_index.SORT_KEYS)})")
+    limit = int(args["limit"]) if args.get("limit") else (DATA_PAGE_DEFAULT if args.get("page") else None)
+    if limit is not None:
+        limit = max(1, min(limit, DATA_PAGE_MAX))
+    if args.get("page"):
+        offset = (max(1, int(args["page"])) - 1) * limit
+    else:
+        offset = max(0, int(args.get("offset") or 0))
+    return row_index.Query(
+        map_prefix=(args.get("map_prefix") or "").strip(), map_contains=(args.get("map") or "").strip(),
+        players_min=num("players_min"), players_max=num("players_max"), free_min=num("free_min"),
+        ping_max=num("ping_max"), online=(args.get("online") or "").lower() in ("1", "true", "yes"),
+        sort=sort, offset=offset, limit=limit)
+
+# ---- 事件推送（SSE）：每个 /events 连接一个队列 ----
+EVENT_SUBSCRIBERS = []
+EVENT_LOCK = threading.Lock()
+EVENT_QUEUE_MAX = 1000      # 慢客户端积压超过这个数就丢事件（页面在 scan_done 时会整表刷新）
+EVENT_KEEPALIVE_SEC = 15
+
+def _publish_event(event, data):
+    msg = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    with EVENT_LOCK:
+        subs = list(EVENT_SUBSCRIBERS)
+    for q in subs:
+        try:
+            q.put_nowait(msg)
+        except queue.Full:
+            pass
+
+def _on_scan_result(d, lines):
+    """扫描器回调（在扫描器的事件循环线程里）：记日志并立刻推送这一行。"""
+    lines.append(query_servers.format_result(d))
+    row = _row_from_result(d)
+    row.pop("_cur_num", None)
+    _publish_event("row", row)
 
 def _no_cache(resp):
     resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
@@ -84,14 +327,143 @@ def _no_cache(resp):
 def _tail(s, n=40):
     return "\n".join((s or "").splitlines()[-n:])
 
-def _run_scan_in_thread(timeout_sec=180):
-    """后台线程：运行 query_servers.py（准确模式）并更新 SCAN_STATE。"""
+def _get_scanner():
+    global SCANNER
+    with SCANNER_LOCK:
+        if SCANNER is None:
+            SCANNER = query_servers.Scanner(LIST_FILE)
+            SCANNER.on_list_change = _on_list_change
+        return SCANNER
+
+def _on_list_change(diff):
+    """server_list.txt 改了：删掉的行从快照移除，改名只改标签，新增的立刻单独探测（不整表重扫）。"""
+    with LATEST_LOCK:
+        for key in diff.removed:
+            LATEST.pop(key, None)
+    if SCANNER is not None:
+        SCANNER.latency.forget(diff.removed)
+        SCANNER.details.forget(diff.removed)
+    with VANTAGE_LOCK:
+        for key in diff.removed:
+            VANTAGE.pop(key, None)
+    with LATEST_LOCK:
+        for (h, p, nm) in diff.renamed:
+            key = f"{h}:{p}"
+            if key in LATEST:
+                LATEST[key] = dict(LATEST[key], name=nm)
+    if diff.removed or diff.renamed:
+        _publish_results([], replace=False)
+    scanner = SCANNER
+    CLUSTER.set_entries(scanner.servers.entries)          # 分布式扫描进行中时重新分片
+    if SCHEDULER is not None:
+        SCHEDULER.sync_entries(scanner.servers.entries)   # 新增的在调度器里立即到期
+    # 整表扫描进行中时新增的由扫描收尾补测（见 _run_scan_in_thread），这里不重复探测
+    if diff.added and (SCHEDULER is None or not SCHEDULER.running) and not SCAN_STATE["running"]:
+        _probe_entries(diff.added)
+    _publish_event("list_change", {
+        "added": [f"{h}:{p}" for (h, p, _nm) in diff.added],
+        "removed": diff.removed,
+        "renamed": [f"{h}:{p}" for (h, p, _nm) in diff.renamed],
+    })
+
+def _probe_entries(entries):
+    fut = _get_scanner().probe_async(entries, on_result=_on_sched_result)
+    fut.add_done_callback(lambda f: f.exception() is None and _publish_results(f.result(), replace=False))
+
+def _watch_list():
+    while True:
+        time.sleep(LIST_POLL_SEC)
+        try:
+            _get_scanner().entries()
+        except Exception as e:
+            print(f"[WARN] Could not reload {LIST_FILE}: {e}", flush=True)
+
+def start_list_watcher():
+    threading.Thread(target=_watch_list, name="list-watcher", daemon=True).start()
+
+def _on_sched_result(d):
+    row = _row_from_result(d)
+    row.pop("_cur_num", None)
+    _publish_event("row", row)
+
+def _on_sched_batch(results):
+    _publish_results(results, replace=False)
+
+def _get_scheduler():
+    global SCHEDULER
+    if SCHEDULER is None:
+        SCHEDULER = query_servers.ScanScheduler(_get_scanner(), on_result=_on_sched_result,
+                                                on_batch=_on_sched_batch)
+    return SCHEDULER
+
+def start_scheduler():
+    sched = _get_scheduler()
+    sched.sync_entries(_get_scanner().entries())
+    with LATEST_LOCK:
+        known = list(LATEST.values())
+    for d in known:          # 已有结果的服务器不用立刻重扫
+        sched.observe(d)
+    sched.start()
+
+def _on_cluster_result(d, primary):
+    """worker 发回的结果（HTTP 线程）：按 vantage 记下延迟；主 owner 的结果进表格，其它的只更新 vantage_ping。"""
+    with VANTAGE_LOCK:
+        per = VANTAGE.setdefault(d["ip"], {})
+        per[d["vantage"]] = d.get("ping_ms")
+        d["vantage_ping"] = dict(per)
+    with CLUSTER_ROUND_LOCK:
+        sink = CLUSTER_ROUND["results"]
+        if sink is not None:
+            sink.append((d, primary))
+    if primary:
+        _on_sched_result(d)
+        if sink is None:      # 这一轮结束后才到的结果：直接并进快照
+            _publish_results([d], replace=False)
+        return
+    with LATEST_LOCK:
+        cur = LATEST.get(d["ip"])
+        if cur is not None:
+            cur = LATEST[d["ip"]] = dict(cur, vantage_ping=d["vantage_ping"])
+    if cur is not None:
+        _on_sched_result(cur)
+
+CLUSTER = scan_cluster.Coordinator(on_result=_on_cluster_result, replicas=CLUSTER_REPLICAS)
+
+def _cluster_scan(previous, lines):
+    """整表扫描交给在线的 worker：等这一轮结束（或超过期限），没收到的服务器保留上次的值。"""
+    started = time.time()
+    entries = _get_scanner().entries()
+    sink = []
+    with CLUSTER_ROUND_LOCK:
+        CLUSTER_ROUND["results"] = sink
+    try:
+        info = CLUSTER.run_round(entries, SCAN_DEADLINE_SEC)
+    finally:
+        with CLUSTER_ROUND_LOCK:
+            CLUSTER_ROUND["results"] = None
+    best = {}
+    for d, primary in sink:   # 主 owner 的结果优先；worker 掉线后主 owner 换了人，可能只剩其它 vantage 的结果
+        if primary or not best.get(d["ip"], (None, False))[1]:
+            best[d["ip"]] = (d, primary)
+    results = [d for d, _primary in best.values()]
+    with VANTAGE_LOCK:
+        for d in results:
+            d["vantage_ping"] = dict(VANTAGE.get(d["ip"], {}))
+    lines.extend(query_servers.format_result(d) for d in results)
+    lines.append(f"[INFO] Round {info['round']} on {len(info['workers'])} workers"
+                 + ("" if info["complete"] else " (incomplete)"))
+    stale = query_servers.stale_results(entries, results, previous)
+    return query_servers.ScanReport(results + stale, started, time.time(), stale=len(stale),
+                                    metrics={"cluster": info})
+
+def _run_scan_in_thread():
+    """后台线程：用常驻扫描器跑一次（准确模式），发布快照并更新 SCAN_STATE。"""
     with SCAN_LOCK:
         if SCAN_STATE["running"]:
             return
         SCAN_STATE.update({
             "running": True,
-            "started_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "started_at": _now_str(),
             "finished_at": None,
             "ok": None,
             "stdout_tail": "",
@@ -99,26 +471,62 @@ def _run_scan_in_thread(timeout_sec=180):
             "last_csv_mtime": _csv_mtime_iso(),
         })
 
-    cmd = [PYTHON_EXE, QUERY_SCRIPT]
-    ok, out_tail, err_tail = False, "", ""
+    _publish_event("scan_start", {"started_at": SCAN_STATE["started_at"]})
+    lines = []
+    ok, err_tail = False, ""
+    summary = None
     try:
-        proc = subprocess.run(cmd, cwd=PROJECT_DIR, capture_output=True, text=True, timeout=timeout_sec)
-        ok = (proc.returncode == 0)
-        out_tail, err_tail = _tail(proc.stdout), _tail(proc.stderr)
-    except subprocess.TimeoutExpired:
-        ok, out_tail, err_tail = False, "", f"Scan timed out after {timeout_sec}s"
+        with LATEST_LOCK:
+            previous = dict(LATEST)
+        if not previous:      # 重启后的第一次扫描：没扫完的行沿用页面正在显示的 CSV 里的值
+            previous = query_servers.load_previous_results(CSV_FILE)
+        if CLUSTER.live():
+            report = _cluster_scan(previous, lines)
+        else:
+            report = _get_scanner().scan(on_result=lambda d: _on_scan_result(d, lines),
+                                         deadline=SCAN_DEADLINE_SEC, previous=previous)
+        ok = report.ok
+        if ok:
+            # 扫描期间列表被改过：删掉的行不再发布，扫描开始后才加进来的行补测
+            listed = _get_scanner().servers.index
+            report.results = [d for d in report.results if d["ip"] in listed]
+            done = {d["ip"] for d in report.results}
+            missing = [e for k, e in listed.items() if k not in done]
+            summary = {
+                "duration_sec": round(report.duration, 2),
+                "servers": len(report.results),
+                "online": sum(1 for d in report.results if d["online"]),
+                "stale": report.stale,
+                **(report.metrics or {}),
+            }
+            _publish_results(report.results)
+            if SCHEDULER is not None:
+                SCHEDULER.sync_entries(_get_scanner().entries())
+                for d in report.results:
+                    SCHEDULER.observe(d)
+            if report.stale:
+                lines.append(f"[WARN] Deadline of {SCAN_DEADLINE_SEC}s hit; {report.stale} servers kept previous values.")
+            lines.append(f"[DONE] {len(report.results)} servers in {report.duration:.1f}s")
+            if missing:
+                _probe_entries(missing)
+            if EXPORT_CSV:
+                query_servers.write_csv(report.results, CSV_FILE)
+        else:
+            err_tail = report.error or ""
     except Exception as e:
-        ok, out_tail, err_tail = False, "", f"{type(e).__name__}: {e}"
+        ok, err_tail = False, f"{type(e).__name__}: {e}"
 
     with SCAN_LOCK:
         SCAN_STATE.update({
             "running": False,
-            "finished_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "finished_at": _now_str(),
             "ok": ok,
-            "stdout_tail": out_tail,
+            "stdout_tail": _tail("\n".join(lines)),
             "stderr_tail": err_tail,
             "last_csv_mtime": _csv_mtime_iso(),
+            "last_scan": summary if ok else SCAN_STATE["last_scan"],
         })
+    _publish_event("scan_done", {"ok": ok, "finished_at": SCAN_STATE["finished_at"], "data_time": _data_time_iso()})
 
 def start_scan():
     with SCAN_LOCK:
@@ -146,19 +554,202 @@ def status_route():
             "ok": SCAN_STATE["ok"],
             "stdout_tail": SCAN_STATE["stdout_tail"],
             "stderr_tail": SCAN_STATE["stderr_tail"],
-            "server_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "server_time": _now_str(),
             "csv_mtime": _csv_mtime_iso(),
+            "last_scan": SCAN_STATE["last_scan"],
         }
+    payload["data_time"] = _data_time_iso()
+    payload["scheduler"] = SCHEDULER.stats() if SCHEDULER is not None else {"running": False}
+    payload["cluster"] = CLUSTER.stats()
+    pacer = query_servers.get_pacer()
+    payload["pacer"] = pacer.stats() if pacer is not None else None
     return _no_cache(make_response(jsonify(payload)))
 
+@app.route("/scheduler/start", methods=["POST", "GET"])
+def scheduler_start_route():
+    start_scheduler()
+    return _no_cache(make_response(jsonify(SCHEDULER.stats())))
+
+@app.route("/scheduler/stop", methods=["POST", "GET"])
+def scheduler_stop_route():
+    if SCHEDULER is not None:
+        SCHEDULER.stop()
+    return _no_cache(make_response(jsonify(SCHEDULER.stats() if SCHEDULER else {"running": False})))
+
 @app.route("/data")
 def data_route():
-    payload = {
-        "server_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "csv_mtime": _csv_mtime_iso(),
-        "rows": _read_csv_rows(),
-    }
-    return _no_cache(make_response(jsonify(payload)))
+    """预先序列化的快照；If-None-Match 命中时 304（不变时只花一次 stat / 一次取锁）。
+
+    ?since=<version>：只返回这个版本之后变化的行和删掉的 ip（{"delta": true, "rows", "removed"}）；
+    版本太旧或来自上一个进程时照常返回整表（"delta": false）。
+
+    筛选/排序/分页（给仪表盘和 bot 用，走 row_index 的索引，不逐行扫）：
+    map=子串 map_prefix=前缀 players_min= players_max= free_min=空位 ping_max= online=1
+    sort=players|max_players|free|ping|jitter|name|map|ip（前面加 - 降序，默认 -players）
+    page=（从 1 开始）limit=（或 offset=）。返回 {"total", "offset", "limit", "rows", ...}；带这些参数时忽略 since。
+
+    ?format=columns：整表按列返回（见 columnar.py，页面用这个），按 Accept-Encoding 给 zstd/gzip 压缩版；
+    增量仍是普通的行 JSON，但同样压缩。
+    """
+    snap = _current_snapshot()
+    fmt = request.args.get("format") or "rows"
+    if fmt not in ("rows", columnar.FORMAT):
+        return jsonify({"error": f"unknown format: {fmt}"}), 400
+    try:
+        query = _data_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = request.args.get("since")
+    delta = _delta_body(snap, since) if since and query is None else None
+    coding = columnar.pick_coding(request.accept_encodings) if fmt == columnar.FORMAT and query is None else "identity"
+    etag = snap["etag"] if coding == "identity" else f"{snap['etag']}-{coding}"
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    elif query is not None:
+        resp = Response(_snapshot_index(snap).page_json(query), mimetype="application/json")
+    elif delta is not None:
+        resp = Response(columnar.compress(delta, coding), mimetype="application/json")
+    elif fmt == columnar.FORMAT:
+        resp = Response(_columnar_body(snap, coding), mimetype="application/json")
+    else:
+        resp = Response(snap["body"], mimetype="application/json")
+    if fmt == columnar.FORMAT:
+        resp.vary.add("Accept-Encoding")
+        if coding != "identity" and resp.status_code == 200:
+            resp.headers["Content-Encoding"] = coding
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"   # 允许缓存，但每次都要带 ETag 回来验证
+    return resp
+
+def _cluster_auth():
+    return not CLUSTER_TOKEN or request.headers.get("X-Cluster-Token") == CLUSTER_TOKEN
+
+def _clean_result(d):
+    """worker 发来的结果只保留已知字段，缺的补 None（不信任对方的格式）。"""
+    if not isinstance(d, dict) or not isinstance(d.get("ip"), str):
+        return None
+    r = {c: d.get(c) for c in query_servers.CSV_COLUMNS}
+    r["online"] = bool(r["online"])
+    r["stale"] = False
+    return r
+
+@app.route("/worker/poll", methods=["POST"])
+def worker_poll_route():
+    """worker 心跳：返回它负责的分片（版本变了才带 entries）和当前这一轮要扫的 todo。"""
+    if not _cluster_auth():
+        return jsonify({"error": "bad token"}), 403
+    body = request.get_json(silent=True) or {}
+    if not body.get("worker"):
+        return jsonify({"error": "worker id missing"}), 400
+    if not CLUSTER.entries:   # 还没扫描过：先按当前列表分片，worker 一连上就知道自己负责哪些
+        CLUSTER.set_entries(_get_scanner().entries())
+    return jsonify(CLUSTER.poll(str(body["worker"]), str(body.get("vantage") or ""), body.get("have")))
+
+@app.route("/worker/results", methods=["POST"])
+def worker_results_route():
+    """worker 分批发回结果（也算心跳）；done=true 表示这一轮分给它的都扫完了。"""
+    if not _cluster_auth():
+        return jsonify({"error": "bad token"}), 403
+    body = request.get_json(silent=True) or {}
+    if not body.get("worker"):
+        return jsonify({"error": "worker id missing"}), 400
+    results = [r for r in map(_clean_result, body.get("results") or []) if r is not None]
+    return jsonify(CLUSTER.results(str(body["worker"]), str(body.get("vantage") or ""), body.get("round"),
+                                   results, bool(body.get("done"))))
+
+@app.route("/workers")
+def workers_route():
+    """在线的 worker、各自分片大小、最近一次心跳。"""
+    return jsonify(CLUSTER.stats())
+
+@app.route("/metrics")
+def metrics_route():
+    """Prometheus 文本格式：扫描耗时、各阶段耗时直方图、A2S/ICMP 结果计数。"""
+    return Response(scan_metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+def _float_arg(name, default):
+    try:
+        return float(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+@app.route("/history")
+def history_servers_route():
+    """历史库里有记录的服务器。"""
+    history = _get_history()
+    return jsonify(history.servers() if history else [])
+
+@app.route("/history/<ip>")
+def history_route(ip):
+    """单台服务器的历史：?since=&until=（unix 秒，默认最近 hours=24 小时）&res=auto|raw|1m|1h"""
+    history = _get_history()
+    if history is None:
+        return jsonify({"error": "history disabled"}), 404
+    until = _float_arg("until", time.time())
+    since = _float_arg("since", until - _float_arg("hours", 24) * 3600)
+    try:
+        return jsonify(history.history(ip, since, until, request.args.get("res", "auto")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/history/<ip>/profile")
+def history_profile_route(ip):
+    """按星期几 × 小时的统计（本地时间）：平均人数、满员比例、在线比例。"""
+    history = _get_history()
+    if history is None:
+        return jsonify({"error": "history disabled"}), 404
+    return jsonify(history.profile(ip, int(_float_arg("days", 28))))
+
+@app.route("/server/<ip>")
+def server_details_route(ip):
+    """单台服务器的详情：玩家列表 + 服务器规则（A2S_PLAYER / A2S_RULES）。
+    只在页面上展开这一行时请求，不进 /data；按 TTL 缓存（玩家短、规则长），?refresh=1 跳过缓存。"""
+    scanner = _get_scanner()
+    if not scanner.servers.loaded:
+        # 查的是扫描器已有的索引，不在这里重读列表；只有还没扫过时读一次（首次加载不触发增量回调）
+        try:
+            scanner.entries()
+        except OSError:
+            return jsonify({"error": "server list unavailable"}), 503
+    fut = scanner.details_async(ip, force=request.args.get("refresh") == "1")
+    if fut is None:
+        return jsonify({"error": "unknown server"}), 404
+    try:
+        details = fut.result(timeout=DETAILS_WAIT_SEC)
+    except concurrent.futures.TimeoutError:
+        return jsonify({"error": "timed out"}), 504
+    with LATEST_LOCK:
+        d = LATEST.get(ip)
+    row = None
+    if d is not None:
+        row = _row_from_result(d)
+        row.pop("_cur_num", None)
+    return _no_cache(make_response(jsonify({"ip": ip, "row": row, **details})))
+
+@app.route("/events")
+def events_route():
+    """SSE：scan_start / row（每台服务器一完成就推送）/ scan_done。"""
+    q = queue.Queue(maxsize=EVENT_QUEUE_MAX)
+    with EVENT_LOCK:
+        EVENT_SUBSCRIBERS.append(q)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield q.get(timeout=EVENT_KEEPALIVE_SEC)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            with EVENT_LOCK:
+                if q in EVENT_SUBSCRIBERS:
+                    EVENT_SUBSCRIBERS.remove(q)
+
+    resp = Response(stream(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 # ----- 页面模板（不是 f-string，避免 {} 冲突） -----
 INDEX_HTML = """
@@ -205,12 +796,24 @@ a.connect {
   text-decoration: none;
 }
 a.connect:hover { text-decoration: underline; }
+
+/* 点名字展开的详情行 */
+td.expand { cursor: pointer; }
+td.expand:hover { text-decoration: underline; }
+tr.details > td { background: #fafbfc; font-size: 13px; }
+tr.details table { width: auto; margin: 4px 0 8px; }
+tr.details th, tr.details td { padding: 3px 8px; font-size: 13px; }
+tr.details pre { margin: 4px 0; max-height: 240px; overflow: auto; }
+
+/* 扫描期限内没扫到：显示上一次的值 */
+tr.stale td { opacity: .55; font-style: italic; }
 </style>
 <script>
 const FIXED_COLUMNS = {{ fixed_columns | safe }};
 
-let lastCsvMtime = null;
+let lastDataTime = null;
 let statusTimer = null;
+let useEvents = false;
 
 function toBool(v){
   if (typeof v === 'boolean') return v;
@@ -220,6 +823,14 @@ function toBool(v){
 }
 function renderCellText(h, v){
   if (h === 'online') return toBool(v) ? '✅ Online' : '❌ Offline';
+  if (h === 'ping_window'){
+    if (!v || !v.n) return 'n/a';
+    return `${v.min} / ${v.p50} / ${v.p95} / ${v.p99} ms`;
+  }
+  if (h === 'vantage_ping'){
+    if (!v) return '';
+    return Object.entries(v).map(([k, ms]) => `${k} ${ms ?? 'n/a'}`).join(' · ');
+  }
   if (h === 'ping_ms' || h === 'jitter_ms'){
     if (v === null || v === undefined || v === '') return 'n/a';
     return String(v) + ' ms';
@@ -283,65 +894,289 @@ async function fetchJSON(u) {
   const res = await fetch(u + (u.includes('?')?'&':'?') + 't=' + Date.now(), {cache:'no-store'});
   return await res.json();
 }
-function renderTable(rows){
-  const table = document.getElementById('tbl');
-  table.innerHTML = '';
-  if (!rows || rows.length === 0) { table.innerHTML = '<tr><td>No data yet</td></tr>'; return; }
+/* —— 表格：按 ip 建的行表，增量刷新只改变化的单元格；排序/过滤都在本地做 —— */
+const rowMap = new Map();     // ip -> {row, tr, cells, text, detail}
+let dataVersion = null;       // /data 返回的 version，下次带 since= 只取变化的行
+let sortKey = 'player', sortDesc = true, filterText = '';
 
-  const htr = document.createElement('tr');
-  FIXED_COLUMNS.forEach(h=>{ const th=document.createElement('th'); th.textContent=h; htr.appendChild(th); });
-  table.appendChild(htr);
-
-  rows.forEach(r=>{
-    const tr=document.createElement('tr');
+function sameVal(a, b){
+  return a === b || JSON.stringify(a) === JSON.stringify(b);
+}
+function setCell(td, h, val){
+  td.className = '';
+  if (h === 'ip' && val) {
+    // 渲染为可点击链接
+    td.textContent = '';
+    const a = document.createElement('a');
+    a.className = 'connect';
+    a.href = connectUrl(val);
+    a.textContent = val;
+    a.title = '点击后将通过 Steam 连接到 ' + val;
+    a.onclick = () => tryConnect(val);
+    td.appendChild(a);
+  } else {
+    td.textContent = renderCellText(h,val);
+  }
+  applyCellClass(td,h,val);
+  if (h === 'name') { td.classList.add('expand'); td.title = '点击展开玩家列表 / 服务器规则'; }
+}
+function patchRow(e, r){
+  if (e.detail && e.row && e.row.map !== r.map) loadDetails(r.ip);   // 换图了：玩家/规则多半也变了
+  FIXED_COLUMNS.forEach((h, i)=>{
+    if (e.row && sameVal(e.row[h], r[h])) return;
+    setCell(e.cells[i], h, r[h]);
+  });
+  const stale = toBool(r.stale);
+  if (!e.row || toBool(e.row.stale) !== stale) {
+    e.tr.classList.toggle('stale', stale);
+    e.tr.title = stale ? '没在扫描期限内完成，显示的是上一次的结果' : '';
+  }
+  e.row = r;
+  e.text = [r.ip, r.name, r.map].join(' ').toLowerCase();
+}
+function ensureRow(r){
+  let e = rowMap.get(r.ip);
+  if (!e) {
+    const tr = document.createElement('tr');
+    tr.dataset.ip = r.ip || '';
+    const cells = FIXED_COLUMNS.map(()=>tr.appendChild(document.createElement('td')));
+    const ni = FIXED_COLUMNS.indexOf('name');
+    if (ni >= 0) cells[ni].onclick = () => toggleDetails(tr.dataset.ip);
+    e = {row: null, tr, cells, text: '', detail: null};
+    rowMap.set(r.ip, e);
+  }
+  patchRow(e, r);
+  return e;
+}
+function removeRow(ip){
+  const e = rowMap.get(ip);
+  if (e) { e.tr.remove(); if (e.detail) e.detail.remove(); rowMap.delete(ip); }
+}
+/* 详情行：点名字展开/收起，内容按需从 /server/<ip> 取（服务器端按 TTL 缓存，不会每次都发包） */
+function toggleDetails(ip){
+  const e = rowMap.get(ip);
+  if (!e) return;
+  if (e.detail) { e.detail.remove(); e.detail = null; return; }
+  const tr = document.createElement('tr');
+  tr.className = 'details';
+  const td = tr.insertCell();
+  td.colSpan = FIXED_COLUMNS.length;
+  td.textContent = 'Loading…';
+  tr.hidden = e.tr.hidden;
+  e.detail = tr;
+  e.tr.after(tr);
+  loadDetails(ip);
+}
+async function loadDetails(ip, refresh){
+  let d;
+  try {
+    d = await fetchJSON('/server/' + encodeURIComponent(ip) + (refresh ? '?refresh=1' : ''));
+  } catch (err) {
+    d = {error: String(err)};
+  }
+  const e = rowMap.get(ip);
+  if (e && e.detail) renderDetails(e.detail.cells[0], ip, d);
+}
+function ageText(part){
+  if (!part || part.error) return part && part.error ? ' — ' + part.error : '';
+  return part.age_sec ? ' (' + Math.round(part.age_sec) + 's ago)' : '';
+}
+function renderDetails(td, ip, d){
+  td.textContent = '';
+  if (d.error) { td.textContent = d.error; return; }
+  const players = (d.players && d.players.value) || [];
+  const rules = (d.rules && d.rules.value) || {};
+  const title = document.createElement('div');
+  title.textContent = 'Players: ' + players.length + ageText(d.players) + ' ';
+  const btn = document.createElement('button');
+  btn.textContent = 'Refresh';
+  btn.onclick = () => loadDetails(ip, true);
+  title.appendChild(btn);
+  td.appendChild(title);
+  if (players.length) {
+    const t = document.createElement('table');
+    const h = t.createTHead().insertRow();
+    ['name', 'score', 'time'].forEach(c=>{ const th = document.createElement('th'); th.textContent = c; h.appendChild(th); });
+    const b = t.createTBody();
+    players.forEach(p=>{
+      const row = b.insertRow();
+      const sec = p.duration_sec || 0;
+      [p.name || '(connecting)', p.score, Math.floor(sec / 60) + ':' + String(sec % 60).padStart(2, '0')]
+        .forEach(v=>{ row.insertCell().textContent = v; });
+    });
+    td.appendChild(t);
+  }
+  const names = Object.keys(rules);
+  const box = document.createElement('details');
+  const sum = document.createElement('summary');
+  sum.textContent = 'Rules: ' + names.length + ageText(d.rules);
+  const pre = document.createElement('pre');
+  pre.textContent = names.map(k => k + ' = ' + rules[k]).join('\\n');
+  box.appendChild(sum);
+  box.appendChild(pre);
+  td.appendChild(box);
+}
+function sortValue(r, h){
+  let v = r[h];
+  if (h === 'player') v = String(v || '').split('/')[0];
+  else if (h === 'ping_window') v = v ? v.p50 : null;
+  else if (h === 'vantage_ping') {
+    const ms = Object.values(v || {}).filter(x => x !== null && x !== undefined);
+    v = ms.length ? Math.min(...ms) : null;
+  }
+  else if (h === 'online') return toBool(v) ? 1 : 0;
+  if (v === null || v === undefined || v === '') return null;
+  const n = Number(v);
+  return isFinite(n) ? n : String(v).toLowerCase();
+}
+function compareRows(a, b){
+  const x = sortValue(a, sortKey), y = sortValue(b, sortKey);
+  if (x === null || y === null) {
+    if (x !== y) return x === null ? 1 : -1;   // 空值总在最后
+  } else if (x !== y) {
+    const c = (typeof x === 'number' && typeof y === 'number') ? x - y : String(x).localeCompare(String(y));
+    return sortDesc ? -c : c;
+  }
+  return String(a.ip).localeCompare(String(b.ip));
+}
+function tableParts(){
+  const table = document.getElementById('tbl');
+  if (!table.tHead) {
+    const htr = table.createTHead().insertRow();
     FIXED_COLUMNS.forEach(h=>{
-      const td=document.createElement('td');
-      const val=r[h];
-
-      if (h === 'ip' && val) {
-        // 渲染为可点击链接
-        const a = document.createElement('a');
-        a.className = 'connect';
-        a.href = connectUrl(val);
-        a.textContent = val;
-        a.title = '点击后将通过 Steam 连接到 ' + val;
-        a.onclick = () => tryConnect(val);
-        td.appendChild(a);
-      } else {
-        td.textContent = renderCellText(h,val);
-      }
-
-      applyCellClass(td,h,val);
-      tr.appendChild(td);
+      const th=document.createElement('th'); th.dataset.col = h;
+      if (h === 'ping_window') th.title = '最近一小时所有样本的 min / P50 / P95 / P99';
+      if (h === 'vantage_ping') th.title = '分布式扫描：各个 worker 位置测到的延迟 (ms)';
+      th.style.cursor = 'pointer';
+      th.onclick = () => setSort(h);
+      htr.appendChild(th);
     });
-    table.appendChild(tr);
+    table.createTBody();
+  }
+  return {head: table.tHead.rows[0], body: table.tBodies[0]};
+}
+function matchesFilter(e){
+  return !filterText || e.text.includes(filterText);
+}
+/* 排序 + 过滤：只移动位置变了的行，隐藏不匹配的行 */
+function applyView(){
+  const {head, body} = tableParts();
+  for (const th of head.cells) {
+    const h = th.dataset.col;
+    th.textContent = h + (h === sortKey ? (sortDesc ? ' ▼' : ' ▲') : '');
+  }
+  const entries = [...rowMap.values()].sort((a, b)=>compareRows(a.row, b.row));
+  const empty = document.getElementById('emptyRow');
+  if (entries.length === 0) {
+    if (!empty) body.innerHTML = '<tr id="emptyRow"><td colspan="' + FIXED_COLUMNS.length + '">No data yet</td></tr>';
+    return;
+  }
+  if (empty) empty.remove();
+  let i = 0;   // 展开的详情行紧跟在它的服务器行后面
+  entries.forEach(e=>{
+    const hide = !matchesFilter(e);
+    for (const tr of (e.detail ? [e.tr, e.detail] : [e.tr])) {
+      if (tr.hidden !== hide) tr.hidden = hide;
+      if (body.children[i] !== tr) body.insertBefore(tr, body.children[i] || null);
+      i++;
+    }
   });
 }
+function setSort(h){
+  if (sortKey === h) sortDesc = !sortDesc;
+  else { sortKey = h; sortDesc = (h === 'player' || h === 'online'); }
+  applyView();
+}
+function setFilter(text){
+  filterText = String(text || '').trim().toLowerCase();
+  applyView();
+}
+/* 单行就地更新（SSE row 事件）；表里还没有这台服务器就追加到末尾，下次刷新时再归位 */
+function upsertRow(r){
+  const {body} = tableParts();
+  const e = ensureRow(r);
+  const empty = document.getElementById('emptyRow');
+  if (empty) empty.remove();
+  if (!e.tr.parentNode) body.appendChild(e.tr);
+  e.tr.hidden = !matchesFilter(e);
+  if (e.detail) e.detail.hidden = e.tr.hidden;
+}
+/* ?format=columns 的整表：每列一个数组，字符串列存字典下标，player 拆成两列整数 —— 还原成普通的行对象 */
+function decodeColumns(d){
+  const cols = d.columns, dicts = d.dicts || {}, bools = new Set(d.bools || []);
+  const names = Object.keys(cols);
+  const rows = new Array(d.n);
+  for (let i = 0; i < d.n; i++) {
+    const r = {};
+    for (const c of names) {
+      const v = cols[c][i];
+      r[c] = dicts[c] ? dicts[c][v] : (bools.has(c) ? !!v : v);
+    }
+    const cur = r.player_count, mx = r.max_players;
+    delete r.player_count; delete r.max_players;
+    r.player = (cur == null && mx == null) ? '' : (cur ?? '') + '/' + (mx ?? '');
+    rows[i] = r;
+  }
+  return rows;
+}
 async function refreshData(){
-  const d = await fetchJSON('/data');
-  document.getElementById('serverTime').textContent = d.server_time || 'n/a';
-  document.getElementById('csvMtime').textContent = d.csv_mtime || 'n/a';
-  renderTable(d.rows);
-  lastCsvMtime = d.csv_mtime || lastCsvMtime;
+  // 带上手里的版本只取变化的行；不加时间戳参数：让浏览器带 If-None-Match 重新验证，没变化时服务器回 304
+  // 整表用列式 + 压缩的格式（大列表、远程访问时小得多），增量照旧是行
+  const u = '/data?format=columns' + (dataVersion ? '&since=' + encodeURIComponent(dataVersion) : '');
+  const d = await (await fetch(u, {cache:'no-cache'})).json();
+  document.getElementById('dataTime').textContent = d.data_time || 'n/a';
+  const rows = d.format === 'columns' ? decodeColumns(d) : (d.rows || []);
+  if (!d.delta) {
+    const keep = new Set(rows.map(r=>r.ip));
+    for (const ip of [...rowMap.keys()]) if (!keep.has(ip)) removeRow(ip);
+  }
+  (d.removed || []).forEach(removeRow);
+  rows.forEach(ensureRow);
+  dataVersion = d.version || null;
+  applyView();
+  lastDataTime = d.data_time || lastDataTime;
+}
+function setScanStatus(running, ok){
+  document.getElementById('scanStatus').innerHTML = running ? 'Scanning…' :
+    (ok === true ? '<span class="status-ok">Scan OK</span>' :
+     (ok === false ? '<span class="status-bad">Scan FAILED</span>' : 'Idle'));
 }
 async function pollStatus(){
   const s = await fetchJSON('/status');
-  document.getElementById('scanStatus').innerHTML = s.running ? 'Scanning…' :
-    (s.ok === true ? '<span class="status-ok">Scan OK</span>' :
-     (s.ok === false ? '<span class="status-bad">Scan FAILED</span>' : 'Idle'));
+  setScanStatus(s.running, s.ok);
+  document.getElementById('autoRefresh').checked = !!(s.scheduler && s.scheduler.running);
   document.getElementById('stdoutTail').textContent = s.stdout_tail || '';
   document.getElementById('stderrTail').textContent = s.stderr_tail || '';
   document.getElementById('serverTime').textContent = s.server_time || 'n/a';
-  document.getElementById('csvMtime').textContent = s.csv_mtime || 'n/a';
-  if (!s.running && s.csv_mtime && lastCsvMtime && s.csv_mtime !== lastCsvMtime) {
+  document.getElementById('dataTime').textContent = s.data_time || 'n/a';
+  if (!s.running && s.data_time && s.data_time !== lastDataTime) {
     await refreshData();
   }
 }
+/* 有 EventSource 就靠推送更新，不再每秒轮询 /status */
+function connectEvents(){
+  if (!window.EventSource) return false;
+  const es = new EventSource('/events');
+  es.addEventListener('scan_start', () => setScanStatus(true, null));
+  es.addEventListener('row', e => upsertRow(JSON.parse(e.data)));
+  es.addEventListener('list_change', () => refreshData());   // 删除/改名的行以快照为准（增量里带 removed）
+  es.addEventListener('scan_done', async () => {
+    await pollStatus();   // 日志 + 状态
+    await refreshData();  // 取变化的行并按当前排序归位
+  });
+  return true;
+}
+/* 持续刷新：服务器端按每台服务器的变化快慢安排重扫，结果同样通过 SSE 推送 */
+async function toggleScheduler(on){
+  const st = await fetchJSON(on ? '/scheduler/start' : '/scheduler/stop');
+  document.getElementById('autoRefresh').checked = !!st.running;
+}
 async function startScan(){
   await fetchJSON('/start_scan'); // fire & forget
-  if (!statusTimer) statusTimer = setInterval(pollStatus, 1000);
+  if (!useEvents && !statusTimer) statusTimer = setInterval(pollStatus, 1000);
 }
 async function onLoad(){
+  useEvents = connectEvents();
   await refreshData();
   await startScan();
 }
@@ -352,11 +1187,13 @@ window.onload = onLoad;
   <h2>CS2 Zombie Escape Servers</h2>
   <div class="controls">
     <button onclick="startScan()">Scan Now</button>
+    <label><input type="checkbox" id="autoRefresh" onchange="toggleScheduler(this.checked)"> Continuous refresh</label>
+    <input type="search" id="filter" placeholder="Filter ip / name / map" oninput="setFilter(this.value)">
     <span class="info">点击表格里的 <b>ip</b> 可以直接通过 Steam 连接服务器。</span>
   </div>
   <div class="info">
     Data served at (server): <b id="serverTime">-</b><br>
-    CSV last modified: <b id="csvMtime">-</b><br>
+    Data updated: <b id="dataTime">-</b><br>
     Scan status: <span id="scanStatus">Idle</span>
   </div>
   <details>
@@ -381,7 +1218,7 @@ if __name__ == "__main__":
         for p in (preferred, fallback):
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 try:
-                    s.bind(("127.0.0.1", p))
+                    s.bind((BIND_HOST, p))
                     return p
                 except OSError:
                     continue
@@ -401,8 +1238,12 @@ if __name__ == "__main__":
     opener = threading.Timer(0.6, open_once)
     opener.start()
 
+    start_list_watcher()
+    if AUTO_SCHEDULE:
+        start_scheduler()
+
     try:
-        app.run(host="127.0.0.1", port=port, debug=False, threaded=True, use_reloader=False)
+        app.run(host=BIND_HOST, port=port, debug=False, threaded=True, use_reloader=False)
     except OSError as e:
         # 极少见的竞态：探测成功但 run 失败，切换端口再开一次
         try:
@@ -413,4 +1254,4 @@ if __name__ == "__main__":
         url = f"http://127.0.0.1:{alt}"
         print(f"[WARN] Port {port} failed: {e}. Falling back to {url}")
         threading.Timer(0.6, lambda: webbrowser.open(url)).start()
-        app.run(host="127.0.0.1", port=alt, debug=False, threaded=True, use_reloader=False)
+        app.run(host=BIND_HOST, port=alt, debug=False, threaded=True, use_reloader=False)